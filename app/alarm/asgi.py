@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alarm.settings')
+# Serve the agent endpoints with the async views when running under ASGI.
+os.environ.setdefault('ALARM_ASYNC_AGENT_API', '1')
 
 application = get_asgi_application()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,12 +44,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'api',
     'dashboard',
     'rest_framework',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -156,6 +159,134 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Agent API
+# Route the log, heartbeat, blocklist and report_ban endpoints to the async
+# views in api/async_views.py. alarm/asgi.py turns this on by default, so it
+# only needs setting to run the async views under another entry point.
+ASYNC_AGENT_API = os.environ.get('ALARM_ASYNC_AGENT_API', '0') == '1'
+# Maximum concurrent database calls, and so connections, per async worker process.
+ASYNC_AGENT_DB_CONNECTIONS = 10
+
+# Log ingestion
+# Maximum number of rows sent in a single INSERT when storing a log batch.
+LOG_INGEST_BATCH_SIZE = 1000
+# NDJSON and MessagePack bodies are decoded as they are read, this many bytes
+# at a time. Compressed JSON arrays are decoded in full, up to
+# LOG_INGEST_MAX_DECOMPRESSED_SIZE bytes.
+LOG_INGEST_READ_CHUNK_SIZE = 64 * 1024
+LOG_INGEST_MAX_DECOMPRESSED_SIZE = 50 * 1024 * 1024
+# Submissions with more records than this are rejected as a whole.
+LOG_INGEST_MAX_RECORDS = 100000
+
+# Log spool
+# With ALARM_LOG_SPOOL=1, validated log batches are appended to segment files
+# in LOG_SPOOL_DIR and acknowledged once fsynced; drain_log_spool stores them
+# in the database LOG_SPOOL_DRAIN_BATCH_SIZE entries per transaction. Each
+# worker starts a new segment once its current one exceeds
+# LOG_SPOOL_SEGMENT_SIZE bytes.
+LOG_SPOOL_ENABLED = os.environ.get('ALARM_LOG_SPOOL', '0') == '1'
+LOG_SPOOL_DIR = os.environ.get('ALARM_LOG_SPOOL_DIR', str(BASE_DIR / 'spool'))
+LOG_SPOOL_SEGMENT_SIZE = 64 * 1024 * 1024
+LOG_SPOOL_DRAIN_BATCH_SIZE = 10000
+
+# Retention
+# purge_expired archives log entries older than LOG_ENTRY_RETENTION_DAYS and
+# alerts older than ALERT_RETENTION_DAYS to ARCHIVE_DIR, as gzipped CSV files
+# partitioned by day, and deletes them PURGE_BATCH_SIZE rows per transaction.
+# Login counts stay in the rollups. rehydrate_archive restores archived days
+# and keeps them for REHYDRATE_HOLD_DAYS before they are purged again. A
+# retention of 0 keeps rows forever.
+LOG_ENTRY_RETENTION_DAYS = int(os.environ.get('ALARM_LOG_RETENTION_DAYS', '30'))
+ALERT_RETENTION_DAYS = int(os.environ.get('ALARM_ALERT_RETENTION_DAYS', '14'))
+ARCHIVE_DIR = os.environ.get('ALARM_ARCHIVE_DIR', str(BASE_DIR / 'archive'))
+PURGE_BATCH_SIZE = 10000
+REHYDRATE_HOLD_DAYS = 7
+
+# Brute-force detection
+# A source IP is banned once it reaches BRUTE_FORCE_THRESHOLD of the actions
+# in BRUTE_FORCE_ACTIONS within BRUTE_FORCE_WINDOW. sshd logs one bad attempt
+# as several lines ("Invalid user", the PAM "Authentication failure" and
+# "Failed password"), so only the line logged once per attempt is counted.
+BRUTE_FORCE_WINDOW = timedelta(minutes=1)
+BRUTE_FORCE_THRESHOLD = 5
+BRUTE_FORCE_ACTIONS = ('Failed password', 'Failed publickey')
+
+# Dashboard
+# Seconds a computed dashboard snapshot is served before it is rebuilt.
+DASHBOARD_SNAPSHOT_TTL = 30
+
+# Devices
+# A device is Healthy if it checked in within DEVICE_HEALTHY_SECONDS,
+# Degraded if within DEVICE_OFFLINE_SECONDS, and Offline otherwise.
+DEVICE_HEALTHY_SECONDS = 300
+DEVICE_OFFLINE_SECONDS = 3600
+
+# Live feed
+# Under ASGI, /dashboard/live/ streams new log entries, alerts, ban changes
+# and device status changes to open dashboard pages. Each worker polls the
+# database every LIVE_FEED_POLL_INTERVAL seconds while anyone is connected,
+# however many browsers are. Streams end after LIVE_FEED_MAX_AGE seconds and
+# browsers reconnect LIVE_FEED_RETRY_MS later; a browser more than
+# LIVE_FEED_QUEUE_SIZE events behind is told to reload instead.
+LIVE_FEED_POLL_INTERVAL = 2
+LIVE_FEED_MAX_ROWS = 15
+LIVE_FEED_QUEUE_SIZE = 100
+LIVE_FEED_KEEPALIVE = 15
+LIVE_FEED_MAX_AGE = 300
+LIVE_FEED_RETRY_MS = 3000
+
+# Device authentication
+# Verified agent tokens are cached per worker so that authenticating a request
+# needs no database query. Entries are dropped when the token expires, when
+# the device is deregistered, or after DEVICE_AUTH_CACHE_TTL seconds.
+DEVICE_AUTH_CACHE_SIZE = 10000
+DEVICE_AUTH_CACHE_TTL = 300
+
+# Blocklist
+# Seconds each worker serves its encoded blocklist before checking whether
+# another worker has changed it.
+BLOCKLIST_VERSION_CHECK_INTERVAL = 1
+# ?cidr=1 serves the ban set as the fewest CIDR blocks that cover it.
+# BLOCKLIST_AGGREGATION_POLICY also collapses dense ranges into one block:
+# per IP version, (prefix length, minimum banned addresses) rules, e.g.
+# {4: [(24, 32)], 6: [(64, 2)]} bans a whole /24 once 32 of its addresses
+# are banned. Ranges containing an unbanned address are never collapsed.
+# Every ban keeps its own row, so the default exact list and the dashboard
+# still show addresses inside a collapsed range. Empty serves the exact ban set.
+BLOCKLIST_AGGREGATION_POLICY = {}
+
+# Heartbeats
+# Device check-ins are buffered per worker and written as one bulk UPDATE
+# every HEARTBEAT_FLUSH_INTERVAL seconds, which should stay well below the
+# agents' heartbeat period.
+HEARTBEAT_FLUSH_INTERVAL = 15
+HEARTBEAT_BUFFER_SIZE = 5000
+HEARTBEAT_FLUSH_BATCH_SIZE = 1000
+
+# Alerts
+# Alerts are buffered per worker and written in bulk once ALERT_BUFFER_SIZE
+# distinct alerts are pending or ALERT_FLUSH_INTERVAL seconds have passed.
+# ALERT_SAMPLE_RATES keeps the given fraction of alerts per severity; 0 drops
+# that severity entirely. Repeats of an alert are stored as one row listing up
+# to ALERT_COALESCE_MESSAGES distinct messages.
+ALERT_FLUSH_INTERVAL = 5
+ALERT_BUFFER_SIZE = 500
+ALERT_COALESCE_MESSAGES = 50
+ALERT_SAMPLE_RATES = {
+    'INFO': 1.0,
+    'WARNING': 1.0,
+    'ERROR': 1.0,
+    'CRITICAL': 1.0,
+}
+
+# Metrics
+# Each worker process keeps its metrics in memory and writes them to
+# METRICS_DIR at most every METRICS_WRITE_INTERVAL seconds; /metrics adds up
+# the files of every process, so values from other workers can be that many
+# seconds old. The directory must be shared by all workers on the host.
+METRICS_DIR = os.environ.get('ALARM_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'alarm-metrics'))
+METRICS_WRITE_INTERVAL = 5
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -16,12 +16,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import include, path
+from api.views import metrics_view
 from dashboard.views import dashboard_home, get_script
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('dashboard/', include('dashboard.urls')),
+    path('metrics', metrics_view, name='metrics'),
     path("install.sh", get_script, {"script_type": "install"}, name="install_script"),
     path("uninstall.sh", get_script, {"script_type": "uninstall"}, name="uninstall_script"),
     path('', dashboard_home, name='dashboard-home'),
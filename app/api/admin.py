@@ -1,9 +1,58 @@
 from django.contrib import admin
-from .models import LogEntry, ManagedDevice, InstallToken, Alert, SystemScript, BlockedIP
+from .blocklist import ban_ip, set_ban_state
+from .models import LogEntry, ManagedDevice, InstallToken, Alert, SystemScript, BlockedIP, HourlyLogCount, DailyLogCount, BlocklistChange
 
 admin.site.register(LogEntry)
 admin.site.register(ManagedDevice)
 admin.site.register(InstallToken)
 admin.site.register(Alert)
 admin.site.register(SystemScript)
-admin.site.register(BlockedIP)
\ No newline at end of file
+admin.site.register(HourlyLogCount)
+admin.site.register(DailyLogCount)
+
+
+@admin.register(BlockedIP)
+class BlockedIPAdmin(admin.ModelAdmin):
+    """
+    Bans and unbans through ban_ip and set_ban_state, so every change gets a
+    blocklist version that delta sync and the per-worker snapshots pick up.
+    """
+    list_display = ('ip_address', 'currently_banned', 'banned_at', 'reason')
+    list_filter = ('currently_banned',)
+    search_fields = ('ip_address',)
+
+    def get_readonly_fields(self, request, obj=None):
+        # A new address would need an unban of the old one and a ban of the new one.
+        return ('ip_address', 'banned_at') if obj else ('banned_at',)
+
+    def has_delete_permission(self, request, obj=None):
+        # A deleted row leaves agents that sync by version banning it forever; unban it instead.
+        return False
+
+    def save_model(self, request, obj, form, change):
+        banned = obj.currently_banned
+        if change:
+            other_fields = [field for field in form.changed_data if field != 'currently_banned']
+            if other_fields:
+                obj.save(update_fields=other_fields)
+        else:
+            blocked_ip, _, _ = ban_ip(obj.ip_address, obj.reason)
+            obj.pk = blocked_ip.pk
+            obj._state.adding = False
+        set_ban_state(obj, banned)
+        obj.refresh_from_db()
+
+
+@admin.register(BlocklistChange)
+class BlocklistChangeAdmin(admin.ModelAdmin):
+    """The blocklist history is only written by ban_ip and set_ban_state."""
+    list_display = ('id', 'ip_address', 'banned', 'changed_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
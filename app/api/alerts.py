@@ -0,0 +1,65 @@
+import random
+
+from django.conf import settings
+from django.utils.timezone import now
+
+from .buffers import WriteBehindBuffer
+from .models import Alert
+
+
+class AlertSink(WriteBehindBuffer):
+    """
+    Buffers alerts and writes them with one bulk INSERT per flush.
+
+    Alerts with the same title and severity raised between two flushes are
+    coalesced into a single row whose count is the number of occurrences.
+    The row's message lists the distinct messages, one per line, up to
+    max_messages of them, followed by how many occurrences were left out.
+    Each severity can be sampled with sample_rates, where a rate of 0 drops
+    the severity entirely.
+    """
+
+    def __init__(self, flush_interval, max_size, sample_rates=None, max_messages=50):
+        super().__init__(flush_interval, max_size)
+        self.sample_rates = sample_rates or {}
+        self.max_messages = max_messages
+
+    def emit(self, title, message, severity='INFO'):
+        rate = self.sample_rates.get(severity, 1.0)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return
+        self.put((title, severity), (message, now()))
+
+    def add(self, pending, key, value):
+        message, created_at = value
+        entry = pending.get(key)
+        if entry is None:
+            # [distinct messages, first seen, occurrences, occurrences not listed]
+            pending[key] = [[message], created_at, 1, 0]
+            return
+        entry[2] += 1
+        if message not in entry[0]:
+            if len(entry[0]) < self.max_messages:
+                entry[0].append(message)
+            else:
+                entry[3] += 1
+
+    def write(self, items):
+        Alert.objects.bulk_create([
+            Alert(title=title, severity=severity, message=self._message(messages, omitted), created_at=first_seen, count=count)
+            for (title, severity), (messages, first_seen, count, omitted) in items.items()
+        ])
+
+    @staticmethod
+    def _message(messages, omitted):
+        if omitted:
+            messages = messages + [f"… and {omitted} more"]
+        return "\n".join(messages)
+
+
+alert_sink = AlertSink(
+    flush_interval=settings.ALERT_FLUSH_INTERVAL,
+    max_size=settings.ALERT_BUFFER_SIZE,
+    sample_rates=settings.ALERT_SAMPLE_RATES,
+    max_messages=settings.ALERT_COALESCE_MESSAGES,
+)
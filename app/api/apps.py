@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.core.signals import request_finished
+        from django.db.backends.signals import connection_created
+        from .buffers import flush_buffers_if_due
+        from .metrics import install_query_counter, write_snapshot_if_due
+        request_finished.connect(flush_buffers_if_due, dispatch_uid='api.flush_buffers')
+        request_finished.connect(write_snapshot_if_due, dispatch_uid='api.write_metrics')
+        connection_created.connect(install_query_counter, dispatch_uid='api.count_queries')
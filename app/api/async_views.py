@@ -0,0 +1,202 @@
+"""
+Async versions of the agent-facing endpoints, served when ASYNC_AGENT_API is on.
+
+They return the same responses as the DRF views in views.py. Work that
+only touches memory (cached authentication, the heartbeat buffer, the
+encoded blocklist, alert buffering) runs on the event loop; database writes
+that need a transaction are handed to a worker thread with sync_to_async.
+
+Each of those threads holds its own database connection, so the number of
+concurrent database calls per process is capped at
+ASYNC_AGENT_DB_CONNECTIONS to keep a burst of agents from exhausting
+Postgres' connection limit.
+"""
+import asyncio
+import json
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+
+from . import metrics
+from .authentication import DeviceTokenAuthentication
+from .blocklist import ban_ip, blocklist_snapshot, get_blocklist_changes
+from .heartbeats import heartbeat_buffer
+from .ingest import InvalidLogData, ingest_log_records
+from .spool import spool_log_records
+from .parsers import CompressedJSONParser, MessagePackParser, NDJSONParser
+from .utils import get_client_ip, log_alert
+from .views import encoded_blocklist_response
+
+
+def async_csrf_exempt(view):
+    """csrf_exempt for async views; Django 4.2's decorator wraps them in a sync function."""
+    view.csrf_exempt = True
+    return view
+
+
+LOG_PARSERS = {parser.media_type: parser for parser in (CompressedJSONParser(), NDJSONParser(), MessagePackParser())}
+
+# Connection slots per event loop. Before Python 3.10 a semaphore binds to the
+# loop current when it is created, so each is created on the loop that uses it.
+_database_slots = weakref.WeakKeyDictionary()
+
+
+def database_slots():
+    """Returns the semaphore limiting database threads on the running event loop."""
+    loop = asyncio.get_running_loop()
+    slots = _database_slots.get(loop)
+    if slots is None:
+        slots = _database_slots[loop] = asyncio.Semaphore(settings.ASYNC_AGENT_DB_CONNECTIONS)
+    return slots
+
+
+def _call_and_release_connection(func, *args):
+    try:
+        return func(*args)
+    finally:
+        # Release this thread's connection, unless the caller's transaction
+        # (e.g. a test case) still needs it.
+        if not connection.in_atomic_block:
+            close_old_connections()
+
+
+async def run_in_database(func, *args):
+    """Runs a synchronous database function in a worker thread once a connection slot is free."""
+    async with database_slots():
+        return await sync_to_async(_call_and_release_connection)(func, *args)
+
+
+async def authenticate_device(request):
+    """Returns (device, None) for a valid access token, or (None, error response)."""
+    authentication = DeviceTokenAuthentication()
+    try:
+        try:
+            device, _ = authentication.authenticate_from_cache(request)
+        except LookupError:
+            device, _ = await run_in_database(authentication.authenticate, request)
+    except APIException as e:
+        return None, JsonResponse(e.detail, status=e.status_code)
+    return device, None
+
+
+def parse_records(request):
+    """Returns the submitted records, decoded lazily for NDJSON and MessagePack bodies."""
+    parser = LOG_PARSERS.get(request.content_type)
+    if parser is None:
+        raise ParseError(f"Unsupported media type '{request.content_type}'.")
+    data = parser.parse(request, request.content_type, {'request': request})
+    return [data] if isinstance(data, dict) else data
+
+
+@async_csrf_exempt
+async def log_view(request):
+    """Handles log submissions from managed devices."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    device, error = await authenticate_device(request)
+    if error:
+        return error
+
+    try:
+        records = parse_records(request)
+        if settings.LOG_SPOOL_ENABLED:
+            queued = await sync_to_async(spool_log_records)(records, get_client_ip(request))
+        else:
+            created, _ = await run_in_database(ingest_log_records, records, get_client_ip(request))
+    except (InvalidLogData, ParseError) as e:
+        message = e.detail if isinstance(e, ParseError) else str(e)
+        metrics.LOG_BATCHES_REJECTED.inc('invalid')
+        log_alert("Invalid Log Data", message, severity='ERROR')
+        return JsonResponse({"error": message}, status=status.HTTP_400_BAD_REQUEST)
+    except APIException as e:
+        metrics.LOG_BATCHES_REJECTED.inc('invalid')
+        return JsonResponse({"error": e.detail}, status=e.status_code)
+    except Exception as e:
+        metrics.LOG_BATCHES_REJECTED.inc('error')
+        log_alert("Log Creation Failed", str(e), severity='ERROR')
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if settings.LOG_SPOOL_ENABLED:
+        log_alert("Log Entries Queued", f"{queued} log entries queued for device {device.hostname}.", severity='INFO')
+        return JsonResponse({"status": "Log entries queued"}, status=status.HTTP_202_ACCEPTED)
+
+    log_alert("Log Entries Created", f"{created} log entries created for device {device.hostname}.", severity='INFO')
+    return JsonResponse({"status": "Log entries created"}, status=status.HTTP_201_CREATED)
+
+
+@async_csrf_exempt
+async def heartbeat_view(request):
+    """Receives heartbeat from a device and updates its check-in time."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    device, error = await authenticate_device(request)
+    if error:
+        return error
+
+    heartbeat_buffer.put(device.pk, now())
+    log_alert("Heartbeat Received", f"Heartbeat received from device {device.hostname}.", severity='INFO')
+    return JsonResponse({"message": "Heartbeat received."}, status=status.HTTP_200_OK)
+
+
+async def blocklist_view(request):
+    """Returns the blocklist, the changes since ?since=<version>, or its CIDR blocks with ?cidr=1."""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    since = request.GET.get("since")
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return JsonResponse({"error": "since must be an integer blocklist version."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        cidr = request.GET.get("cidr") == "1"
+        if cidr:
+            snapshot = await run_in_database(blocklist_snapshot.get_aggregated)
+        else:
+            snapshot = await blocklist_snapshot.aget()
+        if since == snapshot.version or request.headers.get("If-None-Match") == snapshot.etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response["ETag"] = snapshot.etag
+            return response
+
+        if since is not None and 0 <= since < snapshot.version and not cidr:
+            added, removed = await run_in_database(get_blocklist_changes, since, snapshot.version)
+            data = {"version": snapshot.version, "since": since, "added": added, "removed": removed}
+            response = JsonResponse(data, status=status.HTTP_200_OK)
+            response["ETag"] = snapshot.etag
+            return response
+
+        return encoded_blocklist_response(request, snapshot)
+    except Exception as e:
+        log_alert("Error getting blocklist", f"{str(e)}", severity='ERROR')
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_csrf_exempt
+async def report_ban_view(request):
+    """Receives a report of a newly banned IP from a device."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        data = json.loads(request.body or b"{}")
+        ip = data.get("ip")
+        reason = data.get("reason", "No reason provided")
+
+        if not ip:
+            log_alert("Error blocking IP", "IP address is required", severity='WARNING')
+            return JsonResponse({"error": "IP address is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        blocked_ip, _, _ = await run_in_database(ban_ip, ip, reason)
+
+        log_alert("IP Blocked", f"{blocked_ip} has been blocked.")
+        return JsonResponse({"status": "IP added to blocklist"}, status=status.HTTP_201_CREATED)
+    except Exception as e:
+        log_alert("Error blocking IP", f"{str(e)}", severity='ERROR')
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import jwt
+from django.conf import settings
+from rest_framework import exceptions, status
+from rest_framework.authentication import BaseAuthentication
+
+from .models import ManagedDevice
+from .utils import log_alert, verify_token
+
+CachedDevice = namedtuple('CachedDevice', ['id', 'unique_id', 'hostname', 'expires_at'])
+
+
+class MissingDeviceToken(exceptions.AuthenticationFailed):
+    default_detail = {"error": "Authorization header with Bearer token is required."}
+
+
+class InvalidDeviceToken(exceptions.APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_code = 'invalid_token'
+
+
+class DeviceNotFound(exceptions.APIException):
+    status_code = status.HTTP_404_NOT_FOUND
+    default_detail = {"error": "Device not found."}
+    default_code = 'device_not_found'
+
+
+class DeviceTokenCache:
+    """
+    Bounded LRU cache from a (token type, bearer token) key to the device it authenticates.
+
+    Entries expire with the token, or after ttl seconds so that a
+    deregistration handled by another worker is picked up.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tokens_by_device = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the CachedDevice for a token key, or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, device, token_expiry):
+        """Caches a successful authentication until the key expires or the TTL passes."""
+        entry = CachedDevice(device.id, device.unique_id, device.hostname, min(token_expiry, time.time() + self.ttl))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._tokens_by_device.setdefault(device.id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_device(self, device_id):
+        """Drops every cached key for a device, e.g. when it is deregistered."""
+        with self._lock:
+            for key in self._tokens_by_device.pop(device_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_device.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        tokens = self._tokens_by_device.get(entry.id)
+        if tokens is not None:
+            tokens.discard(key)
+            if not tokens:
+                del self._tokens_by_device[entry.id]
+
+
+device_token_cache = DeviceTokenCache(
+    max_size=settings.DEVICE_AUTH_CACHE_SIZE,
+    ttl=settings.DEVICE_AUTH_CACHE_TTL,
+)
+
+
+class DeviceTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates a managed device from its Bearer access token.
+
+    On success request.user is the ManagedDevice. A cache hit is served
+    without touching the database, in which case the device instance only
+    has its id, unique_id and hostname loaded.
+    """
+    token_type = 'access'
+
+    def authenticate(self, request):
+        token, cached = self._check_cache(request)
+        if cached is not None:
+            return cached, token
+
+        try:
+            decoded_token = verify_token(token, token_type=self.token_type)
+        except jwt.InvalidTokenError as e:
+            log_alert("Authorization Error", f"{request.path}: {e}", severity='ERROR')
+            raise InvalidDeviceToken({"error": str(e)})
+
+        try:
+            device = ManagedDevice.objects.only('id', 'unique_id', 'hostname').get(unique_id=decoded_token.get('unique_id'))
+        except ManagedDevice.DoesNotExist:
+            log_alert("Authorization Failed", f"{request.path}: Device not found.", severity='WARNING')
+            raise DeviceNotFound()
+
+        device_token_cache.set((self.token_type, token), device, decoded_token.get('exp', time.time()))
+        return device, token
+
+    def authenticate_from_cache(self, request):
+        """
+        Authenticates from the token cache only, for async callers.
+
+        Raises LookupError on a cache miss; the caller should then run
+        authenticate in a thread.
+        """
+        token, cached = self._check_cache(request)
+        if cached is None:
+            raise LookupError(token)
+        return cached, token
+
+    def _check_cache(self, request):
+        """Returns the bearer token and the cached device for it, if any."""
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            log_alert("Authorization Failed", f"{request.path}: Authorization header with Bearer token is required.", severity='ERROR')
+            raise MissingDeviceToken()
+
+        token = auth_header.split(' ')[1]
+        cached = device_token_cache.get((self.token_type, token))
+        if cached is None:
+            return token, None
+        return token, ManagedDevice(id=cached.id, unique_id=cached.unique_id, hostname=cached.hostname)
+
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+
+class DeviceRefreshTokenAuthentication(DeviceTokenAuthentication):
+    """Authenticates a managed device from its Bearer refresh token."""
+    token_type = 'refresh'
@@ -0,0 +1,436 @@
+"""
+Reproducible benchmarks of ALARM's hot paths, run by the run_benchmarks command.
+
+seed_database fills a database with a deterministic synthetic data set
+(every row is a function of its index), so two runs at the same scale
+measure the same work. Each benchmark times a number of repeats after a
+warm-up call and reports summary statistics in milliseconds; the results
+are plain dicts so that they can be written as JSON and compared with
+compare_results.
+"""
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import timedelta
+
+import django
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.test import APIRequestFactory
+
+from dashboard import views as dashboard_views
+from dashboard.pagination import NEXT, encode_cursor
+from .blocklist import blocklist_snapshot
+from .buffers import clear_buffers
+from .detection import detector
+from .ingest import detect_brute_force
+from .models import (
+    Alert, BlockedIP, BlocklistChange, DailyLogCount, HourlyLogCount, LogEntry, ManagedDevice,
+)
+from .rollups import floor_hour, rebuild_rollups
+from .utils import generate_device_tokens
+from .views import GetBlocklistView, LogView
+
+SCALES = {'1m': 1_000_000, '10m': 10_000_000, '50m': 50_000_000}
+
+SEED_CHUNK_SIZE = 1_000_000
+SEED_HOSTS = 1000
+SEED_DAYS = 30
+SEED_BAN_REASON = 'Benchmark seed'
+
+# Traffic generated while benchmarking comes from 198.18.0.0/15 (RFC 2544),
+# which the seed data never uses, so it can be removed afterwards.
+BENCH_NETWORK_FIRST = '198.18.0.0'
+BENCH_NETWORK_LAST = '198.19.255.255'
+BENCH_HOST = 'bench-host'
+
+SEARCH_QUERIES = ('10.1.', '10.1.2.3', 'host-42', 'failed', 'host:host-7')
+
+
+def parse_scale(value):
+    """Returns the number of LogEntry rows for a scale name (1m, 10m, 50m) or a plain number."""
+    value = str(value).lower().replace('_', '')
+    if value in SCALES:
+        return SCALES[value]
+    return int(value)
+
+
+def summarize(samples):
+    """
+    Summary statistics of a list of timings in milliseconds.
+
+    :return: Dict with n, min, median, mean, p95, max and stdev, rounded to microseconds
+    """
+    ordered = sorted(samples)
+    p95 = statistics.quantiles(ordered, n=20, method='inclusive')[18] if len(ordered) > 1 else ordered[0]
+    stats = {
+        'n': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.fmean(ordered),
+        'p95': p95,
+        'max': ordered[-1],
+        'stdev': statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+    }
+    return {key: value if key == 'n' else round(value, 3) for key, value in stats.items()}
+
+
+def measure(run, repeat, warmup=1, setup=None):
+    """
+    Times run() repeat times after warmup untimed calls.
+
+    :param setup: Called before every call, outside the timing, e.g. to clear a cache
+    :return: (summary of the timings in ms, number of queries of the last call, last return value)
+    """
+    result = None
+    for _ in range(warmup):
+        if setup:
+            setup()
+        result = run()
+
+    samples = []
+    queries = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            result = run()
+            samples.append((time.perf_counter() - started) * 1000)
+        queries = len(captured)
+    return summarize(samples), queries, result
+
+
+def _execute(sql, params=None):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _analyze(*models):
+    for model in models:
+        _execute(f"ANALYZE {model._meta.db_table}")
+
+
+def seed_database(log_entries, stdout=None, seed_time=None):
+    """
+    Fills empty LogEntry, Alert and ManagedDevice tables and the rollups with synthetic data.
+
+    Log entries are spread evenly over the SEED_DAYS days before seed_time,
+    from 1,000 hosts: 70% failed and 25% accepted passwords from a skewed set
+    of 10.0.0.0/8 addresses, the rest unrecognised. Rows are inserted by the
+    database in chunks of SEED_CHUNK_SIZE, each in its own transaction.
+    """
+    end = floor_hour(seed_time or now())
+    start = end - timedelta(days=SEED_DAYS)
+    step = (end - start) / max(log_entries, 1)
+
+    for first in range(1, log_entries + 1, SEED_CHUNK_SIZE):
+        last = min(first + SEED_CHUNK_SIZE - 1, log_entries)
+        with transaction.atomic():
+            _execute(
+                f"""
+                INSERT INTO {LogEntry._meta.db_table} (timestamp, source_ip, action, source, host)
+                SELECT %s - i * %s,
+                       ('10.' || (i * 7) %% 250 || '.' || (i / 250) %% 250 || '.' || (i * i) %% 7 + 1)::inet,
+                       CASE WHEN i %% 20 < 14 THEN 'Failed password'
+                            WHEN i %% 20 < 19 THEN 'Accepted password' ELSE 'Unknown' END,
+                       'vector',
+                       'host-' || (i * 31) %% {SEED_HOSTS}
+                FROM generate_series(%s::bigint, %s::bigint) AS i
+                """,
+                [end, step, first, last],
+            )
+        if stdout:
+            stdout.write(f"  log entries: {last:,} / {log_entries:,}")
+
+    alerts = max(log_entries // 100, 1)
+    _execute(
+        f"""
+        INSERT INTO {Alert._meta.db_table} (title, message, severity, created_at, is_read, count)
+        SELECT 'Alert ' || i %% 20, 'Seeded alert ' || i || ' for host-' || i %% {SEED_HOSTS},
+               CASE WHEN i %% 50 = 0 THEN 'CRITICAL' WHEN i %% 10 = 0 THEN 'WARNING' ELSE 'INFO' END,
+               %s - i * %s, false, 1
+        FROM generate_series(1, %s) AS i
+        """,
+        [end, (end - start) / alerts, alerts],
+    )
+    _execute(
+        f"""
+        INSERT INTO {ManagedDevice._meta.db_table} (unique_id, hostname, ip_address, os, last_check_in, status)
+        SELECT 'bench-seed-' || i, 'host-' || i, ('10.255.' || i / 256 || '.' || i %% 256)::inet,
+               CASE WHEN i %% 3 = 0 THEN 'Debian 12' ELSE 'Ubuntu 22.04' END,
+               %s - (i %% 120) * interval '1 minute', 'Healthy'
+        FROM generate_series(0, {SEED_HOSTS - 1}) AS i
+        """,
+        [end],
+    )
+    if stdout:
+        stdout.write("  rebuilding rollups...")
+    rebuild_rollups(start, end + timedelta(days=1))
+    _analyze(LogEntry, Alert, ManagedDevice, HourlyLogCount, DailyLogCount)
+
+
+def reset_database():
+    """Empties every table seed_database and the benchmarks write to."""
+    tables = [model._meta.db_table for model in (
+        LogEntry, Alert, ManagedDevice, HourlyLogCount, DailyLogCount, BlockedIP, BlocklistChange,
+    )]
+    _execute(f"TRUNCATE {', '.join(tables)}")
+
+
+def set_seeded_bans(count):
+    """
+    Makes exactly count seeded BlockedIP rows exist (1 in 20 of them unbanned), and moves the blocklist version.
+    """
+    table = BlockedIP._meta.db_table
+    with transaction.atomic():
+        _execute(
+            f"DELETE FROM {table} WHERE reason = %s AND ip_address >= ('172.16.0.0'::inet + %s)",
+            [SEED_BAN_REASON, count],
+        )
+        existing = BlockedIP.objects.filter(reason=SEED_BAN_REASON).count()
+        _execute(
+            f"""
+            INSERT INTO {table} (ip_address, banned_at, reason, currently_banned)
+            SELECT '172.16.0.0'::inet + i, %s - i * interval '1 second', %s, i %% 20 <> 0
+            FROM generate_series(%s, %s) AS i
+            """,
+            [now(), SEED_BAN_REASON, existing, count - 1],
+        )
+        BlocklistChange.objects.create(ip_address='172.16.0.0', banned=True)
+    _analyze(BlockedIP)
+    blocklist_snapshot.clear()
+
+
+def remove_benchmark_traffic():
+    """Deletes the log entries, rollups and bans created while benchmarking."""
+    in_range = {'source_ip__gte': BENCH_NETWORK_FIRST, 'source_ip__lte': BENCH_NETWORK_LAST}
+    LogEntry.objects.filter(**in_range).delete()
+    for model in (HourlyLogCount, DailyLogCount):
+        model.objects.filter(**in_range).delete()
+    BlockedIP.objects.filter(ip_address__gte=BENCH_NETWORK_FIRST, ip_address__lte=BENCH_NETWORK_LAST).delete()
+    blocklist_snapshot.clear()
+    clear_buffers()
+
+
+def _bench_address(rng, second_half=False):
+    return f"198.{19 if second_half else 18}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+
+
+def _ingest_payload(rng, batch_size):
+    timestamp = now().isoformat()
+    return [
+        {
+            'message': (
+                f"Failed password for root from {_bench_address(rng)} port {rng.randint(1024, 65535)} ssh2"
+                if rng.random() < 0.7 else
+                f"Accepted password for deploy from {_bench_address(rng)} port {rng.randint(1024, 65535)} ssh2"
+            ),
+            'timestamp': timestamp,
+            'host': BENCH_HOST,
+        }
+        for _ in range(batch_size)
+    ]
+
+
+def bench_ingest(batch_sizes, repeat, rng):
+    """LogView throughput for each batch size, through the full request path with a device token."""
+    device = ManagedDevice.objects.create(
+        unique_id=f"bench-ingest-{rng.random()}", hostname=BENCH_HOST, ip_address='127.0.0.1', os='Benchmark'
+    )
+    token = generate_device_tokens(device.unique_id)['access']
+    factory = APIRequestFactory()
+    view = LogView.as_view()
+    results = {}
+    try:
+        for batch_size in batch_sizes:
+            payloads = [json.dumps(_ingest_payload(rng, batch_size)) for _ in range(repeat + 1)]
+
+            def run():
+                request = factory.post(
+                    '/api/logs/', payloads.pop(), content_type='application/json',
+                    HTTP_AUTHORIZATION=f'Bearer {token}',
+                )
+                response = view(request)
+                assert response.status_code in (201, 202), response.data
+                return response
+
+            stats, queries, _ = measure(run, repeat)
+            stats['entries_per_second'] = round(batch_size / (stats['median'] / 1000), 1)
+            stats['queries'] = queries
+            results[f'ingest[batch={batch_size}]'] = stats
+    finally:
+        device.delete()
+    return results
+
+
+def bench_detection(repeat, rng):
+    """detect_brute_force, as ingest calls it, with a batch of failed logins from 200 addresses in the last minute."""
+    current_time = now()
+    attackers = [_bench_address(rng, second_half=True) for _ in range(200)]
+    failures = [
+        (ip, current_time - timedelta(seconds=rng.randint(0, 30)))
+        for ip in attackers for _ in range(10)
+    ]
+    detector.reset()
+    try:
+        # The warm-up call bans the attackers; the timed calls measure steady-state detection.
+        stats, queries, _ = measure(lambda: detect_brute_force(failures), repeat)
+    finally:
+        detector.reset()
+    stats['queries'] = queries
+    return {'detect_brute_force': stats}
+
+
+def _render(view, path, params=None):
+    request = RequestFactory().get(path, params or {})
+
+    def run():
+        response = view(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    return run
+
+
+def bench_dashboard(repeat):
+    """dashboard_home render time, with the snapshot rebuilt (cold) and cached (warm)."""
+    results = {}
+    for label, setup in (('cold', cache.clear), ('warm', None)):
+        stats, queries, _ = measure(_render(dashboard_views.dashboard_home, '/dashboard/'), repeat, setup=setup)
+        stats['queries'] = queries
+        results[f'dashboard_home[{label}]'] = stats
+    return results
+
+
+def _deep_cursor(queryset, field):
+    """A cursor into the middle of a list, found by seeking on field rather than counting rows."""
+    bounds = queryset.order_by(field).values_list(field, flat=True)
+    oldest, newest = bounds.first(), bounds.last()
+    if oldest is None:
+        return None
+    middle = queryset.filter(**{f'{field}__lte': oldest + (newest - oldest) / 2}).order_by(f'-{field}', '-id').first()
+    return encode_cursor(NEXT, (getattr(middle, field).isoformat(), middle.pk))
+
+
+def bench_lists(repeat):
+    """First page, a page halfway back, and searches of each dashboard list."""
+    cases = [
+        ('login_attempt_list', dashboard_views.login_attempt_list, '/dashboard/login-attempts/',
+         LogEntry.objects.all(), 'timestamp'),
+        ('alerts', dashboard_views.alerts_view, '/dashboard/alerts/', Alert.objects.all(), 'created_at'),
+        ('blocked_ips', dashboard_views.blocked_ips, '/dashboard/blocked-ips/', BlockedIP.objects.all(), 'banned_at'),
+    ]
+    results = {}
+    for name, view, path, queryset, field in cases:
+        pages = [('first_page', {}), ('deep_page', {'cursor': _deep_cursor(queryset, field)})]
+        searches = SEARCH_QUERIES if name == 'login_attempt_list' else (('seeded 42', 'banned') if name == 'alerts' else ('172.16.1.', '172.16.0.0/20'))
+        pages += [(f'search[{query}]', {'q': query}) for query in searches]
+        for label, params in pages:
+            stats, queries, _ = measure(_render(view, path, params), repeat)
+            stats['queries'] = queries
+            results[f'{name}[{label}]'] = stats
+
+    stats, queries, _ = measure(_render(dashboard_views.managed_devices, '/dashboard/managed-devices/'), repeat)
+    stats['queries'] = queries
+    results['managed_devices[first_page]'] = stats
+    return results
+
+
+def bench_blocklist(ban_counts, repeat):
+    """GetBlocklistView for each ban count: full list rebuilt (cold), served from the snapshot (warm), and as CIDR blocks."""
+    factory = APIRequestFactory()
+    view = GetBlocklistView.as_view()
+    results = {}
+    for count in ban_counts:
+        set_seeded_bans(count)
+        for label, params, setup in (
+            ('cold', {}, blocklist_snapshot.clear),
+            ('warm', {}, None),
+            ('cidr_cold', {'cidr': '1'}, blocklist_snapshot.clear),
+        ):
+            def run(params=params):
+                return view(factory.get('/api/blocklist/', params, HTTP_ACCEPT_ENCODING='gzip'))
+
+            stats, queries, response = measure(run, repeat, setup=setup)
+            stats['queries'] = queries
+            stats['response_bytes'] = len(response.content)
+            results[f'blocklist[bans={count},{label}]'] = stats
+    return results
+
+
+def environment():
+    """Describes the run, so results from different machines or commits are not compared unknowingly."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT version()" if connection.vendor == 'postgresql' else "SELECT 1")
+        database = cursor.fetchone()[0]
+    return {
+        'started_at': now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': database,
+        'machine': platform.platform(),
+        'log_entries': LogEntry.objects.count(),
+    }
+
+
+def run_suite(batch_sizes, ban_counts, repeat, seed=42, benchmarks=None, stdout=None):
+    """
+    Runs the selected benchmarks (all by default) against the current database.
+
+    :return: Dict with 'environment' and 'results', suitable for JSON
+    """
+    rng = random.Random(seed)
+    suites = {
+        'blocklist': lambda: bench_blocklist(ban_counts, repeat),
+        'dashboard': lambda: bench_dashboard(repeat),
+        'lists': lambda: bench_lists(repeat),
+        'detection': lambda: bench_detection(repeat, rng),
+        'ingest': lambda: bench_ingest(batch_sizes, repeat, rng),
+    }
+    report = {'environment': environment(), 'results': {}}
+    try:
+        for name, suite in suites.items():
+            if benchmarks and name not in benchmarks:
+                continue
+            if stdout:
+                stdout.write(f"Running {name} benchmarks...")
+            report['results'].update(suite())
+    finally:
+        remove_benchmark_traffic()
+    return report
+
+
+def compare_results(baseline, current, threshold):
+    """
+    Compares the medians of two reports.
+
+    A benchmark regresses if its median time grew by more than threshold
+    percent and its fastest run is slower than the baseline's p95, so noise
+    in a single slow repeat is not reported. Benchmarks missing from either
+    report are skipped.
+
+    :return: List of (name, baseline median, current median, change in percent, regressed)
+    """
+    rows = []
+    for name, stats in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None or not before['median']:
+            continue
+        change = (stats['median'] - before['median']) / before['median'] * 100
+        regressed = change > threshold and stats['min'] > before['p95']
+        rows.append((name, before['median'], stats['median'], round(change, 1), regressed))
+    return rows
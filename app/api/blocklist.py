@@ -0,0 +1,281 @@
+import bisect
+import gzip
+import ipaddress
+import json
+import threading
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from .models import BlockedIP, BlocklistChange
+
+# Address length in bits of each IP version.
+BITS = {4: 32, 6: 128}
+
+# Key for the advisory lock that serialises blocklist writers. Versions are
+# allocated and committed under it, so a reader never sees version N before
+# every version below N is visible.
+BLOCKLIST_LOCK_KEY = 0x616c61726d
+
+EncodedBlocklist = namedtuple('EncodedBlocklist', ['version', 'etag', 'body', 'gzip_body'])
+
+
+def _lock_blocklist():
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [BLOCKLIST_LOCK_KEY])
+
+
+def ban_ip(ip, reason):
+    """
+    Bans an IP, creating its BlockedIP row or re-banning it if it was unbanned.
+
+    :return: (BlockedIP, created, rebanned); both flags are False if it was already banned
+    """
+    blocked_ip = BlockedIP.objects.filter(ip_address=ip).first()
+    if blocked_ip is not None and blocked_ip.currently_banned:
+        return blocked_ip, False, False
+
+    with transaction.atomic():
+        _lock_blocklist()
+        blocked_ip, created = BlockedIP.objects.select_for_update().get_or_create(
+            ip_address=ip, defaults={"reason": reason, "currently_banned": True}
+        )
+        if not created:
+            if blocked_ip.currently_banned:
+                return blocked_ip, False, False
+            blocked_ip.currently_banned = True
+            blocked_ip.banned_at = now()
+            blocked_ip.save(update_fields=['currently_banned', 'banned_at'])
+        BlocklistChange.objects.create(ip_address=blocked_ip.ip_address, banned=True)
+        transaction.on_commit(blocklist_snapshot.invalidate)
+    return blocked_ip, created, not created
+
+
+def set_ban_state(blocked_ip, banned):
+    """Bans or unbans an existing BlockedIP and records the change if its state differs."""
+    with transaction.atomic():
+        _lock_blocklist()
+        blocked_ip = BlockedIP.objects.select_for_update().get(pk=blocked_ip.pk)
+        if blocked_ip.currently_banned == banned:
+            return blocked_ip
+        blocked_ip.currently_banned = banned
+        update_fields = ['currently_banned']
+        if banned:
+            blocked_ip.banned_at = now()
+            update_fields.append('banned_at')
+        blocked_ip.save(update_fields=update_fields)
+        BlocklistChange.objects.create(ip_address=blocked_ip.ip_address, banned=banned)
+        transaction.on_commit(blocklist_snapshot.invalidate)
+    return blocked_ip
+
+
+def get_blocklist_version():
+    """Returns the current blocklist version, 0 if nothing has ever been banned."""
+    return BlocklistChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def get_blocklist():
+    """
+    Returns the full blocklist as (version, blocked_ips, unblocked_ips).
+
+    The version is read before the lists, so the lists are at least as new
+    as the version and a client replaying changes since it ends up correct.
+    Both lists are in address order, which each side's partial index on
+    ip_address returns without a sort.
+    """
+    version = get_blocklist_version()
+    bans = BlockedIP.objects.order_by("ip_address")
+    blocked_ips = list(bans.filter(currently_banned=True).values_list("ip_address", flat=True))
+    unblocked_ips = list(bans.filter(currently_banned=False).values_list("ip_address", flat=True))
+    return version, blocked_ips, unblocked_ips
+
+
+def get_blocklist_changes(since, until):
+    """
+    Returns the net effect of the changes after version since up to until as (added, removed).
+
+    An IP banned and unbanned again in that range is only reported by its last change.
+    """
+    latest = {}
+    changes = BlocklistChange.objects.filter(id__gt=since, id__lte=until).order_by('id').values_list('ip_address', 'banned')
+    for ip_address, banned in changes.iterator():
+        latest[ip_address] = banned
+    added = [ip_address for ip_address, banned in latest.items() if banned]
+    removed = [ip_address for ip_address, banned in latest.items() if not banned]
+    return added, removed
+
+
+def _address_ranges(ips):
+    """Parses IP strings into sorted, merged (first, last) integer ranges per IP version."""
+    addresses = {4: [], 6: []}
+    for ip in ips:
+        address = ipaddress.ip_address(ip)
+        addresses[address.version].append(int(address))
+    return {version: _merge_ranges((value, value) for value in values) for version, values in addresses.items()}
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def _range_prefixes(first, last, bits):
+    """Yields the fewest (network, prefix length) blocks that exactly cover first..last."""
+    while first <= last:
+        size = (first & -first) if first else 1 << bits
+        while size > last - first + 1:
+            size >>= 1
+        yield first, bits - size.bit_length() + 1
+        first += size
+
+
+def aggregate_blocklist(blocked_ips, unblocked_ips=(), policy=None):
+    """
+    Returns the fewest CIDR blocks that cover the blocked IPs.
+
+    Without a policy the blocks cover exactly the blocked IPs. A policy maps
+    an IP version to (prefix length, minimum blocked addresses) rules, e.g.
+    {4: [(24, 32)]}: a /24 holding at least 32 blocked addresses is then
+    blocked as a whole. Rules are applied longest prefix first, so a shorter
+    rule also counts the blocks collapsed by a longer one. A block containing
+    an unblocked IP is never collapsed.
+
+    :return: List of (IP version, network as an integer, prefix length), IPv4 first, in address order
+    """
+    ranges = _address_ranges(blocked_ips)
+    unblocked = _address_ranges(unblocked_ips)
+    # Range ends, to find the first unblocked range that ends at or after a block's start.
+    unblocked_lasts = {version: [last for _, last in version_ranges] for version, version_ranges in unblocked.items()}
+    policy = policy or {}
+
+    networks = []
+    for version, bits in BITS.items():
+        for prefixlen, min_addresses in sorted(policy.get(version, ()), reverse=True):
+            shift = bits - prefixlen
+            counts = {}
+            for first, last in ranges[version]:
+                for block in range(first >> shift, (last >> shift) + 1):
+                    covered = min(last, ((block + 1) << shift) - 1) - max(first, block << shift) + 1
+                    counts[block] = counts.get(block, 0) + covered
+            dense = []
+            for block, count in counts.items():
+                block_first, block_last = block << shift, ((block + 1) << shift) - 1
+                if count >= min(min_addresses, 1 << shift) and count < (1 << shift):
+                    index = bisect.bisect_left(unblocked_lasts[version], block_first)
+                    if index == len(unblocked[version]) or unblocked[version][index][0] > block_last:
+                        dense.append((block_first, block_last))
+            ranges[version] = _merge_ranges(ranges[version] + dense)
+
+        for first, last in ranges[version]:
+            networks.extend((version, network, length) for network, length in _range_prefixes(first, last, bits))
+    return networks
+
+
+def format_network(version, network, length):
+    """Formats an (IP version, network, prefix length) triple from aggregate_blocklist as CIDR."""
+    address = ipaddress.IPv4Address(network) if version == 4 else ipaddress.IPv6Address(network)
+    return f"{address}/{length}"
+
+
+class BlocklistSnapshot:
+    """
+    The full blocklist response, JSON encoded and gzipped once per version.
+
+    The current version is read from the database at most once every
+    check_interval seconds, so changes made by other workers are picked up
+    within that interval; ban_ip and set_ban_state invalidate the snapshot
+    in their own worker as soon as they commit. The snapshot is only rebuilt
+    when the version has actually moved.
+
+    The CIDR form of the blocklist is built from the same version the first
+    time it is asked for.
+    """
+
+    def __init__(self, check_interval, aggregation_policy=None):
+        self.check_interval = check_interval
+        self.aggregation_policy = aggregation_policy
+        self._encoded = None
+        self._ips = None
+        self._aggregated = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the current EncodedBlocklist."""
+        encoded = self._encoded
+        if encoded is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return encoded
+
+        with self._lock:
+            encoded = self._encoded
+            if encoded is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return encoded
+            version = get_blocklist_version()
+            if encoded is None or encoded.version != version:
+                version, blocked_ips, unblocked_ips = get_blocklist()
+                encoded = self._encode(version, {"version": version, "blocked_ips": blocked_ips, "unblocked_ips": unblocked_ips})
+                self._encoded = encoded
+                self._ips = (blocked_ips, unblocked_ips)
+            self._checked_at = time.monotonic()
+            return encoded
+
+    async def aget(self):
+        """Async variant of get() that only leaves the event loop when the version has to be checked."""
+        encoded = self._encoded
+        if encoded is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return encoded
+        return await sync_to_async(self.get)()
+
+    def get_aggregated(self):
+        """
+        Returns the current version as an EncodedBlocklist of its CIDR blocks.
+
+        The blocks are those of aggregate_blocklist under aggregation_policy.
+        """
+        self.get()
+        with self._lock:
+            encoded = self._encoded
+            aggregated = self._aggregated
+            if aggregated is None or aggregated.version != encoded.version:
+                blocked_ips, unblocked_ips = self._ips
+                networks = aggregate_blocklist(blocked_ips, unblocked_ips, self.aggregation_policy)
+                aggregated = self._encode(encoded.version, {
+                    "version": encoded.version,
+                    "blocked_networks": [format_network(*network) for network in networks],
+                    "unblocked_ips": unblocked_ips,
+                }, etag_suffix="-cidr")
+                self._aggregated = aggregated
+            return aggregated
+
+    def invalidate(self):
+        """Forces the next get() to check the version again."""
+        self._checked_at = 0
+
+    def clear(self):
+        """Drops the snapshot so the next get() rebuilds it."""
+        with self._lock:
+            self._encoded = None
+            self._ips = None
+            self._aggregated = None
+            self._checked_at = 0
+
+    def _encode(self, version, data, etag_suffix=""):
+        body = json.dumps(data, separators=(',', ':')).encode()
+        return EncodedBlocklist(version, f'"{version}{etag_suffix}"', body, gzip.compress(body, mtime=0))
+
+
+blocklist_snapshot = BlocklistSnapshot(
+    check_interval=settings.BLOCKLIST_VERSION_CHECK_INTERVAL,
+    aggregation_policy=settings.BLOCKLIST_AGGREGATION_POLICY,
+)
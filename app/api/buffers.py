@@ -0,0 +1,116 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_buffers = []
+
+
+class WriteBehindBuffer:
+    """
+    Collects pending writes in memory and stores them in one batch.
+
+    Subclasses decide how an item is merged into the pending map (add) and
+    how a batch is written (write). A buffer is flushed once it holds
+    max_size keys or flush_interval seconds have passed since the last
+    flush. Flushes run after the response has been sent (see
+    flush_buffers_if_due), so requests never wait on them.
+    """
+
+    def __init__(self, flush_interval, max_size):
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        _buffers.append(self)
+
+    def add(self, pending, key, value):
+        """Merges value into pending[key]. The default keeps the latest value."""
+        pending[key] = value
+
+    def write(self, items):
+        """Stores a batch of pending items, given as a dict."""
+        raise NotImplementedError
+
+    def put(self, key, value):
+        with self._lock:
+            self.add(self._pending, key, value)
+            overflowing = len(self._pending) > self.max_size
+        if overflowing and not _in_event_loop():
+            # Only reached when a single request produces more distinct keys
+            # than the buffer holds, so memory stays bounded. The ORM cannot
+            # run on an event loop, so async views leave it to the flush
+            # after the response, which is due as soon as the buffer is full.
+            self.flush()
+
+    def pending(self):
+        """Returns a copy of the items not yet written."""
+        with self._lock:
+            return dict(self._pending)
+
+    def is_due(self):
+        with self._lock:
+            if not self._pending:
+                return False
+            return len(self._pending) >= self.max_size or time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self):
+        """
+        Writes every pending item.
+
+        :return: Number of items written
+        """
+        with self._flush_lock:
+            with self._lock:
+                items, self._pending = self._pending, {}
+                self._last_flush = time.monotonic()
+            if items:
+                self.write(items)
+            return len(items)
+
+    def clear(self):
+        """Drops pending items without writing them."""
+        with self._lock:
+            self._pending = {}
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def clear_buffers():
+    """Drops everything pending in every buffer."""
+    for buffer in _buffers:
+        buffer.clear()
+
+
+def flush_buffers_if_due(**kwargs):
+    """Flushes every buffer that is due. Connected to request_finished."""
+    for buffer in _buffers:
+        if buffer.is_due():
+            try:
+                buffer.flush()
+            except Exception:
+                logger.exception("Failed to flush %s", type(buffer).__name__)
+
+
+@atexit.register
+def flush_all_buffers():
+    """Writes whatever is still pending when the process exits."""
+    close_old_connections()
+    for buffer in _buffers:
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception("Failed to flush %s on exit", type(buffer).__name__)
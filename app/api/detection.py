@@ -0,0 +1,104 @@
+import bisect
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.utils.timezone import now
+
+
+class SlidingWindowDetector:
+    """
+    Counts failed logins per source IP over a sliding time window.
+
+    Entries are fed in as they are ingested, so the cost of detection is
+    proportional to the number of entries rather than to the size of the
+    window. State is kept per process. Agents may deliver entries out of
+    order, so each IP's timestamps are kept sorted.
+
+    :param window: timedelta covered by the sliding window
+    :param threshold: Number of failures within the window that flags an IP
+    :param actions: LogEntry actions that count as a failed login
+    """
+
+    def __init__(self, window, threshold, actions):
+        self.window = window
+        self.threshold = threshold
+        self.actions = frozenset(actions)
+        self._events = {}
+        self._flagged = {}
+        self._last_sweep = now()
+        self._lock = threading.Lock()
+
+    def failures(self, entries):
+        """Returns the (source_ip, timestamp) of each LogEntry in entries that counts as a failed login."""
+        return [(entry.source_ip, entry.timestamp) for entry in entries if entry.action in self.actions]
+
+    def observe(self, entries, current_time=None):
+        """
+        Records a batch of LogEntry objects.
+
+        :return: IPs that reached the threshold and have not been reported
+            within the last window
+        """
+        return self.observe_failures(self.failures(entries), current_time)
+
+    def observe_failures(self, failures, current_time=None):
+        """
+        Records a batch of failed logins as (source_ip, timestamp) pairs.
+
+        :return: IPs that reached the threshold and have not been reported
+            within the last window
+        """
+        current_time = current_time or now()
+        cutoff = current_time - self.window
+        crossed = []
+
+        with self._lock:
+            for source_ip, timestamp in failures:
+                if timestamp < cutoff:
+                    continue
+
+                events = self._events.get(source_ip)
+                if events is None:
+                    events = self._events[source_ip] = deque()
+                bisect.insort(events, timestamp)
+                while events[0] < cutoff:
+                    events.popleft()
+
+                if len(events) >= self.threshold:
+                    flagged_at = self._flagged.get(source_ip)
+                    if flagged_at is None or flagged_at < cutoff:
+                        self._flagged[source_ip] = current_time
+                        crossed.append(source_ip)
+
+            if current_time - self._last_sweep >= self.window:
+                self._sweep(cutoff)
+                self._last_sweep = current_time
+
+        return crossed
+
+    def count(self, ip, current_time=None):
+        """Returns the number of failures recorded for an IP inside the window."""
+        cutoff = (current_time or now()) - self.window
+        with self._lock:
+            return sum(1 for timestamp in self._events.get(ip, ()) if timestamp >= cutoff)
+
+    def reset(self):
+        """Forgets all recorded failures."""
+        with self._lock:
+            self._events.clear()
+            self._flagged.clear()
+
+    def _sweep(self, cutoff):
+        """Drops IPs with no failures left inside the window."""
+        for ip in [ip for ip, events in self._events.items() if events[-1] < cutoff]:
+            del self._events[ip]
+        for ip in [ip for ip, flagged_at in self._flagged.items() if flagged_at < cutoff]:
+            del self._flagged[ip]
+
+
+detector = SlidingWindowDetector(
+    window=settings.BRUTE_FORCE_WINDOW,
+    threshold=settings.BRUTE_FORCE_THRESHOLD,
+    actions=settings.BRUTE_FORCE_ACTIONS,
+)
@@ -0,0 +1,99 @@
+"""
+Device health, computed in the database.
+
+A device is Healthy if it checked in within DEVICE_HEALTHY_SECONDS,
+Degraded if within DEVICE_OFFLINE_SECONDS, and Offline otherwise. Each
+status is a range of last_check_in, so filtering and sorting by status use
+the last_check_in index instead of evaluating every device.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, Count, DurationField, ExpressionWrapper, F, Q, Value, When
+
+from .models import ManagedDevice
+
+HEALTHY = 'Healthy'
+DEGRADED = 'Degraded'
+OFFLINE = 'Offline'
+STATUSES = (HEALTHY, DEGRADED, OFFLINE)
+
+
+def health_cutoffs(current_time):
+    """Returns the oldest check-in times that still count as Healthy and as Degraded."""
+    return (
+        current_time - timedelta(seconds=settings.DEVICE_HEALTHY_SECONDS),
+        current_time - timedelta(seconds=settings.DEVICE_OFFLINE_SECONDS),
+    )
+
+
+def device_status(last_check_in, current_time):
+    """Returns the status of a device with the given last check-in, for devices already in memory."""
+    healthy_after, degraded_after = health_cutoffs(current_time)
+    if last_check_in is None or last_check_in < degraded_after:
+        return OFFLINE
+    if last_check_in < healthy_after:
+        return DEGRADED
+    return HEALTHY
+
+
+def _status_range(status, current_time):
+    """Returns the (oldest, newest) check-in times of a status, exclusive at the newest end; None is unbounded."""
+    healthy_after, degraded_after = health_cutoffs(current_time)
+    if status == HEALTHY:
+        return healthy_after, None
+    if status == DEGRADED:
+        return degraded_after, healthy_after
+    return None, degraded_after
+
+
+def health_filter(status, current_time, pending=None):
+    """
+    Returns a Q matching devices with the given status, as a range of last_check_in.
+
+    :param pending: Unflushed check-in times by device id. A device's status
+        is then that of the later of its stored and its pending check-in.
+    """
+    healthy_after, degraded_after = health_cutoffs(current_time)
+    if status == HEALTHY:
+        stored = Q(last_check_in__gte=healthy_after)
+    elif status == DEGRADED:
+        stored = Q(last_check_in__gte=degraded_after, last_check_in__lt=healthy_after)
+    else:
+        stored = Q(last_check_in__lt=degraded_after) | Q(last_check_in__isnull=True)
+    if not pending:
+        return stored
+
+    # The later check-in is inside [oldest, newest) if neither is newer than
+    # newest and at least one of them is at or after oldest.
+    oldest, newest = _status_range(status, current_time)
+    buffered = Q(id__in=[device_id for device_id, checked_in in pending.items() if newest is None or checked_in < newest])
+    if newest is not None:
+        buffered &= Q(last_check_in__lt=newest) | Q(last_check_in__isnull=True)
+    if oldest is not None:
+        buffered &= Q(last_check_in__gte=oldest) | Q(id__in=[
+            device_id for device_id, checked_in in pending.items() if checked_in >= oldest
+        ])
+    return (stored & ~Q(id__in=list(pending))) | buffered
+
+
+def annotate_health(queryset, current_time):
+    """Annotates devices with their status (health) and time since their last check-in (check_in_age)."""
+    healthy_after, degraded_after = health_cutoffs(current_time)
+    return queryset.annotate(
+        health=Case(
+            When(last_check_in__gte=healthy_after, then=Value(HEALTHY)),
+            When(last_check_in__gte=degraded_after, then=Value(DEGRADED)),
+            default=Value(OFFLINE),
+        ),
+        check_in_age=ExpressionWrapper(Value(current_time) - F('last_check_in'), output_field=DurationField()),
+    )
+
+
+def count_by_status(current_time):
+    """Counts devices per status in one grouped query, including statuses with no devices."""
+    rows = annotate_health(ManagedDevice.objects.all(), current_time).values('health').annotate(count=Count('id')).order_by()
+    by_status = dict.fromkeys(STATUSES, 0)
+    for row in rows:
+        by_status[row['health']] = row['count']
+    return by_status
@@ -0,0 +1,49 @@
+from django.conf import settings
+
+from .authentication import device_token_cache
+from .buffers import WriteBehindBuffer
+from .models import ManagedDevice
+from .utils import log_alert
+
+
+class HeartbeatBuffer(WriteBehindBuffer):
+    """
+    Holds the latest check-in time per device and writes them as one bulk UPDATE.
+
+    Devices deleted before a flush are not matched by the UPDATE. When fewer
+    rows are updated than were pending, the missing devices are looked up
+    and their cached tokens dropped, so their next request is refused.
+    """
+
+    def add(self, pending, key, value):
+        if key not in pending or value > pending[key]:
+            pending[key] = value
+
+    def write(self, items):
+        updated = ManagedDevice.objects.bulk_update(
+            [ManagedDevice(pk=device_id, last_check_in=checked_in) for device_id, checked_in in sorted(items.items())],
+            ['last_check_in'],
+            batch_size=settings.HEARTBEAT_FLUSH_BATCH_SIZE,
+        )
+        if updated < len(items):
+            existing = set(ManagedDevice.objects.filter(pk__in=list(items)).values_list('pk', flat=True))
+            missing = items.keys() - existing
+            for device_id in missing:
+                device_token_cache.invalidate_device(device_id)
+            log_alert("Heartbeat Failed", f"{len(missing)} checked-in device(s) not found.", severity='WARNING')
+
+    def merge_into(self, devices):
+        """Applies pending check-ins to already loaded devices so reads are not behind the buffer."""
+        pending = self.pending()
+        if not pending:
+            return
+        for device in devices:
+            checked_in = pending.get(device.pk)
+            if checked_in is not None and (device.last_check_in is None or checked_in > device.last_check_in):
+                device.last_check_in = checked_in
+
+
+heartbeat_buffer = HeartbeatBuffer(
+    flush_interval=settings.HEARTBEAT_FLUSH_INTERVAL,
+    max_size=settings.HEARTBEAT_BUFFER_SIZE,
+)
@@ -0,0 +1,165 @@
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import metrics
+from .detection import detector
+from .log_parsers import parse_many
+from .models import LogEntry
+from .rollups import record_log_entries, tally_log_entries, write_rollup_counts
+from .utils import ban_suspicious_ip
+
+
+class InvalidLogData(ValueError):
+    """Raised when an entry in a submitted batch cannot be ingested."""
+
+
+def _validate_record(entry):
+    """Checks the envelope of a submitted log record and returns its message."""
+    if not isinstance(entry, dict):
+        raise InvalidLogData("Each log entry must be a JSON object.")
+
+    message = entry.get('message')
+    timestamp = entry.get('timestamp')
+
+    if not message or not timestamp or not isinstance(message, str):
+        raise InvalidLogData("Missing 'message' or 'timestamp' in log data.")
+    return message
+
+
+def _parse_timestamp(timestamp):
+    """Parses an ISO 8601 timestamp, treating naive values as server time."""
+    if isinstance(timestamp, datetime):
+        parsed_timestamp = timestamp
+    else:
+        parsed_timestamp = parse_datetime(timestamp) if isinstance(timestamp, str) else None
+    if parsed_timestamp is None:
+        raise InvalidLogData(f"Invalid timestamp '{timestamp}' in log data.")
+    if timezone.is_naive(parsed_timestamp):
+        parsed_timestamp = timezone.make_aware(parsed_timestamp)
+    return parsed_timestamp
+
+
+def read_chunks(records):
+    """
+    Splits an iterable of submitted records into lists of LOG_INGEST_BATCH_SIZE.
+
+    Raises InvalidLogData once more than LOG_INGEST_MAX_RECORDS have been read.
+    """
+    records = iter(records)
+    count = 0
+    while True:
+        chunk = list(islice(records, settings.LOG_INGEST_BATCH_SIZE))
+        if not chunk:
+            return
+        count += len(chunk)
+        if count > settings.LOG_INGEST_MAX_RECORDS:
+            raise InvalidLogData(f"A submission may hold at most {settings.LOG_INGEST_MAX_RECORDS} log entries.")
+        yield chunk
+
+
+def build_log_entries(logs, client_ip):
+    """
+    Validates and parses a whole batch before anything is written.
+
+    Raises InvalidLogData on the first invalid record, so a batch is either
+    stored completely or not at all. Messages without a source IP are
+    skipped rather than rejecting the batch, since the lines an agent
+    forwards are partly chosen by whoever connects to it.
+
+    :param logs: List of submitted records with 'message', 'timestamp' and optional 'host'
+    :param client_ip: Address of the submitting device, used when 'host' is missing
+    :return: List of unsaved LogEntry instances
+    """
+    try:
+        messages = [_validate_record(entry) for entry in logs]
+        entries = []
+        skipped = 0
+
+        for entry, parsed in zip(logs, parse_many(messages)):
+            timestamp = _parse_timestamp(entry['timestamp'])
+            if not parsed.source_ip:
+                skipped += 1
+                continue
+
+            entries.append(LogEntry(
+                timestamp=timestamp,
+                source_ip=parsed.source_ip,
+                action=parsed.action,
+                source="vector",
+                host=entry.get('host', client_ip)
+            ))
+    except InvalidLogData:
+        metrics.LOG_ENTRIES_REJECTED.inc()
+        raise
+    metrics.LOG_ENTRIES_PARSED.inc(amount=len(entries))
+    if skipped:
+        metrics.LOG_ENTRIES_SKIPPED.inc(amount=skipped)
+    return entries
+
+
+def store_log_entries(entries):
+    """
+    Writes a validated batch with bulk INSERTs inside a single transaction,
+    updating the hourly and daily rollups in the same transaction.
+
+    :param entries: Unsaved LogEntry instances from build_log_entries
+    :return: Number of rows written
+    """
+    with transaction.atomic():
+        LogEntry.objects.bulk_create(entries, batch_size=settings.LOG_INGEST_BATCH_SIZE)
+        record_log_entries(entries)
+    return len(entries)
+
+
+@metrics.timed(metrics.DETECTOR_DURATION, 'sliding_window')
+def detect_brute_force(failures):
+    """
+    Feeds failed logins to the sliding-window detector and bans any IP that crosses the threshold.
+
+    :param failures: (source_ip, timestamp) pairs, as returned by detector.failures
+    :return: IPs that were banned
+    """
+    banned = []
+    for ip in detector.observe_failures(failures):
+        ban_suspicious_ip(ip)
+        banned.append(ip)
+    return banned
+
+
+def ingest_log_records(records, client_ip):
+    """
+    Validates and stores an iterable of records in chunks of LOG_INGEST_BATCH_SIZE.
+
+    Only one chunk of LogEntry objects is held in memory at a time, so records
+    can be streamed straight from the request parser. All chunks are written
+    in a single transaction: an invalid record anywhere rolls back the whole
+    submission. Rollup counts are added up across chunks and written once the
+    last chunk is stored, so the rollup rows are only locked for the end of
+    the transaction, not while the body is read. The counts and the failed
+    logins kept for detection grow with the submission, which is capped at
+    LOG_INGEST_MAX_RECORDS. Brute-force detection runs
+    once the transaction has committed.
+
+    :return: (number of rows written, IPs that were banned)
+    """
+    created = 0
+    failures = []
+    hourly = Counter()
+    daily = Counter()
+    with transaction.atomic():
+        for chunk in read_chunks(records):
+            entries = build_log_entries(chunk, client_ip)
+            LogEntry.objects.bulk_create(entries, batch_size=settings.LOG_INGEST_BATCH_SIZE)
+            tally_log_entries(entries, hourly, daily)
+            failures.extend(detector.failures(entries))
+            created += len(entries)
+        write_rollup_counts(hourly, daily)
+    metrics.LOG_ENTRIES_INSERTED.inc(amount=created)
+    metrics.LOG_BATCH_SIZE.observe(created)
+    return created, detect_brute_force(failures)
@@ -0,0 +1,41 @@
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from api.models import LogEntry
+from api.rollups import ONE_DAY, floor_day, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the hourly and daily LogEntry rollups from the raw log table, one day per transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="First day to rebuild (YYYY-MM-DD). Defaults to the oldest log entry.")
+        parser.add_argument("--until", help="Last day to rebuild (YYYY-MM-DD). Defaults to the newest log entry.")
+
+    def handle(self, *args, **options):
+        bounds = LogEntry.objects.aggregate(oldest=Min('timestamp'), newest=Max('timestamp'))
+        start = self.parse_day(options["since"]) if options["since"] else bounds["oldest"]
+        end = self.parse_day(options["until"]) if options["until"] else bounds["newest"]
+
+        if start is None or end is None:
+            self.stdout.write("No log entries to roll up.")
+            return
+        if start > end:
+            raise CommandError("--since must not be after --until.")
+
+        start, end = floor_day(start), floor_day(end) + ONE_DAY
+        self.stdout.write(f"Rebuilding rollups from {start:%Y-%m-%d} to {end - ONE_DAY:%Y-%m-%d}...")
+        days = rebuild_rollups(start, end)
+        kept = (end - start).days - days
+        if kept:
+            self.stdout.write(f"Kept the rollups of {kept} archived day(s).")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for {days} day(s)."))
+
+    def parse_day(self, value):
+        try:
+            day = datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+        return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
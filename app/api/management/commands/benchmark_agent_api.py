@@ -0,0 +1,201 @@
+import asyncio
+import gzip
+import json
+import random
+import ssl
+import statistics
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from api.models import DailyLogCount, HourlyLogCount, LogEntry, ManagedDevice
+from api.utils import generate_device_tokens
+
+DEVICE_PREFIX = "bench-agent-"
+ENDPOINTS = ("heartbeat", "blocklist", "logs")
+
+
+class HttpConnection:
+    """Minimal keep-alive HTTP/1.1 client, so thousands of agents fit in one event loop."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl = ssl.create_default_context() if parts.scheme == "https" else None
+        self.base_path = parts.path.rstrip("/")
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=b""):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+
+        lines = [f"{method} {self.base_path}{path} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server.")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if response_headers.get("transfer-encoding") == "chunked":
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                body += (await self.reader.readexactly(size + 2))[:-2]
+                if size == 0:
+                    break
+        elif "content-length" in response_headers:
+            body = await self.reader.readexactly(int(response_headers["content-length"]))
+
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        if response_headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulates a fleet of agents against one or more deployments (e.g. WSGI and ASGI) "
+        "and compares throughput and latency per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target", action="append", required=True, metavar="LABEL=URL",
+            help="Deployment to benchmark, e.g. wsgi=http://localhost:5000. May be repeated.",
+        )
+        parser.add_argument("--agents", type=int, default=1000, help="Number of concurrent simulated agents.")
+        parser.add_argument("--devices", type=int, default=100, help="Number of registered devices the agents share.")
+        parser.add_argument("--duration", type=float, default=30, help="Seconds to run against each target.")
+        parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated endpoints to exercise.")
+        parser.add_argument("--batch", type=int, default=20, help="Log lines per log submission.")
+        parser.add_argument("--keep-data", action="store_true", help="Keep the benchmark devices and log entries.")
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options["target"]:
+            label, sep, url = target.partition("=")
+            if not sep or not url.startswith(("http://", "https://")):
+                raise CommandError(f"Invalid target '{target}', expected LABEL=http(s)://host:port.")
+            targets.append((label, url))
+
+        endpoints = [endpoint.strip() for endpoint in options["endpoints"].split(",") if endpoint.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}.")
+
+        tokens = self.create_devices(options["devices"])
+        try:
+            results = [
+                (label, asyncio.run(self.run_target(url, tokens, endpoints, options)))
+                for label, url in targets
+            ]
+        finally:
+            if not options["keep_data"]:
+                self.cleanup()
+
+        for label, (elapsed, latencies, statuses) in results:
+            self.report(label, elapsed, latencies, statuses)
+
+    def create_devices(self, count):
+        devices = ManagedDevice.objects.bulk_create([
+            ManagedDevice(unique_id=str(uuid.uuid4()), hostname=f"{DEVICE_PREFIX}{i}", ip_address="127.0.0.1", os="Benchmark")
+            for i in range(count)
+        ])
+        return [generate_device_tokens(device.unique_id)["access"] for device in devices]
+
+    def cleanup(self):
+        hosts = list(ManagedDevice.objects.filter(hostname__startswith=DEVICE_PREFIX).values_list("hostname", flat=True))
+        for model in (LogEntry, HourlyLogCount, DailyLogCount):
+            model.objects.filter(host__in=hosts).delete()
+        ManagedDevice.objects.filter(hostname__startswith=DEVICE_PREFIX).delete()
+
+    async def run_target(self, url, tokens, endpoints, options):
+        self.stdout.write(f"Running {options['agents']} agents against {url} for {options['duration']}s...")
+        latencies = defaultdict(list)
+        statuses = Counter()
+        deadline = time.monotonic() + options["duration"]
+
+        async def agent(index):
+            connection = HttpConnection(url)
+            token = tokens[index % len(tokens)]
+            hostname = f"{DEVICE_PREFIX}{index % len(tokens)}"
+            rng = random.Random(index)
+            version = 0
+            while time.monotonic() < deadline:
+                endpoint = rng.choice(endpoints)
+                method, path, headers, body = self.build_request(endpoint, token, hostname, version, options["batch"], rng)
+                started = time.perf_counter()
+                try:
+                    status, response_body = await connection.request(method, path, headers, body)
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+                    connection.close()
+                    statuses[(endpoint, "error")] += 1
+                    await asyncio.sleep(0.1)
+                    continue
+                latencies[endpoint].append(time.perf_counter() - started)
+                statuses[(endpoint, status)] += 1
+                if endpoint == "blocklist" and status == 200:
+                    # Like the agent sync script, only ask for changes after the first fetch.
+                    version = json.loads(response_body)["version"]
+            connection.close()
+
+        started = time.monotonic()
+        await asyncio.gather(*(agent(index) for index in range(options["agents"])))
+        return time.monotonic() - started, latencies, statuses
+
+    def build_request(self, endpoint, token, hostname, version, batch, rng):
+        auth = {"Authorization": f"Bearer {token}"}
+        if endpoint == "heartbeat":
+            return "POST", "/api/device/heartbeat/", auth, b""
+        if endpoint == "blocklist":
+            return "GET", f"/api/blocklist/?since={version}", {"Accept-Encoding": "gzip"}, b""
+
+        timestamp = now().isoformat()
+        lines = [
+            json.dumps({
+                "message": f"{rng.choice(('Failed', 'Accepted'))} password for root from 198.18.{rng.randrange(256)}.{rng.randrange(1, 255)} port 22 ssh2",
+                "timestamp": timestamp,
+                "host": hostname,
+            })
+            for _ in range(batch)
+        ]
+        return "POST", "/api/logs/", {**auth, "Content-Type": "application/x-ndjson"}, "\n".join(lines).encode()
+
+    def report(self, label, elapsed, latencies, statuses):
+        total = sum(len(samples) for samples in latencies.values())
+        errors = sum(count for (_, status), count in statuses.items() if status == "error" or status >= 500)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\n{label}: {total:,} requests in {elapsed:.1f}s = {total / elapsed:,.0f} req/s, {errors:,} errors"
+        ))
+        self.stdout.write(f"  {'endpoint':<10} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses")
+        for endpoint, samples in sorted(latencies.items()):
+            if len(samples) > 1:
+                cuts = statistics.quantiles(samples, n=100)
+                p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+            else:
+                p50 = p95 = p99 = samples[0]
+            codes = ", ".join(f"{status}: {count}" for (name, status), count in sorted(statuses.items(), key=str) if name == endpoint)
+            self.stdout.write(
+                f"  {endpoint:<10} {len(samples):>9,} {p50 * 1000:>8.1f} {p95 * 1000:>8.1f} {p99 * 1000:>8.1f}  {codes}"
+            )
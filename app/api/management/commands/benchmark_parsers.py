@@ -0,0 +1,91 @@
+import random
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.log_parsers import parse_many, registry
+
+LEGACY_IP_PATTERN = r'from (\d{1,3}(?:\.\d{1,3}){3})'
+
+SAMPLE_LINES = [
+    "Failed password for root from {ip} port {port} ssh2",
+    "Failed password for invalid user {user} from {ip} port {port} ssh2",
+    "Accepted password for {user} from {ip} port {port} ssh2",
+    "Accepted publickey for {user} from {ip} port {port} ssh2: ED25519 SHA256:3q2+7w",
+    "Invalid user {user} from {ip} port {port}",
+    "pam_unix(sshd:auth): authentication failure; logname= uid=0 euid=0 tty=ssh ruser= rhost={ip}  user={user}",
+    "Mar 19 05:30:00 web-01 sshd[{port}]: Failed password for {user} from {ip} port {port} ssh2",
+    "2025-03-19 05:30:00,123 fail2ban.actions        [812]: NOTICE  [sshd] Ban {ip}",
+    "Failed password for {user} from 2001:db8::{port:x} port {port} ssh2",
+    "Connection closed by authenticating user {user} {ip} port {port} [preauth]",
+]
+
+USERS = ["root", "admin", "ubuntu", "oracle", "test", "deploy", "git", "postgres"]
+
+
+def legacy_parse(message):
+    """The per-line classification LogView used before the parser registry."""
+    ip_match = re.search(LEGACY_IP_PATTERN, message)
+    source_ip = ip_match.group(1) if ip_match else None
+    action = "Accepted password" if "Accepted password" in message else ("Failed password" if "Failed password" in message else "Unknown")
+    return action, source_ip
+
+
+class Command(BaseCommand):
+    help = "Measures log parser throughput in lines/sec over a large synthetic or supplied corpus."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=1_000_000, help="Number of synthetic lines to generate.")
+        parser.add_argument("--file", help="Read the corpus from a log file instead of generating one.")
+        parser.add_argument("--repeat", type=int, default=5, help="Number of timed passes over the corpus.")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed for the synthetic corpus.")
+        parser.add_argument("--legacy", action="store_true", help="Also time the previous regex/substring classifier.")
+
+    def handle(self, *args, **options):
+        corpus = self.load_corpus(options)
+        if not corpus:
+            raise CommandError("The corpus is empty.")
+
+        self.stdout.write(f"Corpus: {len(corpus):,} lines, {len(registry._parsers)} parser keywords")
+        self.report("parse_many", lambda: parse_many(corpus), len(corpus), options["repeat"])
+        self.report("parse (per line)", lambda: [registry.parse(line) for line in corpus], len(corpus), options["repeat"])
+
+        if options["legacy"]:
+            self.report("legacy", lambda: [legacy_parse(line) for line in corpus], len(corpus), options["repeat"])
+
+        parsed = parse_many(corpus)
+        unknown = sum(1 for result in parsed if result.action == "Unknown")
+        self.stdout.write(f"Unrecognised lines: {unknown:,} ({unknown / len(corpus):.1%})")
+
+    def load_corpus(self, options):
+        """Returns the lines to benchmark."""
+        if options["file"]:
+            with open(options["file"], encoding="utf-8", errors="replace") as handle:
+                return [line.rstrip("\n") for line in handle if line.strip()]
+
+        rng = random.Random(options["seed"])
+        return [
+            rng.choice(SAMPLE_LINES).format(
+                ip=f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                port=rng.randint(1024, 65535),
+                user=rng.choice(USERS),
+            )
+            for _ in range(options["lines"])
+        ]
+
+    def report(self, label, run, line_count, repeat):
+        """Times several passes of run() and prints throughput statistics."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+
+        best = min(timings)
+        median = statistics.median(timings)
+        self.stdout.write(
+            f"{label:<18} best {line_count / best:>12,.0f} lines/sec   "
+            f"median {line_count / median:>12,.0f} lines/sec   ({best * 1000:.1f} ms/pass)"
+        )
@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.buffers import flush_buffers_if_due
+from api.metrics import write_snapshot_if_due
+from api.spool import drain_spool
+
+
+class Command(BaseCommand):
+    help = "Stores spooled log batches in the database, polling the spool directory until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", default=settings.LOG_SPOOL_DIR, help="Spool directory to drain.")
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.LOG_SPOOL_DRAIN_BATCH_SIZE,
+            help="Entries stored per transaction.",
+        )
+        parser.add_argument("--interval", type=float, default=1, help="Seconds to wait when the spool is empty.")
+        parser.add_argument("--once", action="store_true", help="Drain what is spooled now and exit.")
+
+    def handle(self, *args, **options):
+        directory = options["directory"]
+        self.stdout.write(f"Draining log spool in {directory}...")
+        try:
+            while True:
+                close_old_connections()
+                stored = self.drain(directory, options["batch_size"])
+                if options["once"]:
+                    break
+                if not stored:
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("Log spool drained."))
+
+    def drain(self, directory, batch_size):
+        """
+        Drains the spool once, then writes what detection buffered, as request_finished would after a request.
+
+        :return: Number of entries stored
+        """
+        stored, removed = drain_spool(directory, batch_size)
+        flush_buffers_if_due()
+        write_snapshot_if_due()
+        if stored or removed:
+            self.stdout.write(f"Stored {stored} log entries, removed {removed} segment(s).")
+        return stored
@@ -0,0 +1,94 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, now
+
+from api.benchmarks import parse_scale
+from api.models import LogEntry
+from api.rollups import rebuild_rollups
+from api.traffic import (
+    COPY_CHUNK_SIZE, DEFAULT_MIX, DISTRIBUTIONS, SCENARIOS, TrafficGenerator, copy_events, parse_mix, parse_span,
+    write_ndjson_batches,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates synthetic SSH traffic (normal logins, brute-force bursts, credential spraying and botnets) "
+        "and loads it into the database with COPY, or writes it as NDJSON batches for /api/logs/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", default="1m", help="Number of log entries: 1m, 10m, 50m or a number.")
+        parser.add_argument("--span", default="1d", help="Time span of the traffic, e.g. 90m, 12h or 30d.")
+        parser.add_argument("--end", help="End of the span as an ISO 8601 datetime. Defaults to now.")
+        parser.add_argument("--hosts", type=int, default=1000, help="Number of monitored hosts.")
+        parser.add_argument(
+            "--mix", default=",".join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()),
+            help=f"Relative weight of each scenario, from: {', '.join(SCENARIOS)}.",
+        )
+        parser.add_argument(
+            "--distribution", choices=DISTRIBUTIONS, default="uniform",
+            help="Spread normal logins evenly or follow the working day.",
+        )
+        parser.add_argument("--seed", type=int, default=42, help="Random seed; the same seed gives the same traffic.")
+        parser.add_argument(
+            "--chunk-size", type=int, default=COPY_CHUNK_SIZE, help="Rows loaded per COPY transaction.",
+        )
+        parser.add_argument(
+            "--ndjson", metavar="DIRECTORY",
+            help="Write NDJSON request bodies to this directory instead of loading the database.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500, help="Log entries per NDJSON batch.")
+        parser.add_argument("--gzip", action="store_true", help="Compress the NDJSON batches.")
+
+    def handle(self, *args, **options):
+        try:
+            rows = parse_scale(options["rows"])
+            span = parse_span(options["span"])
+            mix = parse_mix(options["mix"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        end = now()
+        if options["end"]:
+            end = parse_datetime(options["end"])
+            if end is None:
+                raise CommandError(f"Invalid end '{options['end']}'.")
+            if is_naive(end):
+                end = make_aware(end)
+        start = end - span
+
+        generator = TrafficGenerator(
+            rows, start, end, hosts=options["hosts"], mix=mix,
+            distribution=options["distribution"], seed=options["seed"],
+        )
+        self.stdout.write(f"Generating {rows:,} log entries from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}...")
+        started = time.perf_counter()
+
+        if options["ndjson"]:
+            files = write_ndjson_batches(
+                generator.events(), options["ndjson"], options["batch_size"], compress=options["gzip"],
+            )
+            self.stdout.write(f"Wrote {files:,} batches to {options['ndjson']}")
+        else:
+            if connection.vendor != "postgresql":
+                raise CommandError("Loading with COPY needs PostgreSQL; use --ndjson instead.")
+            copy_events(
+                generator.events(), options["chunk_size"],
+                progress=lambda loaded: self.stdout.write(f"  {loaded:,} / {rows:,}"),
+            )
+            loaded_in = time.perf_counter() - started
+            self.stdout.write(f"Loaded {rows:,} rows in {loaded_in:.1f}s ({rows / loaded_in * 60:,.0f} rows/min)")
+            self.stdout.write("Rebuilding rollups...")
+            rebuild_rollups(start, end)
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {LogEntry._meta.db_table}")
+
+        elapsed = time.perf_counter() - started
+        for name in SCENARIOS:
+            if generator.counts[name]:
+                self.stdout.write(f"  {name:<12} {generator.counts[name]:>12,}")
+        self.stdout.write(self.style.SUCCESS(f"Done in {elapsed:.1f}s."))
@@ -0,0 +1,49 @@
+import json
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import remove_benchmark_traffic
+from api.models import ManagedDevice
+from api.utils import generate_device_tokens
+
+DEVICE_PREFIX = "loadtest-agent-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Registers devices for the Locust load test and prints their tokens as JSON, "
+        "or removes them and the traffic they generated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--devices", type=int, default=100, help="Number of devices to register.")
+        parser.add_argument("--output", help="Write the tokens to this file instead of standard output.")
+        parser.add_argument(
+            "--cleanup", action="store_true",
+            help="Remove the load test devices, and the log entries and bans from 198.18.0.0/15.",
+        )
+
+    def handle(self, *args, **options):
+        if options["cleanup"]:
+            deleted, _ = ManagedDevice.objects.filter(hostname__startswith=DEVICE_PREFIX).delete()
+            remove_benchmark_traffic()
+            self.stderr.write(f"Removed {deleted} load test device(s) and their traffic.")
+            return
+
+        devices = ManagedDevice.objects.bulk_create([
+            ManagedDevice(unique_id=str(uuid.uuid4()), hostname=f"{DEVICE_PREFIX}{uuid.uuid4().hex[:12]}",
+                          ip_address="127.0.0.1", os="Load test")
+            for _ in range(options["devices"])
+        ])
+        agents = [
+            {"hostname": device.hostname, **generate_device_tokens(device.unique_id)}
+            for device in devices
+        ]
+        payload = json.dumps({"agents": agents}, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(payload)
+            self.stderr.write(f"Wrote tokens for {len(agents)} device(s) to {options['output']}")
+        else:
+            self.stdout.write(payload)
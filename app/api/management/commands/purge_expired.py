@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.retention import purge_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Archives log entries and alerts older than their retention period to gzipped CSV files "
+        "partitioned by day, and deletes them. Repeats every --interval seconds until interrupted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", default=settings.ARCHIVE_DIR, help="Archive directory.")
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.PURGE_BATCH_SIZE, help="Rows deleted per transaction.",
+        )
+        parser.add_argument("--pause", type=float, default=0, help="Seconds to wait between batches.")
+        parser.add_argument("--interval", type=float, default=3600, help="Seconds between purges.")
+        parser.add_argument("--once", action="store_true", help="Purge once and exit.")
+
+    def handle(self, *args, **options):
+        directory = options["directory"]
+        self.stdout.write(f"Archiving expired rows to {directory}...")
+        try:
+            while True:
+                close_old_connections()
+                purged = purge_expired(directory, options["batch_size"], pause=options["pause"])
+                self.stdout.write(
+                    f"Archived and deleted {purged['logentry']} log entries and {purged['alert']} alerts."
+                )
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("Purge finished."))
@@ -0,0 +1,55 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from api.retention import ARCHIVED_MODELS, archived_days, rehydrate_day
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads archived log entries or alerts for a range of days back into the database, "
+        "and keeps them there for --hold-days before they are purged again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", required=True, help="First day to restore (YYYY-MM-DD).")
+        parser.add_argument("--until", help="Last day to restore (YYYY-MM-DD). Defaults to --since.")
+        parser.add_argument(
+            "--model", choices=sorted(ARCHIVED_MODELS), default="logentry", help="Which rows to restore.",
+        )
+        parser.add_argument("--directory", default=settings.ARCHIVE_DIR, help="Archive directory.")
+        parser.add_argument(
+            "--hold-days", type=float, default=settings.REHYDRATE_HOLD_DAYS,
+            help="Days before the restored rows may be purged again.",
+        )
+
+    def handle(self, *args, **options):
+        start = self.parse_day(options["since"])
+        end = self.parse_day(options["until"]) if options["until"] else start
+        if start > end:
+            raise CommandError("--since must not be after --until.")
+
+        archived = ARCHIVED_MODELS[options["model"]]
+        days = [day for day in archived_days(options["directory"], archived) if start <= day <= end]
+        if not days:
+            self.stdout.write(f"No archived {archived.name} rows from {start:%Y-%m-%d} to {end:%Y-%m-%d}.")
+            return
+
+        hold_until = now() + timedelta(days=options["hold_days"])
+        total = 0
+        for day in days:
+            restored = rehydrate_day(archived, day, options["directory"], hold_until)
+            self.stdout.write(f"  {day:%Y-%m-%d}: {restored} row(s)")
+            total += restored
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {total} {archived.name} row(s) from {len(days)} day(s), held until {hold_until:%Y-%m-%d %H:%M}."
+        ))
+
+    def parse_day(self, value):
+        try:
+            day = datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+        return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
@@ -0,0 +1,139 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.benchmarks import compare_results, parse_scale, reset_database, run_suite, seed_database
+from api.models import LogEntry
+from dashboard.pagination import estimated_count
+
+BENCHMARKS = ("blocklist", "dashboard", "lists", "detection", "ingest")
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a separate benchmark database at a given scale and measures ingest, detection, "
+        "dashboard, list and blocklist latency, writing the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale", default="1m",
+            help="LogEntry rows to seed: 1m, 10m, 50m or a number. Alerts are seeded at 1%% of that.",
+        )
+        parser.add_argument(
+            "--database-name",
+            help="Benchmark database, created next to the configured one. Defaults to <NAME>_bench.",
+        )
+        parser.add_argument("--reseed", action="store_true", help="Empty the benchmark tables and seed them again.")
+        parser.add_argument("--repeat", type=int, default=10, help="Timed repeats per benchmark.")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed for generated requests.")
+        parser.add_argument(
+            "--batch-sizes", type=int_list, default=[1, 100, 1000, 5000],
+            help="Comma-separated log batch sizes for the ingest benchmark.",
+        )
+        parser.add_argument(
+            "--bans", type=int_list, default=[10_000, 100_000],
+            help="Comma-separated ban counts for the blocklist benchmark.",
+        )
+        parser.add_argument(
+            "--only", default=",".join(BENCHMARKS),
+            help=f"Comma-separated benchmarks to run, from: {', '.join(BENCHMARKS)}.",
+        )
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument("--compare", help="Compare against the results in this JSON file.")
+        parser.add_argument(
+            "--threshold", type=float, default=10,
+            help="Percent increase of a median that counts as a regression.",
+        )
+        parser.add_argument(
+            "--fail-on-regression", action="store_true", help="Exit with an error if anything regressed.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The benchmarks need PostgreSQL.")
+        benchmarks = [name.strip() for name in options["only"].split(",") if name.strip()]
+        unknown = set(benchmarks) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}.")
+        try:
+            log_entries = parse_scale(options["scale"])
+        except ValueError:
+            raise CommandError(f"Invalid scale '{options['scale']}'.")
+
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as handle:
+                baseline = json.load(handle)
+
+        self.use_benchmark_database(options["database_name"])
+        self.stdout.write(f"Benchmark database: {connection.settings_dict['NAME']}")
+
+        if options["reseed"]:
+            reset_database()
+        if not LogEntry.objects.exists():
+            self.stdout.write(f"Seeding {log_entries:,} log entries...")
+            seed_database(log_entries, stdout=self.stdout)
+        else:
+            self.stdout.write(
+                f"Reusing the existing data (about {estimated_count(LogEntry.objects.all()):,} log entries); "
+                "pass --reseed to change scale."
+            )
+
+        report = run_suite(
+            options["batch_sizes"], options["bans"], options["repeat"],
+            seed=options["seed"], benchmarks=benchmarks, stdout=self.stdout,
+        )
+        report["environment"]["options"] = {
+            key: options[key] for key in ("scale", "repeat", "seed", "batch_sizes", "bans")
+        }
+
+        self.print_results(report)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressed = self.print_comparison(baseline, report, options["threshold"])
+            if regressed and options["fail_on_regression"]:
+                raise CommandError(f"{regressed} benchmark(s) regressed by more than {options['threshold']}%.")
+
+    def use_benchmark_database(self, name):
+        """Switches the default connection to a separate database, creating and migrating it if needed."""
+        configured = settings.DATABASES['default']['NAME']
+        if name == configured:
+            raise CommandError("The benchmark database must not be the configured database.")
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        test_settings["NAME"] = name or f"{configured}_bench"
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=True)
+
+    def print_results(self, report):
+        self.stdout.write(f"{'benchmark':<48} {'median ms':>10} {'p95 ms':>10} {'stdev':>8} {'queries':>8}")
+        for name, stats in report["results"].items():
+            line = (
+                f"{name:<48} {stats['median']:>10.2f} {stats['p95']:>10.2f} "
+                f"{stats['stdev']:>8.2f} {stats.get('queries', ''):>8}"
+            )
+            if "entries_per_second" in stats:
+                line += f"   {stats['entries_per_second']:,.0f} entries/s"
+            self.stdout.write(line)
+
+    def print_comparison(self, baseline, report, threshold):
+        """Prints the change in each median against the baseline and returns the number of regressions."""
+        if baseline.get("environment", {}).get("log_entries") != report["environment"]["log_entries"]:
+            self.stdout.write(self.style.WARNING("The baseline was run at a different scale."))
+        regressed = 0
+        for name, before, after, change, is_regression in compare_results(baseline, report, threshold):
+            line = f"{name:<48} {before:>10.2f} -> {after:>10.2f} ms  {change:+.1f}%"
+            if is_regression:
+                regressed += 1
+                line = self.style.ERROR(line + "  REGRESSION")
+            self.stdout.write(line)
+        return regressed
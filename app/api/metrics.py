@@ -0,0 +1,389 @@
+"""
+In-process metrics in the Prometheus text format, served at /metrics.
+
+Counters and histograms live in memory in each process, so recording one
+is a dictionary update under a lock. Gunicorn runs several worker
+processes, and a scrape only reaches one of them. To cover that, every
+process writes a snapshot of its metrics to METRICS_DIR at most every
+METRICS_WRITE_INTERVAL seconds, after a response has been sent. /metrics
+then adds up the snapshots of every process, with its own live values in
+place of its snapshot. When a process exits, its last snapshot is folded
+into a shared file, so counters never go backwards. Snapshot files are
+named by process ID and start time, so a new process that reuses the ID of
+an exited one neither overwrites its snapshot nor keeps it from being
+folded in.
+"""
+import atexit
+import contextlib
+import contextvars
+import fcntl
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_metrics = {}
+_written_at = 0.0
+
+ARCHIVE_FILE = 'exited.json'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+class Counter:
+    """A value per label combination that only goes up."""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        _metrics[name] = self
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with _lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+    def merge(self, values, other):
+        """Adds another process' snapshot values to values."""
+        for labels, value in other:
+            labels = tuple(labels)
+            values[labels] = values.get(labels, 0) + value
+
+    def samples(self, values):
+        for labels, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, labels)), value
+
+    def clear(self):
+        with _lock:
+            self._values = {}
+
+
+class Histogram(Counter):
+    """Observations counted into cumulative buckets, with their sum and count, per label combination."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value, *labels):
+        with _lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # One count per bucket, then +Inf, then the sum.
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        with _lock:
+            return [[list(labels), list(counts)] for labels, counts in self._values.items()]
+
+    def merge(self, values, other):
+        for labels, counts in other:
+            labels = tuple(labels)
+            merged = values.setdefault(labels, [0] * len(counts))
+            for index, count in enumerate(counts):
+                merged[index] += count
+
+    def samples(self, values):
+        bounds = [format_value(bound) for bound in self.buckets] + ['+Inf']
+        for labels, counts in sorted(values.items()):
+            labels = dict(zip(self.labels, labels))
+            total = 0
+            for bound, count in zip(bounds, counts):
+                total += count
+                yield f'{self.name}_bucket', {**labels, 'le': bound}, total
+            yield f'{self.name}_sum', labels, counts[-1]
+            yield f'{self.name}_count', labels, total
+
+
+def timed(histogram, *labels):
+    """Decorator observing the duration of every call in histogram."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *labels)
+        return wrapper
+    return decorator
+
+
+HTTP_REQUESTS = Counter(
+    'alarm_http_requests_total', 'Requests handled, by view, method and status code.', ('view', 'method', 'status'),
+)
+HTTP_DURATION = Histogram(
+    'alarm_http_request_duration_seconds', 'Time to produce a response, by view.', ('view',),
+)
+HTTP_QUERIES = Histogram(
+    'alarm_http_request_db_queries', 'Database queries per request, by view.', ('view',),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+HTTP_QUERY_DURATION = Histogram(
+    'alarm_http_request_db_duration_seconds', 'Time spent in database queries per request, by view.', ('view',),
+)
+LOG_ENTRIES_PARSED = Counter('alarm_log_entries_parsed_total', 'Submitted log records parsed into log entries.')
+LOG_ENTRIES_REJECTED = Counter(
+    'alarm_log_entries_rejected_total', 'Submitted log records that failed validation, rejecting their batch.',
+)
+LOG_ENTRIES_SKIPPED = Counter(
+    'alarm_log_entries_skipped_total', 'Submitted log records without a source IP, which are not stored.',
+)
+LOG_ENTRIES_INSERTED = Counter('alarm_log_entries_inserted_total', 'Log entries written to the database.')
+LOG_BATCHES_REJECTED = Counter(
+    'alarm_log_batches_rejected_total', 'Log submissions answered with an error.', ('reason',),
+)
+LOG_BATCH_SIZE = Histogram(
+    'alarm_log_batch_size', 'Log entries per accepted submission.', buckets=BATCH_SIZE_BUCKETS,
+)
+DETECTOR_DURATION = Histogram(
+    'alarm_detector_duration_seconds', 'Time spent in brute-force detection, by detector.', ('detector',),
+)
+DASHBOARD_SNAPSHOT_DURATION = Histogram(
+    'alarm_dashboard_snapshot_build_seconds', 'Time to rebuild the dashboard snapshot.',
+)
+
+
+# Database queries of the current request: [count, seconds], or None outside a request.
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+def start_request():
+    """Starts counting the database queries of the current request; returns a token for finish_request."""
+    queries = [0, 0.0]
+    return _request_queries.set(queries), queries
+
+
+def finish_request(token):
+    _request_queries.reset(token)
+
+
+def count_query(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the current request's count and time."""
+    queries = _request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries[0] += 1
+        queries[1] += time.perf_counter() - started
+
+
+def install_query_counter(connection, **kwargs):
+    """Adds count_query to a new database connection. Connected to connection_created."""
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if value == int(value) and abs(value) < 1e15:
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render(name, documentation, metric_type, samples):
+    """Formats one metric family in the Prometheus text format."""
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}']
+    for sample, labels, value in samples:
+        if labels:
+            label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+            sample = f'{sample}{{{label_text}}}'
+        lines.append(f'{sample} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot():
+    """Returns every metric's values in this process, as JSON-serialisable data."""
+    return {name: metric.snapshot() for name, metric in _metrics.items()}
+
+
+def _start_time(pid):
+    """
+    Returns when a process started, in clock ticks since boot, or None if it is not known.
+
+    :param pid: Process ID, or 'self'
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as file:
+            # Fields resume after the parenthesised command name, which may contain spaces.
+            return int(file.read().rpartition(')')[2].split()[19])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _snapshot_filename():
+    """Name of this process' snapshot file: <pid>-<start time>.json."""
+    return f'{os.getpid()}-{_start_time("self") or 0}.json'
+
+
+def _parse_snapshot_filename(filename):
+    """
+    Returns the (pid, start time) of a snapshot file name, or None for other files.
+
+    Files named by process ID alone get a start time of 0, which matches any process with that ID.
+    """
+    pid, _, started = filename[:-len('.json')].partition('-')
+    if not filename.endswith('.json') or not pid.isdigit() or not (started.isdigit() or not started):
+        return None
+    return int(pid), int(started or 0)
+
+
+def write_snapshot(directory):
+    """Replaces this process' snapshot file with its current values."""
+    global _written_at
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, _snapshot_filename())
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(snapshot(), file)
+    os.replace(temporary, path)
+    _written_at = time.monotonic()
+
+
+def write_snapshot_if_due(**kwargs):
+    """Writes this process' snapshot if it is older than METRICS_WRITE_INTERVAL. Connected to request_finished."""
+    if time.monotonic() - _written_at < settings.METRICS_WRITE_INTERVAL:
+        return
+    try:
+        write_snapshot(settings.METRICS_DIR)
+    except OSError:
+        logger.exception("Failed to write metrics to %s", settings.METRICS_DIR)
+
+
+@atexit.register
+def write_final_snapshot():
+    """Writes this process' last values when it exits, if it ever wrote any."""
+    if _written_at:
+        try:
+            write_snapshot(settings.METRICS_DIR)
+        except OSError:
+            logger.exception("Failed to write metrics to %s on exit", settings.METRICS_DIR)
+
+
+def _read(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_running(pid, started):
+    """True if the process with this ID and start time is still running, rather than a later one reusing the ID."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    current = _start_time(pid)
+    return not started or current is None or current == started
+
+
+def _merge_into(totals, data):
+    for name, values in data.items():
+        metric = _metrics.get(name)
+        if metric is not None:
+            metric.merge(totals.setdefault(name, {}), values)
+
+
+@contextlib.contextmanager
+def _locked(directory):
+    """Holds an exclusive flock on directory while exited processes are archived or snapshots are read."""
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _archive_exited(directory):
+    """Folds the snapshots of processes that have exited into the archive file. Call with the directory _locked."""
+    exited = []
+    for filename in os.listdir(directory):
+        process = _parse_snapshot_filename(filename)
+        if process is not None and not _is_running(*process):
+            exited.append(os.path.join(directory, filename))
+    if not exited:
+        return
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    totals = {}
+    for path in [archive_path] + exited:
+        _merge_into(totals, _read(path))
+    archive = {
+        name: [[list(labels), value] for labels, value in values.items()] for name, values in totals.items()
+    }
+    temporary = f'{archive_path}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(archive, file)
+    os.replace(temporary, archive_path)
+    for path in exited:
+        os.remove(path)
+
+
+def collect(directory):
+    """
+    Adds up the metrics of every process that has written to directory, and this one.
+
+    :return: Dict of metric name to {labels tuple: value}
+    """
+    totals = {}
+    own_file = _snapshot_filename()
+    if os.path.isdir(directory):
+        # Read under the lock, so an exited process is never counted both in its file and in the archive.
+        with _locked(directory):
+            try:
+                _archive_exited(directory)
+            except OSError:
+                logger.exception("Failed to archive exited processes' metrics in %s", directory)
+            for filename in os.listdir(directory):
+                if filename.endswith('.json') and filename != own_file:
+                    _merge_into(totals, _read(os.path.join(directory, filename)))
+    _merge_into(totals, snapshot())
+    return totals
+
+
+def render_collected(directory):
+    """Returns the text exposition of every registered metric, added up over all processes."""
+    totals = collect(directory)
+    return ''.join(
+        render(name, metric.documentation, metric.type, metric.samples(totals.get(name, {})))
+        for name, metric in _metrics.items()
+    )
+
+
+def clear():
+    """Resets every metric in this process."""
+    for metric in _metrics.values():
+        metric.clear()
@@ -0,0 +1,53 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+
+
+class MetricsMiddleware:
+    """
+    Records each request's count, latency, database queries and query time, labelled by view.
+
+    Requests that match no URL are labelled "unmatched", so unknown paths
+    cannot create new label values.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token, queries = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        token, queries = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    def record(self, request, response, duration, queries):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        metrics.HTTP_REQUESTS.inc(view, request.method, str(response.status_code))
+        metrics.HTTP_DURATION.observe(duration, view)
+        metrics.HTTP_QUERIES.observe(queries[0], view)
+        metrics.HTTP_QUERY_DURATION.observe(queries[1], view)
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:11
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Alert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('severity', models.CharField(choices=[('INFO', 'Info'), ('WARNING', 'Warning'), ('ERROR', 'Error'), ('CRITICAL', 'Critical')], default='INFO', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('is_read', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BlockedIP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.GenericIPAddressField(unique=True)),
+                ('banned_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('reason', models.TextField(blank=True, null=True)),
+                ('currently_banned', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InstallToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('is_used', models.BooleanField(default=False)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('source_ip', models.GenericIPAddressField()),
+                ('action', models.CharField(max_length=100)),
+                ('source', models.CharField(default='fail2ban', max_length=50)),
+                ('host', models.CharField(default='unknown', max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ManagedDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unique_id', models.CharField(max_length=255, unique=True)),
+                ('hostname', models.CharField(max_length=255)),
+                ('ip_address', models.GenericIPAddressField()),
+                ('os', models.CharField(max_length=100)),
+                ('last_check_in', models.DateTimeField(default=django.utils.timezone.now)),
+                ('status', models.CharField(default='Healthy', max_length=50)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SystemScript',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(choices=[('install', 'Install Script'), ('uninstall', 'Uninstall Script')], max_length=20, unique=True)),
+                ('content', models.TextField()),
+                ('last_updated', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
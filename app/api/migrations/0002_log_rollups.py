@@ -0,0 +1,43 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyLogCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('action', models.CharField(max_length=100)),
+                ('host', models.CharField(max_length=255)),
+                ('source_ip', models.GenericIPAddressField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HourlyLogCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('action', models.CharField(max_length=100)),
+                ('host', models.CharField(max_length=255)),
+                ('source_ip', models.GenericIPAddressField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='hourlylogcount',
+            constraint=models.UniqueConstraint(fields=('bucket', 'action', 'host', 'source_ip'), name='hourly_log_count_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailylogcount',
+            constraint=models.UniqueConstraint(fields=('bucket', 'action', 'host', 'source_ip'), name='daily_log_count_key'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:11
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # LogEntry and Alert can be very large; build indexes without blocking writes.
+    atomic = False
+
+    dependencies = [
+        ('api', '0002_log_rollups'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='alert',
+            index=models.Index(fields=['created_at'], name='alert_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='alert',
+            index=models.Index(fields=['severity', 'created_at'], name='alert_severity_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='blockedip',
+            index=models.Index(fields=['banned_at'], name='blockedip_banned_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='blockedip',
+            index=models.Index(condition=models.Q(('currently_banned', True)), fields=['ip_address'], name='blockedip_banned_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='blockedip',
+            index=models.Index(condition=models.Q(('currently_banned', False)), fields=['ip_address'], name='blockedip_unbanned_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='dailylogcount',
+            index=models.Index(fields=['action', 'bucket'], name='daily_log_count_action_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='hourlylogcount',
+            index=models.Index(fields=['action', 'bucket'], name='hourly_log_count_action_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='logentry',
+            index=models.Index(fields=['action', 'timestamp'], name='logentry_action_ts_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='logentry',
+            index=models.Index(fields=['timestamp', 'id'], name='logentry_ts_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='logentry',
+            index=models.Index(condition=models.Q(('action', 'Failed password')), fields=['timestamp', 'source_ip'], name='logentry_failed_ts_ip_idx'),
+        ),
+    ]
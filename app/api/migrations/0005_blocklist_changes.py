@@ -0,0 +1,39 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:19
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def seed_changes(apps, schema_editor):
+    """Records the current state of every blocked IP as the first blocklist versions."""
+    BlockedIP = apps.get_model('api', 'BlockedIP')
+    BlocklistChange = apps.get_model('api', 'BlocklistChange')
+    BlocklistChange.objects.bulk_create(
+        [
+            BlocklistChange(ip_address=ip_address, banned=banned, changed_at=banned_at)
+            for ip_address, banned, banned_at in BlockedIP.objects.order_by('banned_at', 'id').values_list(
+                'ip_address', 'currently_banned', 'banned_at'
+            ).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alert_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlocklistChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.GenericIPAddressField()),
+                ('banned', models.BooleanField()),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(seed_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:45
+
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Build the (field, id) indexes for keyset pagination before dropping the
+    # ones they replace, without blocking writes.
+    atomic = False
+
+    dependencies = [
+        ('api', '0006_log_spool_offset'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='alert',
+            index=models.Index(fields=['created_at', 'id'], name='alert_created_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='alert',
+            index=models.Index(fields=['severity', 'created_at', 'id'], name='alert_severity_created_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='blockedip',
+            index=models.Index(fields=['banned_at', 'id'], name='blockedip_banned_at_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='logentry',
+            index=models.Index(fields=['action', 'timestamp', 'id'], name='logentry_action_ts_id_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='alert',
+            name='alert_created_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='alert',
+            name='alert_severity_created_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='blockedip',
+            name='blockedip_banned_at_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='logentry',
+            name='logentry_action_ts_idx',
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.16 on 2026-10-18 21:02
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    # GIN indexes on a large LogEntry table take a while; build them without blocking writes.
+    atomic = False
+
+    dependencies = [
+        ('api', '0007_keyset_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='alert',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('title', 'message', config='english'), name='alert_search_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='logentry',
+            index=models.Index(fields=['source_ip'], name='logentry_source_ip_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='logentry',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('host'), name='text_pattern_ops'), name='logentry_host_prefix_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='logentry',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('host', 'action', 'source', config='simple'), name='logentry_search_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:46
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Heartbeats update ManagedDevice constantly; build the indexes without blocking them.
+    atomic = False
+
+    dependencies = [
+        ('api', '0008_search_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='manageddevice',
+            index=models.Index(fields=['last_check_in'], name='device_last_check_in_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='manageddevice',
+            index=models.Index(fields=['hostname', 'id'], name='device_hostname_id_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 21:29
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # Detection bans while the index builds; don't block those writes.
+    atomic = False
+
+    dependencies = [
+        ('api', '0009_device_health_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='blockedip',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('reason', config='english'), name='blockedip_reason_search_idx'),
+        ),
+    ]
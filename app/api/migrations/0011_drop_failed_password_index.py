@@ -0,0 +1,22 @@
+# Generated by Django 4.2.16 on 2026-10-18 23:05
+
+from django.contrib.postgres.operations import RemoveIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # Brute-force detection runs in memory on ingest, so nothing reads this
+    # index any more; drop it without blocking ingest.
+    atomic = False
+
+    dependencies = [
+        ('api', '0010_blocked_ip_search_index'),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='logentry',
+            name='logentry_failed_ts_ip_idx',
+        ),
+    ]
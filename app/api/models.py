@@ -1,8 +1,21 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils.timezone import now
 from django.utils import timezone
 import uuid
 
+
+def log_search_vector():
+    """Full-text vector of a LogEntry's host, action and source, as indexed by logentry_search_idx."""
+    return SearchVector('host', 'action', 'source', config='simple')
+
+
+def alert_search_vector():
+    """Full-text vector of an Alert's title and message, as indexed by alert_search_idx."""
+    return SearchVector('title', 'message', config='english')
+
 class LogEntry(models.Model):
     timestamp = models.DateTimeField()
     source_ip = models.GenericIPAddressField()
@@ -10,6 +23,21 @@ class LogEntry(models.Model):
     source = models.CharField(max_length=50, default='fail2ban')
     host = models.CharField(max_length=255, default='unknown')
 
+    class Meta:
+        indexes = [
+            # Dashboard counts and list filters: action = X AND timestamp in range,
+            # paged by (timestamp, id)
+            models.Index(fields=['action', 'timestamp', 'id'], name='logentry_action_ts_id_idx'),
+            # Newest-first listing of all entries, paged by (timestamp, id)
+            models.Index(fields=['timestamp', 'id'], name='logentry_ts_id_idx'),
+            # Search by address or prefix, as an inet range
+            models.Index(fields=['source_ip'], name='logentry_source_ip_idx'),
+            # Case-insensitive hostname prefix search
+            models.Index(OpClass(Upper('host'), name='text_pattern_ops'), name='logentry_host_prefix_idx'),
+            # Word search across host, action and source
+            GinIndex(log_search_vector(), name='logentry_search_idx'),
+        ]
+
 class ManagedDevice(models.Model):
     unique_id = models.CharField(max_length=255, unique=True)
     hostname = models.CharField(max_length=255)
@@ -18,6 +46,17 @@ class ManagedDevice(models.Model):
     last_check_in = models.DateTimeField(default=now)
     status = models.CharField(max_length=50, default="Healthy")
 
+    # Agent API views authenticate as the device itself (request.user).
+    is_authenticated = True
+
+    class Meta:
+        indexes = [
+            # Health status filters and sorting: last_check_in ranges
+            models.Index(fields=['last_check_in'], name='device_last_check_in_idx'),
+            # Default ordering of the managed devices page
+            models.Index(fields=['hostname', 'id'], name='device_hostname_id_idx'),
+        ]
+
     def __str__(self):
         return self.hostname
 
@@ -44,12 +83,27 @@ class Alert(models.Model):
     title = models.CharField(max_length=255)
     message = models.TextField()
     severity = models.CharField(max_length=10, choices=SEVERITY_CHOICES, default='INFO')
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=now)
     is_read = models.BooleanField(default=False)
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # Alert list, paged by (created_at, id) with or without a severity filter
+            models.Index(fields=['created_at', 'id'], name='alert_created_id_idx'),
+            models.Index(fields=['severity', 'created_at', 'id'], name='alert_severity_created_id_idx'),
+            # Full-text search on title and message
+            GinIndex(alert_search_vector(), name='alert_search_idx'),
+        ]
 
     def __str__(self):
         return f"[{self.severity}] {self.title}"
 
+def blocked_ip_search_vector():
+    """Full-text vector of a BlockedIP's reason, as indexed by blockedip_reason_search_idx."""
+    return SearchVector('reason', config='english')
+
+
 class SystemScript(models.Model):
     SCRIPT_CHOICES = [
         ("install", "Install Script"),
@@ -69,5 +123,64 @@ class BlockedIP(models.Model):
     reason = models.TextField(blank=True, null=True)
     currently_banned = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # Blocked IP list, paged by (banned_at, id)
+            models.Index(fields=['banned_at', 'id'], name='blockedip_banned_at_id_idx'),
+            # Blocklist sync reads each side of the ban flag separately
+            models.Index(fields=['ip_address'], name='blockedip_banned_idx', condition=models.Q(currently_banned=True)),
+            models.Index(fields=['ip_address'], name='blockedip_unbanned_idx', condition=models.Q(currently_banned=False)),
+            # Full-text search on the ban reason
+            GinIndex(blocked_ip_search_vector(), name='blockedip_reason_search_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.ip_address} - {'Banned' if self.currently_banned else 'Unbanned'}"
\ No newline at end of file
+        return f"{self.ip_address} - {'Banned' if self.currently_banned else 'Unbanned'}"
+
+class BlocklistChange(models.Model):
+    """One ban or unban of an IP. The id is the blocklist version that change produced."""
+    ip_address = models.GenericIPAddressField()
+    banned = models.BooleanField()
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"v{self.pk}: {'Ban' if self.banned else 'Unban'} {self.ip_address}"
+
+class LogSpoolOffset(models.Model):
+    """How far drain_log_spool has stored a spool segment, updated in the same transaction as the rows."""
+    segment = models.CharField(max_length=255, unique=True)
+    offset = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.segment}@{self.offset}"
+
+class LogEntryRollup(models.Model):
+    bucket = models.DateTimeField()
+    action = models.CharField(max_length=100)
+    host = models.CharField(max_length=255)
+    source_ip = models.GenericIPAddressField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"{self.bucket:%Y-%m-%d %H:%M} {self.action} {self.source_ip}@{self.host}: {self.count}"
+
+class HourlyLogCount(LogEntryRollup):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'action', 'host', 'source_ip'], name='hourly_log_count_key'),
+        ]
+        indexes = [
+            models.Index(fields=['action', 'bucket'], name='hourly_log_count_action_idx'),
+        ]
+
+class DailyLogCount(LogEntryRollup):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'action', 'host', 'source_ip'], name='daily_log_count_key'),
+        ]
+        indexes = [
+            models.Index(fields=['action', 'bucket'], name='daily_log_count_action_idx'),
+        ]
@@ -0,0 +1,129 @@
+import gzip
+import io
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from rest_framework.parsers import BaseParser, JSONParser
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Largest single NDJSON line or MessagePack object accepted, so a body
+# without record boundaries cannot be buffered in full.
+MAX_RECORD_SIZE = 1024 * 1024
+
+
+def decoded_stream(stream, parser_context):
+    """Wraps the request body so it is decompressed as it is read, according to Content-Encoding."""
+    request = (parser_context or {}).get('request')
+    encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower() if request is not None else ''
+
+    if encoding in ('', 'identity'):
+        return stream
+    if encoding in ('gzip', 'x-gzip'):
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if encoding == 'zstd' and zstandard is not None:
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(stream))
+    raise UnsupportedMediaType(encoding, detail=f"Unsupported Content-Encoding '{encoding}'.")
+
+
+class CompressedJSONParser(JSONParser):
+    """
+    JSONParser that also accepts gzip or zstd compressed bodies.
+
+    A JSON document has to be decoded in full, so the decompressed size is
+    capped at LOG_INGEST_MAX_DECOMPRESSED_SIZE.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        decoded = decoded_stream(stream, parser_context)
+        if decoded is stream:
+            return super().parse(stream, media_type, parser_context)
+
+        limit = settings.LOG_INGEST_MAX_DECOMPRESSED_SIZE
+        try:
+            body = decoded.read(limit + 1)
+        except (OSError, EOFError) as e:
+            raise ParseError(f"Invalid compressed body: {e}")
+        if len(body) > limit:
+            raise ParseError("Decompressed request body is too large.")
+        return super().parse(io.BytesIO(body), media_type, parser_context)
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON, optionally compressed.
+
+    Returns a generator that reads the body in LOG_INGEST_READ_CHUNK_SIZE
+    blocks and yields one record per line, so a batch never has to be held
+    in memory as a whole. Decoding errors are raised as ParseError while
+    the generator is consumed.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return self._records(decoded_stream(stream, parser_context), settings.LOG_INGEST_READ_CHUNK_SIZE)
+
+    def _records(self, stream, chunk_size):
+        line_number = 0
+        for line in self._lines(stream, chunk_size):
+            line_number += 1
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ParseError(f"Invalid JSON on line {line_number}: {e}")
+
+    def _lines(self, stream, chunk_size):
+        pending = b''
+        while True:
+            try:
+                block = stream.read(chunk_size)
+            except (OSError, EOFError) as e:
+                raise ParseError(f"Invalid compressed body: {e}")
+            if not block:
+                break
+            lines = (pending + block).split(b'\n')
+            pending = lines.pop()
+            if len(pending) > MAX_RECORD_SIZE:
+                raise ParseError("NDJSON line is too long.")
+            for line in lines:
+                if line.strip():
+                    yield line
+        if pending.strip():
+            yield pending
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses a stream of MessagePack objects, optionally compressed.
+
+    The body may hold one map per record, or arrays of them. Like
+    NDJSONParser this returns a generator that decodes the body in chunks.
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if msgpack is None:
+            raise UnsupportedMediaType(media_type, detail="MessagePack support is not installed.")
+        return self._records(decoded_stream(stream, parser_context), settings.LOG_INGEST_READ_CHUNK_SIZE)
+
+    def _records(self, stream, chunk_size):
+        unpacker = msgpack.Unpacker(
+            stream, raw=False, timestamp=3, read_size=chunk_size, max_buffer_size=MAX_RECORD_SIZE + chunk_size
+        )
+        try:
+            for item in unpacker:
+                if isinstance(item, list):
+                    yield from item
+                else:
+                    yield item
+        except (ValueError, msgpack.UnpackException, OSError, EOFError) as e:
+            raise ParseError(f"Invalid MessagePack body: {e}")
@@ -0,0 +1,293 @@
+"""
+Retention for LogEntry and Alert: expired rows are archived to files and deleted.
+
+purge_expired removes the rows of every whole UTC day older than the
+retention period, oldest day first. Before any log entries of a day are
+removed, that day's rollups are rebuilt from the raw rows, so login counts
+keep covering the day once they are gone. Rows are then deleted
+PURGE_BATCH_SIZE at a time, each batch in its own short transaction, and
+COPY (DELETE ... RETURNING ...) streams exactly the deleted rows into a new
+gzipped CSV part of the day's partition:
+
+    ARCHIVE_DIR/<model>/<YYYY-MM-DD>/part-00001.csv.gz
+
+A part is written under a temporary name, fsynced and renamed before its
+transaction commits. A crash can therefore leave rows both archived and in
+the table, but never in neither. Purging a day that already has parts first
+deletes the rows whose id is in one of them without archiving them again,
+and rehydrate_day skips rows whose id already exists, so such duplicates
+are harmless.
+
+rehydrate_day loads a day's parts back into its table for an investigation
+and holds the day, so purges leave it alone until the hold expires. The
+restored rows are then deleted again by the next purge, which finds them in
+the day's parts.
+"""
+import fcntl
+import gzip
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
+
+from .models import Alert, LogEntry
+from .rollups import ONE_DAY, floor_day, rebuild_rollups
+
+PART_PREFIX = 'part-'
+PART_SUFFIX = '.csv.gz'
+HOLD_FILE = 'hold'
+
+
+class ArchivedModel:
+    """A model whose rows expire, by the date in date_field, after the days in its retention setting."""
+
+    def __init__(self, model, date_field, retention_setting):
+        self.model = model
+        self.date_field = date_field
+        self.retention_setting = retention_setting
+
+    @property
+    def name(self):
+        return self.model._meta.model_name
+
+    @property
+    def retention(self):
+        """The retention period, or None if rows are kept forever."""
+        days = getattr(settings, self.retention_setting)
+        return timedelta(days=days) if days else None
+
+    @property
+    def columns(self):
+        return [field.column for field in self.model._meta.concrete_fields]
+
+
+LOG_ENTRIES = ArchivedModel(LogEntry, 'timestamp', 'LOG_ENTRY_RETENTION_DAYS')
+ALERTS = ArchivedModel(Alert, 'created_at', 'ALERT_RETENTION_DAYS')
+ARCHIVED_MODELS = {archived.name: archived for archived in (LOG_ENTRIES, ALERTS)}
+
+
+@contextmanager
+def archive_lock(directory):
+    """Holds an exclusive flock on directory, so only one purge or rehydration runs at a time."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def partition_path(directory, archived, day):
+    return os.path.join(directory, archived.name, f'{day:%Y-%m-%d}')
+
+
+def list_parts(partition):
+    """The part files of a partition, in the order they were written."""
+    if not os.path.isdir(partition):
+        return []
+    return sorted(
+        os.path.join(partition, filename) for filename in os.listdir(partition)
+        if filename.startswith(PART_PREFIX) and filename.endswith(PART_SUFFIX)
+    )
+
+
+def archived_days(directory, archived):
+    """The days of a model that have archive parts, oldest first."""
+    root = os.path.join(directory, archived.name)
+    if not os.path.isdir(root):
+        return []
+    days = []
+    for name in sorted(os.listdir(root)):
+        try:
+            day = datetime.strptime(name, '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+        except ValueError:
+            continue
+        if list_parts(os.path.join(root, name)):
+            days.append(day)
+    return days
+
+
+def held_until(partition):
+    """When the hold placed on a partition by rehydrate_day ends, or None."""
+    try:
+        with open(os.path.join(partition, HOLD_FILE)) as file:
+            return parse_datetime(file.read().strip())
+    except OSError:
+        return None
+
+
+def _sync_directory(path):
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+@contextmanager
+def _loaded_part(cursor, table, archive):
+    """
+    Loads an open part into a temporary table named archived_part, dropped on exit.
+
+    Must run inside a transaction, so a failure rolls the table back with it.
+
+    :return: The quoted column list of the part
+    """
+    quote = connection.ops.quote_name
+    # Parts name their columns, so archives written before a schema change still load.
+    columns = ', '.join(quote(column) for column in archive.readline().decode().strip().split(','))
+    cursor.execute(f"CREATE TEMPORARY TABLE archived_part AS SELECT {columns} FROM {table} WITH NO DATA")
+    cursor.copy_expert(f"COPY archived_part ({columns}) FROM STDIN WITH (FORMAT csv)", archive)
+    yield columns
+    cursor.execute("DROP TABLE archived_part")
+
+
+def _delete_archived_rows(archived, day, partition):
+    """
+    Deletes the rows of a day whose id is already in one of the day's parts, one part per transaction.
+
+    :return: Number of rows deleted
+    """
+    quote = connection.ops.quote_name
+    table = quote(archived.model._meta.db_table)
+    date_column = quote(archived.model._meta.get_field(archived.date_field).column)
+    pk = quote(archived.model._meta.pk.column)
+    deleted = 0
+    for path in list_parts(partition):
+        with gzip.open(path, 'rb') as archive:
+            with transaction.atomic(), connection.cursor() as cursor, _loaded_part(cursor, table, archive):
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE {date_column} >= %s AND {date_column} < %s "
+                    f"AND {pk} IN (SELECT {pk} FROM archived_part)",
+                    [day, day + ONE_DAY],
+                )
+                deleted += cursor.rowcount
+    return deleted
+
+
+def _archive_batch(archived, day, partition, batch_size):
+    """
+    Deletes up to batch_size of a day's rows and writes them to a new part.
+
+    :return: Number of rows deleted
+    """
+    quote = connection.ops.quote_name
+    table = quote(archived.model._meta.db_table)
+    date_column = quote(archived.model._meta.get_field(archived.date_field).column)
+    pk = quote(archived.model._meta.pk.column)
+    columns = ', '.join(quote(column) for column in archived.columns)
+
+    os.makedirs(partition, exist_ok=True)
+    parts = list_parts(partition)
+    number = int(os.path.basename(parts[-1])[len(PART_PREFIX):-len(PART_SUFFIX)]) + 1 if parts else 1
+    path = os.path.join(partition, f'{PART_PREFIX}{number:05d}{PART_SUFFIX}')
+    temporary = f'{path}.tmp'
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            # COPY takes no parameters, so the bounds are quoted by the driver first.
+            delete = cursor.mogrify(
+                f"DELETE FROM {table} WHERE {pk} IN ("
+                f"SELECT {pk} FROM {table} WHERE {date_column} >= %s AND {date_column} < %s "
+                f"ORDER BY {date_column}, {pk} LIMIT %s) RETURNING {columns}",
+                [day, day + ONE_DAY, batch_size],
+            ).decode()
+            with open(temporary, 'wb') as file:
+                with gzip.GzipFile(fileobj=file, mode='wb') as archive:
+                    cursor.copy_expert(f"COPY ({delete}) TO STDOUT WITH (FORMAT csv, HEADER)", archive)
+                file.flush()
+                os.fsync(file.fileno())
+            deleted = cursor.rowcount
+            if deleted:
+                os.replace(temporary, path)
+                _sync_directory(partition)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return deleted
+
+
+def purge_day(archived, day, directory, batch_size, pause=0):
+    """
+    Archives and deletes every row of a model dated on day.
+
+    Rows already in one of the day's parts, e.g. put back by rehydrate_day,
+    are deleted without being archived again.
+
+    :param pause: Seconds to sleep between batches, to leave the database room for other work
+    :return: Number of rows deleted
+    """
+    partition = partition_path(directory, archived, day)
+    if list_parts(partition):
+        total = _delete_archived_rows(archived, day, partition)
+    else:
+        if archived is LOG_ENTRIES:
+            rebuild_rollups(day, day + ONE_DAY)
+        total = 0
+
+    while True:
+        deleted = _archive_batch(archived, day, partition, batch_size)
+        total += deleted
+        if deleted < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
+
+
+def purge_expired(directory, batch_size, current_time=None, pause=0):
+    """
+    Archives and deletes the rows of every model older than its retention period, in whole UTC days.
+
+    Days held by rehydrate_day are skipped.
+
+    :return: Dict of model name to number of rows deleted
+    """
+    current_time = current_time or now()
+    purged = {}
+    with archive_lock(directory):
+        for name, archived in ARCHIVED_MODELS.items():
+            purged[name] = 0
+            if archived.retention is None:
+                continue
+            cutoff = floor_day(current_time - archived.retention)
+            rows = archived.model.objects.filter(**{f'{archived.date_field}__lt': cutoff})
+            oldest = rows.aggregate(oldest=Min(archived.date_field))['oldest']
+            while oldest is not None:
+                day = floor_day(oldest)
+                hold = held_until(partition_path(directory, archived, day))
+                if hold is None or hold <= current_time:
+                    purged[name] += purge_day(archived, day, directory, batch_size, pause)
+                rows = rows.filter(**{f'{archived.date_field}__gte': day + ONE_DAY})
+                oldest = rows.aggregate(oldest=Min(archived.date_field))['oldest']
+    return purged
+
+
+def rehydrate_day(archived, day, directory, hold_until):
+    """
+    Loads a day's archived rows back into their table and holds the day from purges until hold_until.
+
+    Rows whose id is already in the table are skipped. The rollups are left
+    alone, since they kept counting the rows while they were archived.
+
+    :return: Number of rows restored
+    """
+    quote = connection.ops.quote_name
+    table = quote(archived.model._meta.db_table)
+    pk = quote(archived.model._meta.pk.column)
+    partition = partition_path(directory, archived, day)
+    restored = 0
+    with archive_lock(directory):
+        for path in list_parts(partition):
+            with gzip.open(path, 'rb') as archive:
+                with transaction.atomic(), connection.cursor() as cursor, _loaded_part(cursor, table, archive) as columns:
+                    cursor.execute(
+                        f"INSERT INTO {table} ({columns}) SELECT {columns} FROM archived_part ON CONFLICT ({pk}) DO NOTHING"
+                    )
+                    restored += cursor.rowcount
+        if os.path.isdir(partition):
+            with open(os.path.join(partition, HOLD_FILE), 'w') as file:
+                file.write(hold_until.isoformat())
+    return restored
@@ -0,0 +1,186 @@
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+
+from .models import DailyLogCount, HourlyLogCount, LogEntry
+
+ROLLUP_KEY = ('bucket', 'action', 'host', 'source_ip')
+UPSERT_CHUNK_SIZE = 1000
+
+ONE_HOUR = timedelta(hours=1)
+ONE_DAY = timedelta(days=1)
+
+
+def floor_hour(value):
+    """Returns the start of the UTC hour containing value."""
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(value):
+    """Returns midnight UTC of the day containing value."""
+    return floor_hour(value).replace(hour=0)
+
+
+def ceil_hour(value):
+    bucket = floor_hour(value)
+    return bucket if bucket == value else bucket + ONE_HOUR
+
+
+def ceil_day(value):
+    bucket = floor_day(value)
+    return bucket if bucket == value else bucket + ONE_DAY
+
+
+def record_log_entries(entries):
+    """
+    Adds a batch of LogEntry objects to the hourly and daily rollups.
+
+    Should be called in the same transaction that stores the entries so the
+    rollups never disagree with the raw table.
+    """
+    hourly = Counter()
+    daily = Counter()
+    tally_log_entries(entries, hourly, daily)
+    write_rollup_counts(hourly, daily)
+
+
+def tally_log_entries(entries, hourly, daily):
+    """
+    Counts a batch of LogEntry objects into hourly and daily Counters keyed by ROLLUP_KEY.
+
+    Lets a caller storing several batches in one transaction add them all to
+    the rollups at once with write_rollup_counts.
+    """
+    for entry in entries:
+        hour = floor_hour(entry.timestamp)
+        hourly[(hour, entry.action, entry.host, entry.source_ip)] += 1
+        daily[(hour.replace(hour=0), entry.action, entry.host, entry.source_ip)] += 1
+
+
+def write_rollup_counts(hourly, daily):
+    """Adds Counters from tally_log_entries to the hourly and daily rollups."""
+    _increment(HourlyLogCount, hourly)
+    _increment(DailyLogCount, daily)
+
+
+def _increment(model, counts):
+    """Upserts counts into a rollup table, adding to any existing rows."""
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(column) for column in ROLLUP_KEY + ('count',))
+    key = ', '.join(connection.ops.quote_name(column) for column in ROLLUP_KEY)
+    count = connection.ops.quote_name('count')
+
+    # Rows are written in key order so concurrent batches touching the same
+    # buckets lock them in the same order and cannot deadlock.
+    rows = sorted(counts.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[start:start + UPSERT_CHUNK_SIZE]
+            placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * len(chunk))
+            params = [value for row_key, row_count in chunk for value in (*row_key, row_count)]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {placeholders} "
+                f"ON CONFLICT ({key}) DO UPDATE SET {count} = {table}.{count} + EXCLUDED.{count}",
+                params,
+            )
+
+
+def _bucket_range(start, end):
+    """Builds a Q for bucket >= start and bucket < end, where either bound may be None."""
+    condition = Q()
+    if start is not None:
+        condition &= Q(bucket__gte=start)
+    if end is not None:
+        condition &= Q(bucket__lt=end)
+    return condition
+
+
+def count_log_entries(action, start=None, end=None):
+    """
+    Counts entries with the given action in [start, end) using the rollups.
+
+    Whole days are read from the daily rollup, whole hours from the hourly
+    rollup, and only the partial hours at either edge of the range touch the
+    raw LogEntry table. Either bound may be None for an open range.
+    """
+    if start is not None and end is not None and ceil_hour(start) >= floor_hour(end):
+        return LogEntry.objects.filter(action=action, timestamp__gte=start, timestamp__lt=end).count()
+
+    raw = Q(pk__in=[])
+    hour_start = hour_end = None
+    if start is not None:
+        hour_start = ceil_hour(start)
+        raw |= Q(timestamp__gte=start, timestamp__lt=hour_start)
+    if end is not None:
+        hour_end = floor_hour(end)
+        raw |= Q(timestamp__gte=hour_end, timestamp__lt=end)
+
+    day_start = ceil_day(hour_start) if hour_start is not None else None
+    day_end = floor_day(hour_end) if hour_end is not None else None
+
+    if day_start is not None and day_end is not None and day_start >= day_end:
+        hourly = _bucket_range(hour_start, hour_end)
+        daily = None
+    else:
+        hourly = Q(pk__in=[])
+        if hour_start is not None:
+            hourly |= _bucket_range(hour_start, day_start)
+        if hour_end is not None:
+            hourly |= _bucket_range(day_end, hour_end)
+        daily = _bucket_range(day_start, day_end)
+
+    total = LogEntry.objects.filter(raw, action=action).count() if start is not None or end is not None else 0
+    total += HourlyLogCount.objects.filter(hourly, action=action).aggregate(total=Sum('count'))['total'] or 0
+    if daily is not None:
+        total += DailyLogCount.objects.filter(daily, action=action).aggregate(total=Sum('count'))['total'] or 0
+    return total
+
+
+def rebuild_rollups(start, end):
+    """
+    Recomputes the rollups for the whole days covering [start, end) from LogEntry.
+
+    Existing rollup rows for those days are replaced, so this is safe to run
+    repeatedly. Each day is rebuilt in its own transaction. Days with
+    archived log entries are skipped: their raw rows are gone, or only
+    partly rehydrated, so their rollups are the only full count.
+
+    :return: Number of days rebuilt
+    """
+    # Imported here because retention imports this module.
+    from .retention import LOG_ENTRIES, archived_days
+
+    archived = set(archived_days(settings.ARCHIVE_DIR, LOG_ENTRIES))
+    day = floor_day(start)
+    days = 0
+    while day < end:
+        if day not in archived:
+            with transaction.atomic():
+                _rebuild_day(day)
+            days += 1
+        day += ONE_DAY
+    return days
+
+
+def _rebuild_day(day):
+    next_day = day + ONE_DAY
+    HourlyLogCount.objects.filter(bucket__gte=day, bucket__lt=next_day).delete()
+    DailyLogCount.objects.filter(bucket=day).delete()
+
+    quote = connection.ops.quote_name
+    source = quote(LogEntry._meta.db_table)
+    columns = ', '.join(quote(column) for column in ROLLUP_KEY + ('count',))
+    grouping = ', '.join(quote(column) for column in ROLLUP_KEY[1:])
+    timestamp = quote('timestamp')
+    for model, unit in ((HourlyLogCount, 'hour'), (DailyLogCount, 'day')):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(model._meta.db_table)} ({columns}) "
+                f"SELECT date_trunc(%s, {timestamp} AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', {grouping}, COUNT(*) "
+                f"FROM {source} WHERE {timestamp} >= %s AND {timestamp} < %s "
+                f"GROUP BY 1, {grouping}",
+                [unit, day, next_day],
+            )
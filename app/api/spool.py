@@ -0,0 +1,245 @@
+"""
+Durable local spool for log ingestion.
+
+With LOG_SPOOL_ENABLED, LogView validates a batch, appends it to a spool
+file and acknowledges it once the file is fsynced, without touching the
+database. The drain_log_spool command stores spooled batches in LogEntry.
+
+Each worker process appends to its own segment file, named so that
+segments sort in creation order, and holds an exclusive flock on it while
+it is open. A segment whose lock can be taken has no writer left, so once
+it is drained it can be removed. Each line of a segment is one batch;
+a line without its newline was never acknowledged and is ignored.
+
+The drainer records how far it has got in LogSpoolOffset in the same
+transaction as the rows it stores, so a crash at any point replays
+exactly the batches that were not committed.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from . import metrics
+from .detection import detector
+from .ingest import build_log_entries, detect_brute_force, read_chunks, store_log_entries
+from .models import LogEntry, LogSpoolOffset
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.spool'
+
+
+def encode_batch(entries):
+    """Serialises validated LogEntry instances as one spool line."""
+    rows = [[entry.timestamp.isoformat(), entry.source_ip, entry.action, entry.host] for entry in entries]
+    return json.dumps(rows, separators=(',', ':')).encode() + b'\n'
+
+
+def decode_batch(line):
+    """Returns the unsaved LogEntry instances stored in a spool line."""
+    return [
+        LogEntry(timestamp=parse_datetime(timestamp), source_ip=source_ip, action=action, source="vector", host=host)
+        for timestamp, source_ip, action, host in json.loads(line)
+    ]
+
+
+class LogSpool:
+    """
+    Appends batches to the current process' segment in directory.
+
+    Appends from concurrent requests share fsyncs: while one request is
+    syncing, the others write their batch and wait, and the next fsync
+    covers all of them. A segment is closed and a new one started once it
+    exceeds segment_size bytes.
+    """
+
+    def __init__(self, directory, segment_size):
+        self.directory = directory
+        self.segment_size = segment_size
+        self._file = None
+        self._pid = None
+        self._written = 0
+        self._synced = 0
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def append(self, line):
+        """Writes one encoded batch and returns once it is on disk."""
+        with self._write_lock:
+            file = self._current_file()
+            file.write(line)
+            file.flush()
+            self._written += 1
+            ticket = self._written
+        self._sync(ticket)
+
+    def close(self):
+        """Syncs and closes the current segment, so the drainer can remove it once drained."""
+        with self._sync_lock, self._write_lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._close_file()
+
+    def _sync(self, ticket):
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return
+            with self._write_lock:
+                target = self._written
+                file = self._file
+            os.fsync(file.fileno())
+            self._synced = max(self._synced, target)
+
+            with self._write_lock:
+                if self._file is file and file.tell() >= self.segment_size:
+                    self._close_file()
+
+    def _current_file(self):
+        if self._pid != os.getpid():
+            # Forked from a process that had a segment open: leave that one to the parent.
+            if self._file is not None:
+                self._file.close()
+            self._file = None
+            self._pid = os.getpid()
+            self._written = self._synced = 0
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{time.time_ns():020d}-{os.getpid()}{SEGMENT_SUFFIX}")
+            # Locked before it gets its segment name, so the drainer never sees it unlocked.
+            file = open(f"{path}.new", 'ab')
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.rename(f"{path}.new", path)
+            self._file = file
+        return self._file
+
+    def _close_file(self):
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._synced = self._written
+
+
+log_spool = LogSpool(settings.LOG_SPOOL_DIR, settings.LOG_SPOOL_SEGMENT_SIZE)
+
+
+def spool_log_records(records, client_ip, spool=None):
+    """
+    Validates an iterable of records like ingest_log_records and appends them to the spool as one batch.
+
+    Nothing is written unless every record is valid.
+
+    :return: Number of records spooled
+    """
+    entries = []
+    for chunk in read_chunks(records):
+        entries.extend(build_log_entries(chunk, client_ip))
+    if entries:
+        (spool or log_spool).append(encode_batch(entries))
+    metrics.LOG_BATCH_SIZE.observe(len(entries))
+    return len(entries)
+
+
+def list_segments(directory):
+    """Returns the segment paths in directory, oldest first."""
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in names]
+
+
+def _read_batches(file, max_entries):
+    """
+    Reads complete lines from file until at least max_entries are collected.
+
+    :return: (entries, offset after the last complete line read)
+    """
+    entries = []
+    offset = file.tell()
+    while len(entries) < max_entries:
+        line = file.readline()
+        if not line.endswith(b'\n'):
+            break
+        offset += len(line)
+        entries.extend(decode_batch(line))
+    file.seek(offset)
+    return entries, offset
+
+
+def _writer_closed(file):
+    """True if no process holds the segment open for writing."""
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def drain_segment(path, batch_size):
+    """
+    Stores the batches of one segment, committing up to batch_size entries at a time.
+
+    Removes the segment and its offset once it is fully stored and its
+    writer has closed it.
+
+    :return: (number of entries stored, whether the segment was removed)
+    """
+    segment = os.path.basename(path)
+    offset = LogSpoolOffset.objects.get_or_create(segment=segment)[0].offset
+    stored = 0
+
+    with open(path, 'rb') as file:
+        # Checked before reading, so everything the writer wrote is visible.
+        closed = _writer_closed(file)
+        file.seek(offset)
+        while True:
+            start = offset
+            entries, offset = _read_batches(file, batch_size)
+            if not entries:
+                break
+            with transaction.atomic():
+                progress = LogSpoolOffset.objects.select_for_update().get(segment=segment)
+                if progress.offset != start:
+                    # Another drainer got here first; carry on from where it stopped.
+                    offset = progress.offset
+                    file.seek(offset)
+                    continue
+                store_log_entries(entries)
+                progress.offset = offset
+                progress.save(update_fields=['offset'])
+            stored += len(entries)
+            metrics.LOG_ENTRIES_INSERTED.inc(amount=len(entries))
+            detect_brute_force(detector.failures(entries))
+
+        if not closed:
+            return stored, False
+        if file.read():
+            logger.warning("Dropping incomplete batch at the end of %s", segment)
+
+    os.remove(path)
+    LogSpoolOffset.objects.filter(segment=segment).delete()
+    return stored, True
+
+
+def drain_spool(directory, batch_size):
+    """
+    Drains every segment in directory, oldest first.
+
+    :return: (number of entries stored, number of segments removed)
+    """
+    stored = removed = 0
+    for path in list_segments(directory):
+        try:
+            segment_stored, segment_removed = drain_segment(path, batch_size)
+        except FileNotFoundError:
+            # Removed by another drainer.
+            continue
+        stored += segment_stored
+        removed += segment_removed
+    return stored, removed
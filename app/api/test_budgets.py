@@ -0,0 +1,318 @@
+"""
+Performance budgets for the HTTP endpoints.
+
+QueryBudgetTests requests every endpoint through the full middleware stack
+and fails if it runs more database queries than QUERY_BUDGETS allows. Log
+ingestion is checked at several batch sizes against INGEST_QUERY_BUDGETS,
+so a query per log line shows up as soon as the batch grows. Deferred
+writes (heartbeats, alerts) are flushed after the response, and savepoints
+only exist because each test runs in a transaction, so neither is counted.
+
+LatencyBudgetTests seeds a database with api.benchmarks.seed_database and
+checks the median response time of the hot endpoints against
+LATENCY_BUDGETS. It is slow and depends on the load of the machine, so it
+only runs with ALARM_LATENCY_BUDGETS=1. Set ALARM_LATENCY_BUDGET_SCALE to
+loosen the budgets on slow machines, e.g. 3 for three times the budgets.
+
+When a budget is exceeded the failure lists the captured SQL with literals
+replaced by "?", as a diff against the smallest ingest batch for ingest,
+or with the queries over budget marked "+" for other endpoints.
+"""
+import difflib
+import os
+import re
+import uuid
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now, timedelta
+from rest_framework.test import APIClient
+
+from .authentication import device_token_cache
+from .benchmarks import measure, seed_database, set_seeded_bans
+from .blocklist import ban_ip, blocklist_snapshot, get_blocklist_version
+from .buffers import clear_buffers, flush_buffers_if_due
+from .detection import detector
+from .ingest import store_log_entries
+from .models import Alert, LogEntry, ManagedDevice
+from .utils import generate_device_tokens
+from . import metrics
+
+# Most database queries each endpoint may run, by endpoint name.
+QUERY_BUDGETS = {
+    'heartbeat': 1,
+    'token_refresh': 1,
+    'blocklist': 4,
+    'blocklist_since': 5,
+    'report_ban': 5,
+    'dashboard_home': 5,
+    'login_attempts': 2,
+    'login_attempts_search': 2,
+    'alerts': 2,
+    'blocked_ips': 2,
+    'managed_devices': 3,
+    'metrics': 4,
+}
+
+# Most database queries of one log submission, by number of log lines.
+INGEST_QUERY_BUDGETS = {1: 3, 10: 3, 100: 3, 1000: 3}
+
+# Largest median response time in milliseconds, by endpoint name.
+LATENCY_BUDGETS = {
+    'ingest[100]': 150,
+    'ingest[1000]': 750,
+    'heartbeat': 20,
+    'blocklist': 20,
+    'blocklist_since': 50,
+    'dashboard_home': 300,
+    'dashboard_home_cached': 50,
+    'login_attempts': 150,
+    'login_attempts_search': 250,
+    'alerts': 150,
+    'blocked_ips': 150,
+    'managed_devices': 250,
+    'metrics': 250,
+}
+RUN_LATENCY_BUDGETS = os.environ.get('ALARM_LATENCY_BUDGETS') == '1'
+LATENCY_BUDGET_SCALE = float(os.environ.get('ALARM_LATENCY_BUDGET_SCALE', '1'))
+LATENCY_REPEAT = 5
+
+SEED_LOG_ENTRIES = 100000
+SEED_BANS = 10000
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_COLUMNS = re.compile(r"\bSELECT (DISTINCT )?(?!… ).+? FROM ", re.S)
+_CURSOR = re.compile(r'"_django_curs_\w+"')
+_VALUES = re.compile(r"VALUES (\([^()]*\))(?:, \([^()]*\))+")
+_IN_LIST = re.compile(r"IN \((?:\?, )+\?\)")
+_SAVEPOINT = re.compile(r"(RELEASE |ROLLBACK TO )?SAVEPOINT ")
+
+
+def normalize_sql(sql):
+    """
+    Shortens a query to its shape: literals become ?, and selected columns, VALUES rows and IN lists are collapsed.
+    """
+    sql = _NUMBER.sub('?', _STRING.sub('?', _CURSOR.sub('"_django_curs"', sql)))
+    sql = _COLUMNS.sub(lambda match: f"SELECT {match.group(1) or ''}… FROM ", sql)
+    sql = _VALUES.sub(r"VALUES \1, …", sql)
+    return _IN_LIST.sub('IN (…)', sql)
+
+
+def counted_queries(captured):
+    """The captured query dicts that count against a budget, without savepoints."""
+    return [query for query in captured.captured_queries if not _SAVEPOINT.match(query['sql'])]
+
+
+def describe_queries(captured, budget, reference=None):
+    """
+    Formats captured queries for a failure message.
+
+    :param captured: Query dicts from CaptureQueriesContext
+    :param budget: Number of queries allowed
+    :param reference: Query dicts of a run within budget to diff against
+    :return: Unified diff against reference, or every query with those over budget marked "+"
+    """
+    shapes = [normalize_sql(query['sql']) for query in captured]
+    if reference is not None:
+        expected = [normalize_sql(query['sql']) for query in reference]
+        diff = difflib.unified_diff(expected, shapes, 'within budget', 'captured', lineterm='', n=1)
+        return '\n'.join(diff)
+    return '\n'.join(
+        f"{'+' if index >= budget else ' '} {index + 1:>3}. [{float(query['time']) * 1000:.1f}ms] {shape}"
+        for index, (query, shape) in enumerate(zip(captured, shapes))
+    )
+
+
+class BudgetTestMixin:
+    """Requests endpoints as an agent or an operator, with the write-behind flushes disconnected."""
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        metrics.clear()
+        device_token_cache.clear()
+        detector.reset()
+        clear_buffers()
+        blocklist_snapshot.clear()
+        self.addCleanup(clear_buffers)
+        self.addCleanup(blocklist_snapshot.clear)
+        self.addCleanup(metrics.clear)
+        request_finished.disconnect(dispatch_uid='api.flush_buffers')
+        self.addCleanup(request_finished.connect, flush_buffers_if_due, dispatch_uid='api.flush_buffers')
+
+        self.device = ManagedDevice.objects.create(
+            unique_id=str(uuid.uuid4()), hostname='budget-device', ip_address='192.168.1.100', os='Linux',
+            last_check_in=now(), status='Healthy',
+        )
+        self.tokens = generate_device_tokens(self.device.unique_id)
+
+    def endpoints(self):
+        """The request for each endpoint in QUERY_BUDGETS, as (method, path, kwargs)."""
+        agent = {'HTTP_AUTHORIZATION': f"Bearer {self.tokens['access']}"}
+        return {
+            'heartbeat': ('post', '/api/device/heartbeat/', agent),
+            'token_refresh': (
+                'post', '/api/device/token/refresh/', {'HTTP_AUTHORIZATION': f"Bearer {self.tokens['refresh']}"},
+            ),
+            'blocklist': ('get', '/api/blocklist/', {'HTTP_ACCEPT_ENCODING': 'gzip'}),
+            'blocklist_since': ('get', f'/api/blocklist/?since={max(get_blocklist_version() - 5, 0)}', {}),
+            'report_ban': ('post', '/api/report_ban/', {'data': {'ip': '198.18.0.1', 'reason': 'Budget'}, 'format': 'json'}),
+            'dashboard_home': ('get', '/dashboard/', {}),
+            'login_attempts': ('get', '/dashboard/login-attempts/', {}),
+            'login_attempts_search': ('get', '/dashboard/login-attempts/?q=10.1.', {}),
+            'alerts': ('get', '/dashboard/alerts/', {}),
+            'blocked_ips': ('get', '/dashboard/blocked-ips/', {}),
+            'managed_devices': ('get', '/dashboard/managed-devices/', {}),
+            'metrics': ('get', '/metrics', {}),
+        }
+
+    def request(self, method, path, **kwargs):
+        response = getattr(self.client, method)(path, **kwargs)
+        self.assertLess(response.status_code, 400, f"{method.upper()} {path} answered {response.status_code}")
+        return response
+
+    def log_batch(self, size, offset=0):
+        """Log lines from distinct addresses, too few per address to trigger detection."""
+        timestamp = now().isoformat()
+        return [
+            {
+                'message': (
+                    f"Failed password for root from 198.18.{n // 250 % 250}.{n % 250 + 1} port 22 ssh2" if n % 3
+                    else f"Accepted password for deploy from 198.19.{n // 250 % 250}.{n % 250 + 1} port 22 ssh2"
+                ),
+                'timestamp': timestamp,
+                'host': self.device.hostname,
+            }
+            for n in range(offset, offset + size)
+        ]
+
+    def post_logs(self, size, offset=0):
+        return self.request(
+            'post', '/api/logs/', data=self.log_batch(size, offset), format='json',
+            HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}",
+        )
+
+
+@override_settings(LOG_SPOOL_ENABLED=False)
+class QueryBudgetTests(BudgetTestMixin, TestCase):
+    """Database queries per request, against a few rows of everything each page lists."""
+
+    def setUp(self):
+        super().setUp()
+        current_time = now()
+        store_log_entries([
+            LogEntry(
+                timestamp=current_time - timedelta(minutes=i), source_ip=f"10.1.{i % 4}.{i + 1}",
+                action='Failed password' if i % 2 else 'Accepted password', source='vector', host=f"host-{i % 3}",
+            )
+            for i in range(40)
+        ])
+        Alert.objects.bulk_create([
+            Alert(title=f"Alert {i}", message="Budget", severity='WARNING' if i % 2 else 'INFO')
+            for i in range(20)
+        ])
+        ManagedDevice.objects.bulk_create([
+            ManagedDevice(unique_id=f"budget-{i}", hostname=f"host-{i}", ip_address=f"10.2.0.{i + 1}", os='Linux',
+                          last_check_in=current_time - timedelta(minutes=i), status='Healthy')
+            for i in range(20)
+        ])
+        for i in range(20):
+            ban_ip(f"172.16.0.{i + 1}", 'Budget')
+        blocklist_snapshot.clear()
+
+    def assertQueryBudget(self, name, budget, run, reference=None):
+        with CaptureQueriesContext(connection) as captured:
+            run()
+        queries = counted_queries(captured)
+        if len(queries) > budget:
+            self.fail(
+                f"{name} ran {len(queries)} queries, over its budget of {budget}:\n"
+                f"{describe_queries(queries, budget, reference)}"
+            )
+        return queries
+
+    def test_endpoint_query_budgets(self):
+        """Every endpoint stays within QUERY_BUDGETS with its caches cleared."""
+        for name, (method, path, kwargs) in self.endpoints().items():
+            with self.subTest(endpoint=name):
+                cache.clear()
+                device_token_cache.clear()
+                blocklist_snapshot.clear()
+                self.assertQueryBudget(name, QUERY_BUDGETS[name], lambda: self.request(method, path, **kwargs))
+
+    def test_ingest_query_budgets(self):
+        """A log submission's query count does not grow with the batch size."""
+        self.post_logs(1, offset=50000)
+        reference = None
+        offset = 0
+        for size, budget in sorted(INGEST_QUERY_BUDGETS.items()):
+            with self.subTest(batch_size=size):
+                captured = self.assertQueryBudget(
+                    f"POST /api/logs/ with {size} lines", budget, lambda: self.post_logs(size, offset), reference,
+                )
+                reference = reference if reference is not None else captured
+            offset += size
+
+    def test_normalized_query_diff(self):
+        """Failure messages show query shapes, so repeated queries line up in the diff."""
+        reference = [{'sql': 'INSERT INTO "t" ("a", "b") VALUES (1, \'x\')', 'time': '0.001'}]
+        captured = reference + [
+            {'sql': f'SELECT "t"."a", "t"."b" FROM "t" WHERE "t"."id" IN ({i}, {i + 1})', 'time': '0.002'}
+            for i in range(2)
+        ]
+        self.assertEqual(normalize_sql(captured[0]['sql']), 'INSERT INTO "t" ("a", "b") VALUES (?, ?)')
+        self.assertEqual(normalize_sql(captured[1]['sql']), 'SELECT … FROM "t" WHERE "t"."id" IN (…)')
+        diff = describe_queries(captured, 1, reference).splitlines()
+        self.assertEqual(diff[-2:], ['+SELECT … FROM "t" WHERE "t"."id" IN (…)'] * 2)
+        listing = describe_queries(captured, 2).splitlines()
+        self.assertTrue(listing[1].startswith('    2.'))
+        self.assertTrue(listing[2].startswith('+   3.'))
+
+
+@skipUnless(RUN_LATENCY_BUDGETS, "Set ALARM_LATENCY_BUDGETS=1 to check the latency budgets.")
+@skipUnless(connection.vendor == 'postgresql', "Latency budgets are only checked on PostgreSQL.")
+@override_settings(LOG_SPOOL_ENABLED=False)
+class LatencyBudgetTests(BudgetTestMixin, TestCase):
+    """Median response times against a seeded database."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_database(SEED_LOG_ENTRIES)
+        set_seeded_bans(SEED_BANS)
+
+    def assertLatencyBudget(self, name, run, setup=None):
+        budget = LATENCY_BUDGETS[name] * LATENCY_BUDGET_SCALE
+        stats, _, _ = measure(run, LATENCY_REPEAT, setup=setup)
+        if stats['median'] > budget:
+            with CaptureQueriesContext(connection) as captured:
+                if setup:
+                    setup()
+                run()
+            slowest = sorted(counted_queries(captured), key=lambda query: -float(query['time']))
+            self.fail(
+                f"{name} took {stats['median']:.1f}ms (median of {stats['n']}, p95 {stats['p95']:.1f}ms), "
+                f"over its budget of {budget:.0f}ms. Queries, slowest first:\n"
+                f"{describe_queries(slowest, len(slowest))}"
+            )
+
+    def test_endpoint_latency_budgets(self):
+        endpoints = self.endpoints()
+        del endpoints['token_refresh'], endpoints['report_ban']
+        for name, (method, path, kwargs) in endpoints.items():
+            with self.subTest(endpoint=name):
+                # The dashboard snapshot is rebuilt on every call unless the cached page is being measured.
+                setup = cache.clear if name == 'dashboard_home' else None
+                self.assertLatencyBudget(name, lambda: self.request(method, path, **kwargs), setup)
+        with self.subTest(endpoint='dashboard_home_cached'):
+            self.assertLatencyBudget('dashboard_home_cached', lambda: self.request('get', '/dashboard/'))
+
+    def test_ingest_latency_budgets(self):
+        offsets = iter(range(0, 100000, 1000))
+        for size in (100, 1000):
+            with self.subTest(batch_size=size):
+                self.assertLatencyBudget(f'ingest[{size}]', lambda: self.post_logs(size, next(offsets)))
@@ -0,0 +1,174 @@
+import re
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now, timedelta
+
+from dashboard import views as dashboard_views
+from dashboard.fleet import SORT_FIELDS, annotate_health, filter_devices, status_changes
+from dashboard.pagination import NEXT, encode_cursor
+from dashboard.snapshot import build_dashboard_snapshot, get_top_sources
+from .blocklist import get_blocklist
+from .models import LogEntry, Alert, BlockedIP, DailyLogCount, HourlyLogCount, ManagedDevice
+from .rollups import count_log_entries, rebuild_rollups
+
+LOG_ENTRY_ROWS = 60000
+ALERT_ROWS = 30000
+BLOCKED_IP_ROWS = 20000
+DEVICE_ROWS = 20000
+
+
+@skipUnless(connection.vendor == 'postgresql', "Query plans are only checked on PostgreSQL.")
+class QueryPlanTests(TestCase):
+    """
+    Runs the hot query functions against seeded tables, EXPLAINs every
+    SELECT they send and fails if any of them falls back to a sequential
+    scan. The queries come from the functions the application calls, so a
+    change to them is checked without updating the test.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """Seed large tables server-side and refresh planner statistics."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO api_logentry (timestamp, source_ip, action, source, host)
+                SELECT now() - i * interval '2 minutes',
+                       ('10.' || i % 250 || '.' || (i / 250) % 250 || '.' || i % 7 + 1)::inet,
+                       CASE WHEN i % 10 < 7 THEN 'Failed password' WHEN i % 10 < 9 THEN 'Accepted password' ELSE 'Unknown' END,
+                       'vector',
+                       'host-' || i % 50
+                FROM generate_series(1, {LOG_ENTRY_ROWS}) AS i
+                """
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO api_alert (title, message, severity, created_at, is_read, count)
+                SELECT 'Alert ' || i % 20, 'Seeded alert ' || i,
+                       CASE WHEN i % 50 = 0 THEN 'CRITICAL' WHEN i % 10 = 0 THEN 'WARNING' ELSE 'INFO' END,
+                       now() - i * interval '3 minutes', false, 1
+                FROM generate_series(1, {ALERT_ROWS}) AS i
+                """
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO api_blockedip (ip_address, banned_at, reason, currently_banned)
+                SELECT ('172.' || 16 + i / 65536 || '.' || (i / 256) % 256 || '.' || i % 256)::inet,
+                       now() - i * interval '1 minute', 'Seeded', i % 20 <> 0
+                FROM generate_series(1, {BLOCKED_IP_ROWS}) AS i
+                """
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO api_manageddevice (unique_id, hostname, ip_address, os, last_check_in, status)
+                SELECT 'seeded-' || i, 'host-' || lpad(i::text, 5, '0'), ('10.200.' || i / 256 || '.' || i % 256)::inet,
+                       CASE WHEN i % 3 = 0 THEN 'Debian 12' ELSE 'Ubuntu 22.04' END,
+                       now() - i * interval '10 seconds', 'Healthy'
+                FROM generate_series(1, {DEVICE_ROWS}) AS i
+                """
+            )
+        rebuild_rollups(now() - timedelta(minutes=2 * LOG_ENTRY_ROWS), now() + timedelta(days=1))
+        with connection.cursor() as cursor:
+            for model in (LogEntry, Alert, BlockedIP, HourlyLogCount, ManagedDevice):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+    def explain(self, run):
+        """Calls run and returns (sql, plan) for every SELECT it sent to the database."""
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query['sql'].lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute(f"{connection.ops.explain_query_prefix()} {query['sql']}")
+                plans.append((query['sql'], "\n".join(row[0] for row in cursor.fetchall())))
+        self.assertTrue(plans, "No SELECT was run.")
+        return plans
+
+    def assertNoSeqScan(self, run, allow=()):
+        """Fails if a SELECT sent by run scans a table sequentially, other than the tables in allow."""
+        for sql, plan in self.explain(run):
+            scanned = re.findall(r'Seq Scan on (\w+)', plan)
+            self.assertFalse(set(scanned) - set(allow), f"Sequential scan in plan for:\n{sql}\n\n{plan}")
+
+    def assertUsesIndex(self, index, run):
+        plans = self.explain(run)
+        self.assertTrue(
+            any(index in plan for _, plan in plans),
+            f"{index} is not used by:\n" + "\n\n".join(f"{sql}\n{plan}" for sql, plan in plans),
+        )
+
+    def render(self, view, path, params=None):
+        """Returns a function that renders a dashboard view for a GET request."""
+        request = RequestFactory().get(path, params or {})
+        return lambda: view(request)
+
+    def deep_cursor(self, model, field):
+        """A cursor a few thousand rows into a list, as a browser following "next" would send."""
+        deep = model.objects.order_by(f'-{field}', '-id')[5000 if model is not Alert else 500]
+        return encode_cursor(NEXT, (getattr(deep, field).isoformat(), deep.pk))
+
+    def test_partial_hour_count(self):
+        current_time = now()
+        self.assertNoSeqScan(lambda: count_log_entries(
+            'Failed password', current_time - timedelta(hours=5, minutes=40), current_time - timedelta(minutes=20)
+        ))
+
+    def test_dashboard_snapshot(self):
+        """
+        Counts, hourly charts and top sources of the home page come from the rollups and the action index.
+
+        Only the all-time totals read the whole daily rollup, which is what they are for.
+        """
+        self.assertNoSeqScan(build_dashboard_snapshot, allow=(DailyLogCount._meta.db_table,))
+
+    def test_top_sources(self):
+        current_time = now()
+        self.assertNoSeqScan(lambda: list(get_top_sources('Failed password', current_time - timedelta(days=1), current_time)))
+
+    def test_lists(self):
+        """First pages, pages deep into each list and filtered pages seek through the (field, id) indexes."""
+        for view, path, model, field, filters in (
+            (dashboard_views.login_attempt_list, '/dashboard/login-attempts/', LogEntry, 'timestamp',
+             {'action': 'Accepted password'}),
+            (dashboard_views.alerts_view, '/dashboard/alerts/', Alert, 'created_at', {'severity': 'CRITICAL'}),
+            (dashboard_views.blocked_ips, '/dashboard/blocked-ips/', BlockedIP, 'banned_at', {}),
+        ):
+            for params in ({}, {'cursor': self.deep_cursor(model, field)}, filters):
+                with self.subTest(path=path, params=params):
+                    self.assertNoSeqScan(self.render(view, path, params))
+
+    def test_search(self):
+        """Each kind of search term is answered from an index."""
+        for query in ('10.3.', '10.3.4.1', 'host-4', 'unknown', 'host:host-17', 'action:accepted', 'source:vector'):
+            with self.subTest(query=query):
+                self.assertNoSeqScan(self.render(dashboard_views.login_attempt_list, '/dashboard/login-attempts/', {'q': query}))
+        self.assertNoSeqScan(self.render(dashboard_views.alerts_view, '/dashboard/alerts/', {'q': 'seeded 2999'}))
+        for query in ('172.16.1.', '172.16.0.0/20', 'manual'):
+            with self.subTest(query=query):
+                self.assertNoSeqScan(self.render(dashboard_views.blocked_ips, '/dashboard/blocked-ips/', {'q': query}))
+
+    def test_blocklist(self):
+        """The blocklist reads each side of the ban flag from its partial index."""
+        self.assertUsesIndex('blockedip_banned_idx', get_blocklist)
+        self.assertUsesIndex('blockedip_unbanned_idx', get_blocklist)
+
+    def test_managed_devices(self):
+        """Status filters and sorted pages of the fleet view use the device indexes."""
+        current_time = now()
+        for status in ('', 'Healthy', 'Degraded'):
+            for sort in ('hostname', 'status'):
+                with self.subTest(status=status, sort=sort):
+                    devices = filter_devices(ManagedDevice.objects.all(), current_time, status=status)
+                    devices = annotate_health(devices, current_time).order_by(*SORT_FIELDS[sort])
+                    self.assertNoSeqScan(lambda: list(devices[:10]))
+
+    def test_live_device_status_changes(self):
+        """The live feed only reads devices near a status boundary."""
+        current_time = now()
+        state = {'checked_at': current_time - timedelta(seconds=2), 'statuses': {}}
+        self.assertNoSeqScan(lambda: status_changes(state, current_time))
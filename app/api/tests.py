@@ -1,20 +1,60 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db.models import Sum
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, TestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.utils.timezone import now, timedelta
-from datetime import datetime
+from datetime import datetime, timezone
+import asyncio
+import gzip
+import json
+import os
+import tempfile
 import uuid
+from unittest import skipUnless
 import jwt
 from django.conf import settings
+from django.db import connection
+from django.core.management import call_command
+from django.core.cache import cache
+from io import StringIO
 
-from .models import ManagedDevice, InstallToken, BlockedIP, Alert, LogEntry
+from .models import ManagedDevice, InstallToken, BlockedIP, Alert, LogEntry, LogSpoolOffset, BlocklistChange
 from .utils import generate_device_tokens, verify_token
+from .log_parsers import parse_message, parse_many
+from .detection import SlidingWindowDetector, detector
+from .ingest import InvalidLogData, detect_brute_force, store_log_entries
+from .rollups import count_log_entries, rebuild_rollups
+from .models import HourlyLogCount, DailyLogCount
+from .authentication import device_token_cache
+from .alerts import AlertSink, alert_sink
+from .heartbeats import heartbeat_buffer
+from .buffers import clear_buffers, flush_buffers_if_due
+from .blocklist import (
+    BlocklistSnapshot, aggregate_blocklist, ban_ip, format_network, blocklist_snapshot, get_blocklist_changes,
+    get_blocklist_version, set_ban_state,
+)
+from .parsers import msgpack
+from . import async_views
+from . import spool
+from . import benchmarks
+from . import traffic
+from . import metrics
+from . import retention
+from .management.commands import drain_log_spool
 
 
 class AlarmAPITests(TestCase):
     def setUp(self):
         """Set up common test data for API tests."""
         self.client = APIClient()
+        device_token_cache.clear()
+        self.addCleanup(clear_buffers)
+        blocklist_snapshot.clear()
+        # Only changes made through the blocklist helpers should refresh the snapshot.
+        self.addCleanup(setattr, blocklist_snapshot, 'check_interval', blocklist_snapshot.check_interval)
+        blocklist_snapshot.check_interval = 60
 
         self.install_token = InstallToken.objects.create(
             token="497dcba3-ecbf-4587-a2dd-5eb0665e6880",
@@ -78,6 +118,175 @@ class AlarmAPITests(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_log_batch_submission(self):
+        """Test that a batch is stored in one go with a single summary alert."""
+        log_data = [
+            {
+                "message": f"Failed password for root from 192.168.1.{i}",
+                "timestamp": now().isoformat(),
+                "host": "test-device"
+            }
+            for i in range(1, 51)
+        ]
+        alerts_before = Alert.objects.filter(title="Log Entries Created").count()
+        response = self.client.post(
+            "/api/logs/",
+            log_data,
+            format="json",
+            HTTP_AUTHORIZATION=f"Bearer {self.access_token}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(LogEntry.objects.count(), 50)
+        alert_sink.flush()
+        self.assertEqual(Alert.objects.filter(title="Log Entries Created").count(), alerts_before + 1)
+
+    def test_log_batch_with_invalid_entry_is_rejected(self):
+        """Test that one invalid entry rejects the whole batch without writing anything."""
+        log_data = [
+            {"message": "Accepted password for root from 10.0.0.1", "timestamp": now().isoformat()},
+            {"message": "Accepted password for root from 10.0.0.2", "timestamp": "yesterday"},
+        ]
+        response = self.client.post(
+            "/api/logs/",
+            log_data,
+            format="json",
+            HTTP_AUTHORIZATION=f"Bearer {self.access_token}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(LogEntry.objects.exists())
+
+    def test_log_batch_skips_lines_without_source_ip(self):
+        """Test that a line with no source IP is skipped instead of rejecting everyone else's lines."""
+        log_data = [
+            {"message": "Accepted password for root from 10.0.0.1", "timestamp": now().isoformat()},
+            {"message": "Invalid user a from b from", "timestamp": now().isoformat()},
+            {"message": "Invalid user a from b from 203.0.113.60 port 22", "timestamp": now().isoformat()},
+        ]
+        response = self.client.post(
+            "/api/logs/",
+            log_data,
+            format="json",
+            HTTP_AUTHORIZATION=f"Bearer {self.access_token}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(sorted(LogEntry.objects.values_list("source_ip", flat=True)), ["10.0.0.1", "203.0.113.60"])
+
+    def post_ndjson(self, lines, content_type="application/x-ndjson"):
+        body = gzip.compress("\n".join(lines).encode())
+        return self.client.generic(
+            "POST", "/api/logs/", body, content_type=content_type,
+            HTTP_CONTENT_ENCODING="gzip", HTTP_AUTHORIZATION=f"Bearer {self.access_token}"
+        )
+
+    @override_settings(LOG_INGEST_BATCH_SIZE=7, LOG_INGEST_READ_CHUNK_SIZE=64)
+    def test_gzip_ndjson_submission_is_streamed_in_chunks(self):
+        """Test that a compressed NDJSON body is decoded and stored chunk by chunk."""
+        lines = [
+            json.dumps({"message": f"Failed password for root from 10.1.0.{i}", "timestamp": now().isoformat()})
+            for i in range(1, 31)
+        ]
+        response = self.post_ndjson(lines)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(LogEntry.objects.count(), 30)
+        self.assertEqual(HourlyLogCount.objects.aggregate(total=Sum("count"))["total"], 30)
+
+    @override_settings(LOG_INGEST_BATCH_SIZE=5)
+    def test_invalid_ndjson_line_rejects_whole_submission(self):
+        """Test that a bad line after several stored chunks rolls everything back."""
+        lines = [
+            json.dumps({"message": f"Accepted password for root from 10.2.0.{i}", "timestamp": now().isoformat()})
+            for i in range(1, 21)
+        ] + ["{not json"]
+        response = self.post_ndjson(lines)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("line 21", response.data["error"])
+        self.assertFalse(LogEntry.objects.exists())
+
+    @override_settings(LOG_INGEST_BATCH_SIZE=4, LOG_INGEST_MAX_RECORDS=10)
+    def test_oversized_submission_is_rejected(self):
+        """Test that a submission with more than LOG_INGEST_MAX_RECORDS lines stores nothing."""
+        lines = [
+            json.dumps({"message": f"Accepted password for root from 10.3.0.{i}", "timestamp": now().isoformat()})
+            for i in range(1, 12)
+        ]
+        response = self.post_ndjson(lines)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("at most 10", response.data["error"])
+        self.assertFalse(LogEntry.objects.exists())
+        self.assertFalse(HourlyLogCount.objects.exists())
+
+    def test_gzip_json_submission(self):
+        body = gzip.compress(json.dumps([
+            {"message": "Accepted password for root from 10.3.0.1", "timestamp": now().isoformat()}
+        ]).encode())
+        response = self.client.generic(
+            "POST", "/api/logs/", body, content_type="application/json",
+            HTTP_CONTENT_ENCODING="gzip", HTTP_AUTHORIZATION=f"Bearer {self.access_token}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(LogEntry.objects.count(), 1)
+
+    @skipUnless(msgpack, "msgpack is not installed.")
+    def test_msgpack_submission(self):
+        body = b"".join(
+            msgpack.packb({"message": f"Failed password for root from 10.4.0.{i}", "timestamp": now()}, datetime=True)
+            for i in range(1, 4)
+        )
+        response = self.client.generic(
+            "POST", "/api/logs/", body, content_type="application/msgpack",
+            HTTP_AUTHORIZATION=f"Bearer {self.access_token}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(LogEntry.objects.count(), 3)
+
+    def test_brute_force_batch_bans_source_ip(self):
+        """Test that enough failed logins from one IP in a batch ban it."""
+        detector.reset()
+        log_data = [
+            {"message": "Failed password for root from 203.0.113.50", "timestamp": now().isoformat()}
+            for _ in range(5)
+        ]
+        response = self.client.post(
+            "/api/logs/",
+            log_data,
+            format="json",
+            HTTP_AUTHORIZATION=f"Bearer {self.access_token}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(BlockedIP.objects.filter(ip_address="203.0.113.50", currently_banned=True).exists())
+
+    def post_messages(self, messages):
+        return self.client.post(
+            "/api/logs/",
+            [{"message": message, "timestamp": now().isoformat()} for message in messages],
+            format="json",
+            HTTP_AUTHORIZATION=f"Bearer {self.access_token}"
+        )
+
+    def test_failed_keys_count_towards_a_ban(self):
+        """Test that failed public keys are counted along with failed passwords."""
+        detector.reset()
+        response = self.post_messages(
+            ["Failed password for root from 203.0.113.51 port 22 ssh2"] * 3
+            + ["Failed publickey for root from 203.0.113.51 port 22 ssh2"] * 2
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(BlockedIP.objects.filter(ip_address="203.0.113.51", currently_banned=True).exists())
+
+    def test_each_attempt_is_counted_once(self):
+        """Test that the extra lines sshd logs for one mistyped password don't count as more attempts."""
+        detector.reset()
+        messages = []
+        for port in (4000, 4001, 4002):
+            messages += [
+                f"Invalid user oracle from 203.0.113.52 port {port}",
+                f"Failed password for invalid user oracle from 203.0.113.52 port {port} ssh2",
+                "pam_unix(sshd:auth): authentication failure; logname= uid=0 euid=0 tty=ssh ruser= rhost=203.0.113.52",
+            ]
+        response = self.post_messages(messages)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(BlockedIP.objects.filter(ip_address="203.0.113.52").exists())
+
     def test_unauthorized_log_submission(self):
         """Test submitting logs without authentication."""
         response = self.client.post("/api/logs/", {"message": "Test log"}, format="json")
@@ -133,6 +342,53 @@ class AlarmAPITests(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_heartbeats_are_written_in_bulk(self):
+        """Test that check-ins are held in memory and stored by a single UPDATE on flush."""
+        other = ManagedDevice.objects.create(unique_id=str(uuid.uuid4()), hostname="other-device", ip_address="192.168.1.101", os="Linux")
+        stale = now() - timedelta(hours=1)
+        ManagedDevice.objects.update(last_check_in=stale)
+
+        for token in (self.access_token, generate_device_tokens(other.unique_id)["access"]):
+            response = self.client.post("/api/device/heartbeat/", {}, HTTP_AUTHORIZATION=f"Bearer {token}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(ManagedDevice.objects.filter(last_check_in=stale).count(), 2)
+
+        devices = list(ManagedDevice.objects.all())
+        heartbeat_buffer.merge_into(devices)
+        self.assertTrue(all(device.last_check_in > stale for device in devices))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(heartbeat_buffer.flush(), 2)
+        self.assertFalse(ManagedDevice.objects.filter(last_check_in=stale).exists())
+
+    def test_heartbeat_flush_drops_tokens_of_deleted_devices(self):
+        """Test that a device deleted elsewhere is refused once its buffered check-in is flushed."""
+        self.client.post("/api/device/heartbeat/", {}, HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        ManagedDevice.objects.filter(pk=self.device.pk).delete()
+        heartbeat_buffer.flush()
+        response = self.client.post("/api/device/heartbeat/", {}, HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cached_authentication_skips_device_lookup(self):
+        """Test that a repeated token is authenticated without a database query."""
+        self.client.post("/api/device/heartbeat/", {}, HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        with self.assertNumQueries(0):
+            response = self.client.post("/api/device/heartbeat/", {}, HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_refresh_token_rejected_by_agent_endpoints(self):
+        """Test that a refresh token cannot be used as an access token, even once cached."""
+        self.client.post("/api/device/token/refresh/", {}, format="json", HTTP_AUTHORIZATION=f"Bearer {self.refresh_token}")
+        response = self.client.post("/api/device/heartbeat/", {}, HTTP_AUTHORIZATION=f"Bearer {self.refresh_token}")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deregister_invalidates_cached_token(self):
+        """Test that a deregistered device's cached token stops working."""
+        self.client.post("/api/device/heartbeat/", {}, HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        self.client.delete("/api/deregister/", HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        response = self.client.post("/api/device/heartbeat/", {}, HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_device_status_check(self):
         """Test checking device status with a valid token."""
         response = self.client.get(f"/api/device/status/{self.install_token.token}/")
@@ -169,7 +425,60 @@ class AlarmAPITests(TestCase):
         BlockedIP.objects.create(ip_address="192.168.1.200", currently_banned=True)
         response = self.client.get("/api/blocklist/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn("blocked_ips", response.data)
+        self.assertIn("blocked_ips", response.json())
+
+    def test_blocklist_delta_since_version(self):
+        """Test that ?since returns only the changes after a version, and 304 once up to date."""
+        with self.captureOnCommitCallbacks(execute=True):
+            for ip in ("192.168.1.10", "192.168.1.11"):
+                self.client.post("/api/report_ban/", {"ip": ip}, format="json")
+        full = self.client.get("/api/blocklist/").json()
+        self.assertCountEqual(full["blocked_ips"], ["192.168.1.10", "192.168.1.11"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            set_ban_state(BlockedIP.objects.get(ip_address="192.168.1.10"), False)
+            ban_ip("192.168.1.12", "Test")
+            ban_ip("192.168.1.12", "Test")
+        response = self.client.get("/api/blocklist/", {"since": full["version"]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["version"], full["version"] + 2)
+        self.assertEqual(response.data["added"], ["192.168.1.12"])
+        self.assertEqual(response.data["removed"], ["192.168.1.10"])
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/blocklist/", {"since": response.data["version"]})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_blocklist_served_from_encoded_snapshot(self):
+        """Test that the full blocklist is encoded once per version and served gzipped on request."""
+        with self.captureOnCommitCallbacks(execute=True):
+            ban_ip("192.168.1.20", "Test")
+        plain = self.client.get("/api/blocklist/")
+        with self.assertNumQueries(0):
+            compressed = self.client.get("/api/blocklist/", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(plain.json()["blocked_ips"], ["192.168.1.20"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ban_ip("192.168.1.21", "Test")
+        self.assertCountEqual(self.client.get("/api/blocklist/").json()["blocked_ips"], ["192.168.1.20", "192.168.1.21"])
+
+    def test_blocklist_invalid_since(self):
+        response = self.client.get("/api/blocklist/", {"since": "latest"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_blocklist_as_cidr_blocks(self):
+        """Test that ?cidr=1 serves adjacent bans as one block under its own ETag."""
+        for i in range(4):
+            ban_ip(f"10.9.0.{i}", "Test")
+        response = self.client.get("/api/blocklist/", {"cidr": "1"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["blocked_networks"], ["10.9.0.0/30"])
+        self.assertNotEqual(response["ETag"], self.client.get("/api/blocklist/")["ETag"])
+
+        response = self.client.get("/api/blocklist/", {"cidr": "1", "since": response.json()["version"]})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
 
     def test_report_ban(self):
         """Test reporting an IP to the blocklist."""
@@ -187,6 +496,270 @@ class AlarmAPITests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class AsyncAgentViewTests(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        device_token_cache.clear()
+        blocklist_snapshot.clear()
+        self.addCleanup(clear_buffers)
+        self.device = ManagedDevice.objects.create(
+            unique_id=str(uuid.uuid4()), hostname="async-device", ip_address="192.168.1.150", os="Linux"
+        )
+        self.headers = {"Authorization": f"Bearer {generate_device_tokens(self.device.unique_id)['access']}"}
+
+    async def test_log_view_stores_compressed_ndjson(self):
+        body = gzip.compress(b"\n".join(
+            json.dumps({"message": f"Failed password for root from 10.5.0.{i}", "timestamp": now().isoformat()}).encode()
+            for i in range(1, 4)
+        ))
+        request = self.factory.post(
+            "/api/logs/", body, content_type="application/x-ndjson",
+            headers={**self.headers, "Content-Encoding": "gzip"}
+        )
+        response = await async_views.log_view(request)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(await LogEntry.objects.acount(), 3)
+
+    def test_database_slots_belong_to_the_running_loop(self):
+        async def slots():
+            return async_views.database_slots(), async_views.database_slots()
+        first, second = asyncio.run(slots()), asyncio.run(slots())
+        self.assertIs(first[0], first[1])
+        self.assertIsNot(first[0], second[0])
+
+    async def test_log_view_requires_token(self):
+        request = self.factory.post("/api/logs/", b"{}", content_type="application/json")
+        response = await async_views.log_view(request)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_heartbeat_view_buffers_check_in(self):
+        response = await async_views.heartbeat_view(self.factory.post("/api/device/heartbeat/", headers=self.headers))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(self.device.pk, heartbeat_buffer.pending())
+
+    async def test_full_buffer_is_flushed_after_the_response(self):
+        """A buffer overflowing on the event loop is not flushed there, since the ORM cannot run in async code."""
+        self.addCleanup(setattr, heartbeat_buffer, "max_size", heartbeat_buffer.max_size)
+        heartbeat_buffer.max_size = 0
+        response = await async_views.heartbeat_view(self.factory.post("/api/device/heartbeat/", headers=self.headers))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(self.device.pk, heartbeat_buffer.pending())
+
+        await sync_to_async(flush_buffers_if_due)()
+        self.assertEqual(heartbeat_buffer.pending(), {})
+        self.assertIsNotNone((await ManagedDevice.objects.aget(pk=self.device.pk)).last_check_in)
+
+    async def test_blocklist_view_delta_and_not_modified(self):
+        await sync_to_async(ban_ip)("192.168.1.30", "Test")
+        full = json.loads((await async_views.blocklist_view(self.factory.get("/api/blocklist/"))).content)
+        self.assertEqual(full["blocked_ips"], ["192.168.1.30"])
+
+        response = await async_views.blocklist_view(self.factory.get("/api/blocklist/", {"since": full["version"]}))
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_report_ban_view(self):
+        request = self.factory.post("/api/report_ban/", json.dumps({"ip": "192.168.1.31"}), content_type="application/json")
+        response = await async_views.report_ban_view(request)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(await BlockedIP.objects.filter(ip_address="192.168.1.31", currently_banned=True).aexists())
+
+
+class LogSpoolTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        device_token_cache.clear()
+        self.addCleanup(clear_buffers)
+        self.directory = tempfile.mkdtemp()
+        self.spool = spool.LogSpool(self.directory, segment_size=1024 * 1024)
+        self.addCleanup(self.spool.close)
+        self.device = ManagedDevice.objects.create(
+            unique_id=str(uuid.uuid4()), hostname="spool-device", ip_address="192.168.1.160", os="Linux"
+        )
+
+    def records(self, count, start=1):
+        return [
+            {"message": f"Failed password for root from 10.6.0.{i}", "timestamp": now().isoformat(), "host": "spool-device"}
+            for i in range(start, start + count)
+        ]
+
+    def test_log_view_queues_batch_in_spool(self):
+        """Test that spool mode acknowledges a batch without writing it to the database."""
+        self.addCleanup(setattr, spool.log_spool, 'directory', spool.log_spool.directory)
+        spool.log_spool.directory = self.directory
+        self.addCleanup(spool.log_spool.close)
+
+        with override_settings(LOG_SPOOL_ENABLED=True):
+            response = self.client.post(
+                "/api/logs/", self.records(5), format="json",
+                HTTP_AUTHORIZATION=f"Bearer {generate_device_tokens(self.device.unique_id)['access']}"
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(LogEntry.objects.count(), 0)
+
+        spool.log_spool.close()
+        self.assertEqual(spool.drain_spool(self.directory, batch_size=100), (5, 1))
+        self.assertEqual(LogEntry.objects.filter(host="spool-device").count(), 5)
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertFalse(LogSpoolOffset.objects.exists())
+
+    def test_invalid_batch_is_not_spooled(self):
+        """Test that a batch with an invalid record is rejected before anything is appended."""
+        with self.assertRaises(InvalidLogData):
+            spool.spool_log_records(self.records(2) + [{"message": "Failed password", "timestamp": "yesterday"}], "10.0.0.1", self.spool)
+        self.assertEqual(spool.list_segments(self.directory), [])
+
+    def test_drain_resumes_from_committed_offset(self):
+        """Test that an open segment is drained up to its last complete batch and never replayed."""
+        spool.spool_log_records(self.records(3), "10.0.0.1", self.spool)
+        spool.spool_log_records(self.records(3, start=4), "10.0.0.1", self.spool)
+        # A batch the writer was still appending when the drainer ran.
+        self.spool._file.write(b'[["2026-01-01T00:00:00+00:00","10.6.1.1"')
+        self.spool._file.flush()
+
+        self.assertEqual(spool.drain_spool(self.directory, batch_size=3), (6, 0))
+        self.assertEqual(spool.drain_spool(self.directory, batch_size=3), (0, 0))
+        self.assertEqual(LogEntry.objects.count(), 6)
+        self.assertEqual(LogSpoolOffset.objects.get().offset, os.path.getsize(spool.list_segments(self.directory)[0]) - 40)
+
+        self.spool.close()
+        with self.assertLogs('api.spool', 'WARNING'):
+            self.assertEqual(spool.drain_spool(self.directory, batch_size=3), (0, 1))
+        self.assertEqual(LogEntry.objects.count(), 6)
+
+
+    def test_drainer_writes_detection_alerts(self):
+        """Test that alerts raised while draining are written without waiting for a request."""
+        detector.reset()
+        self.addCleanup(detector.reset)
+        self.addCleanup(setattr, alert_sink, 'flush_interval', alert_sink.flush_interval)
+        alert_sink.flush_interval = 0
+        # An address an operator unbanned earlier, so the new ban is announced with a "Global Ban" alert.
+        BlockedIP.objects.create(ip_address="10.6.2.1", reason="Earlier attack", currently_banned=False)
+        records = [
+            {"message": "Failed password for root from 10.6.2.1", "timestamp": now().isoformat(), "host": "spool-device"}
+            for _ in range(5)
+        ]
+        spool.spool_log_records(records, "10.0.0.1", self.spool)
+        self.spool.close()
+
+        drainer = drain_log_spool.Command(stdout=StringIO())
+        self.assertEqual(drainer.drain(self.directory, batch_size=100), 5)
+        self.assertTrue(BlockedIP.objects.filter(ip_address="10.6.2.1", currently_banned=True).exists())
+        self.assertTrue(Alert.objects.filter(title="Global Ban").exists())
+
+class BlocklistAggregationTestCase(TestCase):
+    def test_exact_aggregation(self):
+        networks = aggregate_blocklist(["10.0.0.0", "10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.9", "2001:db8::1"])
+        self.assertEqual([format_network(*network) for network in networks], ["10.0.0.0/30", "10.0.0.9/32", "2001:db8::1/128"])
+
+    def test_policy_aggregation(self):
+        """Test that dense ranges collapse unless they contain an unbanned address."""
+        blocked = [f"198.51.100.{i}" for i in range(1, 40, 3)] + [f"203.0.113.{i}" for i in range(1, 40, 3)] + ["192.0.2.1"]
+        networks = [format_network(*network) for network in aggregate_blocklist(blocked, ["203.0.113.200"], {4: [(24, 10)]})]
+        self.assertIn("198.51.100.0/24", networks)
+        self.assertIn("192.0.2.1/32", networks)
+        self.assertNotIn("203.0.113.0/24", networks)
+        self.assertEqual(len(networks), 2 + 13)
+
+        # An unbanned range that starts below a block and runs into it also keeps the block open.
+        blocked = [f"10.0.1.{i}" for i in range(1, 40)]
+        networks = [format_network(*network) for network in aggregate_blocklist(blocked, ["10.0.0.255", "10.0.1.0"], {4: [(24, 10)]})]
+        self.assertNotIn("10.0.1.0/24", networks)
+        self.assertEqual(networks, ["10.0.1.1/32", "10.0.1.2/31", "10.0.1.4/30", "10.0.1.8/29", "10.0.1.16/28", "10.0.1.32/29"])
+
+    def test_snapshot_collapses_range(self):
+        snapshot = BlocklistSnapshot(check_interval=60, aggregation_policy={4: [(24, 2)]})
+        ban_ip("198.51.100.1", "Test")
+        ban_ip("198.51.100.2", "Test")
+        self.assertEqual(json.loads(snapshot.get_aggregated().body)["blocked_networks"], ["198.51.100.0/24"])
+
+    def test_detection_records_ban_inside_collapsed_range(self):
+        """Addresses already covered by a collapsed range still get a row, so the exact list serves them."""
+        policy = blocklist_snapshot.aggregation_policy
+        self.addCleanup(setattr, blocklist_snapshot, "aggregation_policy", policy)
+        blocklist_snapshot.aggregation_policy = {4: [(24, 2)]}
+        detector.reset()
+        ban_ip("198.51.100.1", "Test")
+        ban_ip("198.51.100.2", "Test")
+        self.assertEqual(json.loads(blocklist_snapshot.get_aggregated().body)["blocked_networks"], ["198.51.100.0/24"])
+        failures = [("198.51.100.77", now())] * 5
+        self.assertEqual(detect_brute_force(failures), ["198.51.100.77"])
+        self.assertTrue(BlockedIP.objects.filter(ip_address="198.51.100.77", currently_banned=True).exists())
+
+
+class BlockedIPAdminTestCase(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+
+    def test_admin_changes_are_versioned(self):
+        """Bans and unbans made in the admin are recorded as blocklist changes."""
+        response = self.client.post("/admin/api/blockedip/add/", {
+            "ip_address": "203.0.113.90", "reason": "Manual", "currently_banned": "on",
+        })
+        self.assertEqual(response.status_code, 302)
+        blocked_ip = BlockedIP.objects.get(ip_address="203.0.113.90")
+        ban = BlocklistChange.objects.get()
+        self.assertEqual((ban.ip_address, ban.banned), ("203.0.113.90", True))
+
+        response = self.client.post(f"/admin/api/blockedip/{blocked_ip.pk}/change/", {"reason": "False positive"})
+        self.assertEqual(response.status_code, 302)
+        blocked_ip.refresh_from_db()
+        self.assertEqual((blocked_ip.currently_banned, blocked_ip.reason), (False, "False positive"))
+        self.assertEqual(get_blocklist_changes(ban.id, get_blocklist_version()), ([], ["203.0.113.90"]))
+
+        response = self.client.post(f"/admin/api/blockedip/{blocked_ip.pk}/delete/", {"post": "yes"})
+        self.assertEqual(response.status_code, 403)
+
+
+class AlertSinkTestCase(TestCase):
+    def setUp(self):
+        self.sink = AlertSink(flush_interval=60, max_size=100, sample_rates={'INFO': 0})
+
+    def test_coalesces_repeated_alerts(self):
+        """Repeats of the same title and severity are stored as one row with a count."""
+        for i in range(3):
+            self.sink.emit("Heartbeat Failed", f"Device {i} not found.", severity='WARNING')
+        self.sink.emit("Heartbeat Failed", "Device not found.", severity='ERROR')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.sink.flush(), 2)
+        warning = Alert.objects.get(title="Heartbeat Failed", severity='WARNING')
+        self.assertEqual(warning.count, 3)
+        self.assertEqual(warning.message, "Device 0 not found.\nDevice 1 not found.\nDevice 2 not found.")
+        self.assertEqual(Alert.objects.get(severity='ERROR').count, 1)
+
+    def test_coalesced_messages_are_capped(self):
+        """Distinct messages are listed up to max_messages, and the rest are counted."""
+        sink = AlertSink(flush_interval=60, max_size=100, max_messages=2)
+        for ip in ("10.0.0.1", "10.0.0.2", "10.0.0.1", "10.0.0.3", "10.0.0.4"):
+            sink.emit("IP Blocked", f"IP {ip} has been blocked.")
+        sink.flush()
+        alert = Alert.objects.get(title="IP Blocked")
+        self.assertEqual(alert.count, 5)
+        self.assertEqual(alert.message, "IP 10.0.0.1 has been blocked.\nIP 10.0.0.2 has been blocked.\n… and 2 more")
+
+    def test_sampling_rate_zero_suppresses_severity(self):
+        self.sink.emit("Heartbeat Received", "Heartbeat received.", severity='INFO')
+        self.assertEqual(self.sink.flush(), 0)
+        self.assertFalse(Alert.objects.exists())
+
+    def test_request_does_not_write_alerts_until_due(self):
+        """Alerts raised by a request are flushed after the response once the interval has passed."""
+        self.addCleanup(clear_buffers)
+        device = ManagedDevice.objects.create(unique_id="sink-device", hostname="sink-device", ip_address="10.0.0.1", os="Linux")
+        token = generate_device_tokens(device.unique_id)["access"]
+
+        interval = alert_sink.flush_interval
+        self.addCleanup(setattr, alert_sink, 'flush_interval', interval)
+        alert_sink.flush_interval = 60
+        APIClient().post("/api/device/heartbeat/", {}, HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertFalse(Alert.objects.filter(title="Heartbeat Received").exists())
+
+        alert_sink.flush_interval = 0
+        APIClient().post("/api/device/heartbeat/", {}, HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(Alert.objects.get(title="Heartbeat Received").count, 2)
+
+
 class AlarmUtilsTestCase(TestCase):
     def setUp(self):
         """Prepare data for utils tests."""
@@ -237,3 +810,463 @@ class AlarmUtilsTestCase(TestCase):
         with self.assertRaises(jwt.InvalidTokenError) as cm:
             verify_token(expired_token, token_type="access")
         self.assertIn("Token has expired", str(cm.exception))
+
+
+class LogParserTestCase(TestCase):
+    def test_failed_password_invalid_user(self):
+        parsed = parse_message("Failed password for invalid user admin from 192.168.1.200 port 52122 ssh2")
+        self.assertEqual(parsed.action, "Failed password")
+        self.assertEqual(parsed.user, "admin")
+        self.assertEqual(parsed.source_ip, "192.168.1.200")
+        self.assertEqual(parsed.port, 52122)
+        self.assertEqual(parsed.auth_method, "password")
+
+    def test_accepted_publickey_with_syslog_header(self):
+        parsed = parse_message("Mar 19 05:30:00 web-01 sshd[811]: Accepted publickey for deploy from 10.0.0.5 port 40022 ssh2: ED25519 SHA256:abc")
+        self.assertEqual(parsed.action, "Accepted publickey")
+        self.assertEqual(parsed.user, "deploy")
+        self.assertEqual(parsed.source_ip, "10.0.0.5")
+        self.assertEqual(parsed.auth_method, "publickey")
+
+    def test_ipv6_source(self):
+        parsed = parse_message("Failed password for root from 2001:DB8::1 port 22 ssh2")
+        self.assertEqual(parsed.source_ip, "2001:db8::1")
+
+    def test_invalid_user_pam_and_fail2ban(self):
+        invalid, pam, ban = parse_many([
+            "Invalid user oracle from 203.0.113.9 port 4000",
+            "pam_unix(sshd:auth): authentication failure; logname= uid=0 euid=0 tty=ssh ruser= rhost=203.0.113.10  user=root",
+            "2025-03-19 05:30:00,123 fail2ban.actions        [812]: NOTICE  [sshd] Ban 203.0.113.11",
+        ])
+        self.assertEqual((invalid.action, invalid.user, invalid.source_ip), ("Invalid user", "oracle", "203.0.113.9"))
+        self.assertEqual((pam.action, pam.user, pam.auth_method), ("Authentication failure", "root", "pam"))
+        self.assertEqual((ban.action, ban.source_ip), ("Ban", "203.0.113.11"))
+
+    def test_user_names_containing_from(self):
+        probe = parse_message("Invalid user a from b from 1.2.3.4 port 22")
+        spoofed = parse_message("Failed password for invalid user x from 9.9.9.9 from 203.0.113.9 port 22 ssh2")
+        self.assertEqual((probe.action, probe.user, probe.source_ip, probe.port), ("Invalid user", "a from b", "1.2.3.4", 22))
+        self.assertEqual((spoofed.user, spoofed.source_ip), ("x from 9.9.9.9", "203.0.113.9"))
+
+    def test_unrecognised_and_malformed_lines(self):
+        self.assertEqual(parse_message("Connection from 10.0.0.7 closed").action, "Unknown")
+        self.assertEqual(parse_message("Connection from 10.0.0.7 closed").source_ip, "10.0.0.7")
+        self.assertIsNone(parse_message("Failed password for root from 999.1.1.1 port 22").source_ip)
+
+
+class SlidingWindowDetectorTestCase(TestCase):
+    def setUp(self):
+        self.detector = SlidingWindowDetector(window=timedelta(minutes=1), threshold=3, actions=("Failed password",))
+        self.current_time = now()
+
+    def failures(self, ip, count, age=timedelta(0)):
+        return [
+            LogEntry(timestamp=self.current_time - age, source_ip=ip, action="Failed password")
+            for _ in range(count)
+        ]
+
+    def test_flags_ip_once_when_threshold_crossed(self):
+        crossed = self.detector.observe(self.failures("10.0.0.1", 5), self.current_time)
+        self.assertEqual(crossed, ["10.0.0.1"])
+        self.assertEqual(self.detector.observe(self.failures("10.0.0.1", 1), self.current_time), [])
+
+    def test_ignores_entries_outside_window_and_other_actions(self):
+        entries = self.failures("10.0.0.2", 5, age=timedelta(minutes=2))
+        entries.append(LogEntry(timestamp=self.current_time, source_ip="10.0.0.2", action="Accepted password"))
+        self.assertEqual(self.detector.observe(entries, self.current_time), [])
+        self.assertEqual(self.detector.count("10.0.0.2", self.current_time), 0)
+
+    def test_counts_accumulate_across_batches(self):
+        self.assertEqual(self.detector.observe(self.failures("10.0.0.3", 2), self.current_time), [])
+        self.assertEqual(self.detector.observe(self.failures("10.0.0.3", 1), self.current_time), ["10.0.0.3"])
+
+    def test_out_of_order_entries_expire(self):
+        # A fresh failure delivered before older ones from a delayed agent.
+        entries = self.failures("10.0.0.4", 1) + self.failures("10.0.0.4", 1, age=timedelta(seconds=50))
+        self.assertEqual(self.detector.observe(entries, self.current_time), [])
+        later = self.current_time + timedelta(seconds=40)
+        fresh = [LogEntry(timestamp=later, source_ip="10.0.0.4", action="Failed password")]
+        self.assertEqual(self.detector.observe(fresh, later), [])
+        self.assertEqual(self.detector.count("10.0.0.4", later), 2)
+
+
+class LogRollupTestCase(TestCase):
+    def setUp(self):
+        self.current_time = now()
+        self.entries = [
+            LogEntry(
+                timestamp=self.current_time - timedelta(minutes=37 * i),
+                source_ip=f"10.0.{i % 3}.1",
+                action="Failed password" if i % 4 else "Accepted password",
+                source="vector",
+                host=f"host-{i % 2}"
+            )
+            for i in range(200)
+        ]
+
+    def raw_count(self, action, start=None, end=None):
+        query = LogEntry.objects.filter(action=action)
+        if start:
+            query = query.filter(timestamp__gte=start)
+        if end:
+            query = query.filter(timestamp__lt=end)
+        return query.count()
+
+    def assertRollupsMatchRaw(self):
+        ranges = [
+            (None, None),
+            (self.current_time - timedelta(hours=24), None),
+            (self.current_time - timedelta(hours=48), self.current_time - timedelta(hours=24)),
+            (self.current_time - timedelta(days=3, minutes=13), self.current_time - timedelta(minutes=5)),
+            (self.current_time - timedelta(minutes=50), self.current_time - timedelta(minutes=10)),
+            (None, self.current_time - timedelta(days=2, minutes=7)),
+        ]
+        for action in ("Failed password", "Accepted password"):
+            for start, end in ranges:
+                with self.subTest(action=action, start=start, end=end):
+                    self.assertEqual(count_log_entries(action, start, end), self.raw_count(action, start, end))
+
+    def test_ingest_updates_rollups(self):
+        store_log_entries(self.entries[:100])
+        store_log_entries(self.entries[100:])
+        self.assertEqual(sum(HourlyLogCount.objects.values_list("count", flat=True)), 200)
+        self.assertEqual(sum(DailyLogCount.objects.values_list("count", flat=True)), 200)
+        self.assertRollupsMatchRaw()
+
+    def test_rebuild_rollups_from_raw_entries(self):
+        LogEntry.objects.bulk_create(self.entries)
+        rebuild_rollups(self.current_time - timedelta(days=7), self.current_time + timedelta(days=1))
+        rebuild_rollups(self.current_time - timedelta(days=7), self.current_time + timedelta(days=1))
+        self.assertRollupsMatchRaw()
+
+
+@skipUnless(connection.vendor == "postgresql", "The benchmarks need PostgreSQL.")
+class BenchmarkSuiteTestCase(TestCase):
+    def setUp(self):
+        self.addCleanup(clear_buffers)
+        self.addCleanup(blocklist_snapshot.clear)
+
+    def test_summarize(self):
+        stats = benchmarks.summarize([4.0, 1.0, 3.0, 2.0, 10.0])
+        self.assertEqual((stats["n"], stats["min"], stats["median"], stats["max"]), (5, 1.0, 3.0, 10.0))
+        self.assertEqual(stats["mean"], 4.0)
+        self.assertEqual(benchmarks.summarize([2.5])["p95"], 2.5)
+
+    def test_compare_results(self):
+        """Test that a slower median is only a regression when the whole run is slower."""
+        def report(**medians):
+            return {"results": {name: {"median": median, "min": median * 0.9, "p95": median * 1.1}
+                                for name, median in medians.items()}}
+
+        rows = benchmarks.compare_results(report(a=10, b=10, c=10), report(a=20, b=10.5, d=1), threshold=10)
+        self.assertEqual([(name, regressed) for name, _, _, _, regressed in rows], [("a", True), ("b", False)])
+
+    def test_seed_and_run_suite(self):
+        """Test a small end-to-end run, and that benchmark traffic is removed afterwards."""
+        benchmarks.seed_database(2000)
+        self.assertEqual(LogEntry.objects.count(), 2000)
+        self.assertEqual(ManagedDevice.objects.count(), benchmarks.SEED_HOSTS)
+
+        report = benchmarks.run_suite(batch_sizes=[5], ban_counts=[50, 20], repeat=2)
+        results = report["results"]
+        self.assertEqual(report["environment"]["log_entries"], 2000)
+        self.assertIn("ingest[batch=5]", results)
+        self.assertIn("dashboard_home[cold]", results)
+        self.assertIn("login_attempt_list[deep_page]", results)
+        self.assertEqual(results["dashboard_home[warm]"]["queries"], 0)
+        self.assertEqual(results["detect_brute_force"]["n"], 2)
+        self.assertEqual(BlockedIP.objects.filter(reason=benchmarks.SEED_BAN_REASON).count(), 20)
+        self.assertEqual(LogEntry.objects.count(), 2000)
+        json.dumps(report)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        device_token_cache.clear()
+        metrics.clear()
+        cache.clear()
+        self.addCleanup(metrics.clear)
+        self.addCleanup(clear_buffers)
+        self.addCleanup(blocklist_snapshot.clear)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(METRICS_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        device = ManagedDevice.objects.create(unique_id=str(uuid.uuid4()), hostname='web-01',
+                                              ip_address='10.0.0.1', os='Ubuntu')
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {generate_device_tokens(device.unique_id)['access']}"}
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test.', ('kind',), buckets=(0.1, 1))
+        self.addCleanup(metrics._metrics.pop, 'test_seconds')
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value, 'a')
+        text = metrics.render('test_seconds', 'Test.', 'histogram', histogram.samples(metrics.collect(self.directory)['test_seconds']))
+        self.assertIn('test_seconds_bucket{kind="a",le="0.1"} 1\n', text)
+        self.assertIn('test_seconds_bucket{kind="a",le="1"} 3\n', text)
+        self.assertIn('test_seconds_bucket{kind="a",le="+Inf"} 4\n', text)
+        self.assertIn('test_seconds_count{kind="a"} 4\n', text)
+        self.assertIn('test_seconds_sum{kind="a"} 4.05\n', text)
+
+    def test_requests_queries_and_ingest_are_counted(self):
+        logs = [{"message": f"Failed password for root from 203.0.113.{i} port 22 ssh2", "timestamp": now().isoformat()}
+                for i in range(3)]
+        self.client.post('/api/logs/', logs, format='json', **self.auth)
+        self.client.post('/api/logs/', [{"message": "Failed password for root", "timestamp": "yesterday"}],
+                         format='json', **self.auth)
+        self.client.get('/dashboard/')
+        text = self.scrape()
+
+        self.assertIn('alarm_http_requests_total{view="logs",method="POST",status="201"} 1\n', text)
+        self.assertIn('alarm_http_requests_total{view="logs",method="POST",status="400"} 1\n', text)
+        self.assertIn('alarm_http_request_db_queries_count{view="dashboard-home"} 1\n', text)
+        self.assertNotIn('alarm_http_request_db_queries_sum{view="dashboard-home"} 0\n', text)
+        self.assertIn('alarm_log_entries_parsed_total 3\n', text)
+        self.assertIn('alarm_log_entries_inserted_total 3\n', text)
+        self.assertIn('alarm_log_entries_rejected_total 1\n', text)
+        self.assertIn('alarm_log_batches_rejected_total{reason="invalid"} 1\n', text)
+        self.assertIn('alarm_log_batch_size_count 1\n', text)
+        self.assertIn('alarm_detector_duration_seconds_count{detector="sliding_window"} 1\n', text)
+        self.assertIn('alarm_dashboard_snapshot_build_seconds_count 1\n', text)
+
+    def test_state_gauges(self):
+        ban_ip('203.0.113.9', 'Test')
+        self.client.post('/api/device/heartbeat/', **self.auth)
+        text = self.scrape()
+        self.assertIn('alarm_blocklist_banned_ips 1\n', text)
+        self.assertIn('alarm_devices{status="Healthy"} 1\n', text)
+        self.assertIn('alarm_device_heartbeat_age_seconds{device="newest"}', text)
+
+    def test_collect_adds_up_processes_and_keeps_exited_ones(self):
+        metrics.HTTP_REQUESTS.inc('logs', 'POST', '201', amount=2)
+        parent_started = metrics._start_time(os.getppid()) or 0
+        files = {
+            # A running process, one that exited, and an exited one whose ID the running process now has.
+            f'{os.getppid()}-{parent_started}.json': 5,
+            f'{2 ** 30 + 7}-1.json': 7,
+            f'{os.getppid()}-{parent_started + 1}.json': 3,
+        }
+        for filename, value in files.items():
+            with open(os.path.join(self.directory, filename), 'w') as file:
+                json.dump({'alarm_http_requests_total': [[['logs', 'POST', '201'], value]]}, file)
+
+        key = ('logs', 'POST', '201')
+        self.assertEqual(metrics.collect(self.directory)['alarm_http_requests_total'][key], 17)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, f'{2 ** 30 + 7}-1.json')))
+        if parent_started:
+            self.assertFalse(os.path.exists(os.path.join(self.directory, f'{os.getppid()}-{parent_started + 1}.json')))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, metrics.ARCHIVE_FILE)))
+        # This process' own file is replaced by its live values, never counted twice.
+        metrics.write_snapshot(self.directory)
+        self.assertEqual(metrics.collect(self.directory)['alarm_http_requests_total'][key], 17)
+
+
+class ProvisionLoadTestTestCase(TestCase):
+    def setUp(self):
+        self.addCleanup(clear_buffers)
+        self.addCleanup(device_token_cache.clear)
+
+    def test_provision_and_cleanup(self):
+        output = StringIO()
+        call_command('provision_load_test', devices=3, stdout=output, stderr=StringIO())
+        agents = json.loads(output.getvalue())['agents']
+        self.assertEqual(len(agents), 3)
+        self.assertEqual(ManagedDevice.objects.filter(hostname__startswith='loadtest-agent-').count(), 3)
+
+        response = APIClient().post('/api/device/heartbeat/', HTTP_AUTHORIZATION=f"Bearer {agents[0]['access']}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = APIClient().post('/api/device/token/refresh/', HTTP_AUTHORIZATION=f"Bearer {agents[0]['refresh']}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        ManagedDevice.objects.create(unique_id='kept', hostname='web-01', ip_address='10.0.0.1', os='Ubuntu')
+        BlockedIP.objects.create(ip_address='198.18.0.7', reason='Load test')
+        call_command('provision_load_test', cleanup=True, stderr=StringIO())
+        self.assertEqual(list(ManagedDevice.objects.values_list('hostname', flat=True)), ['web-01'])
+        self.assertFalse(BlockedIP.objects.exists())
+
+
+class TrafficGeneratorTestCase(TestCase):
+    def setUp(self):
+        self.end = datetime(2025, 3, 19, 12, 0, tzinfo=timezone.utc)
+        self.start = self.end - timedelta(hours=6)
+
+    def generate(self, total, **kwargs):
+        kwargs.setdefault('hosts', 50)
+        return traffic.TrafficGenerator(total, self.start, self.end, **kwargs)
+
+    def test_events_are_repeatable_ordered_and_mixed(self):
+        generator = self.generate(5000, seed=7)
+        events = list(generator.events())
+        self.assertEqual(events, list(self.generate(5000, seed=7).events()))
+        self.assertNotEqual(events, list(self.generate(5000, seed=8).events()))
+
+        self.assertEqual(len(events), 5000)
+        self.assertEqual(generator.counts, {'normal': 3500, 'bruteforce': 500, 'spray': 500, 'botnet': 500})
+        timestamps = [event[0] for event in events]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertGreaterEqual(timestamps[0], self.start.timestamp())
+        self.assertLess(timestamps[-1], self.end.timestamp())
+
+    def test_messages_parse_to_their_action(self):
+        for _, _, kind, user, ip, port in self.generate(2000).events():
+            parsed = parse_message(traffic.format_message(kind, user, ip, port))
+            self.assertEqual((parsed.action, parsed.source_ip), (traffic.ACTIONS[kind], ip))
+
+    def max_failures_in_window(self, events):
+        """Largest number of failed passwords from one address within BRUTE_FORCE_WINDOW."""
+        window = settings.BRUTE_FORCE_WINDOW.total_seconds()
+        failures = {}
+        for timestamp, _, kind, _, ip, _ in events:
+            if traffic.ACTIONS[kind] == 'Failed password':
+                failures.setdefault(ip, []).append(timestamp)
+        most = 0
+        for times in failures.values():
+            first = 0
+            for last, timestamp in enumerate(times):
+                while timestamp - times[first] >= window:
+                    first += 1
+                most = max(most, last - first + 1)
+        return most
+
+    def test_brute_force_bursts_cross_the_threshold_and_spraying_does_not(self):
+        bursts = self.generate(2000, mix=traffic.parse_mix('bruteforce=1')).events()
+        self.assertGreaterEqual(self.max_failures_in_window(bursts), settings.BRUTE_FORCE_THRESHOLD)
+        spraying = self.generate(2000, mix=traffic.parse_mix('spray=1')).events()
+        self.assertLess(self.max_failures_in_window(spraying), settings.BRUTE_FORCE_THRESHOLD)
+
+    def test_botnet_spreads_over_subnets(self):
+        events = list(self.generate(2000, mix=traffic.parse_mix('botnet=1')).events())
+        addresses = {ip for _, _, _, _, ip, _ in events}
+        subnets = {ip.rsplit('.', 1)[0] for ip in addresses}
+        self.assertGreater(len(addresses), 200)
+        self.assertGreater(len(subnets), 0.9 * len(addresses))
+        self.assertLessEqual(max(sum(1 for event in events if event[4] == ip) for ip in addresses), 4)
+
+    def test_parse_options(self):
+        self.assertEqual(traffic.parse_span('90m'), timedelta(minutes=90))
+        self.assertEqual(traffic.parse_span('30d'), timedelta(days=30))
+        self.assertEqual(traffic.parse_mix('normal=3,botnet=1'), {'normal': 0.75, 'botnet': 0.25})
+        for value in ('0h', '12', 'week'):
+            with self.assertRaises(ValueError):
+                traffic.parse_span(value)
+        with self.assertRaises(ValueError):
+            traffic.parse_mix('normal=1,ddos=1')
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY needs PostgreSQL')
+    def test_generate_traffic_loads_log_entries(self):
+        call_command('generate_traffic', rows='3000', span='6h', end=self.end.isoformat(), hosts=50,
+                     chunk_size=1000, stdout=StringIO())
+        self.assertEqual(LogEntry.objects.count(), 3000)
+        self.assertEqual(LogEntry.objects.filter(timestamp__gte=self.start, timestamp__lt=self.end).count(), 3000)
+        self.assertEqual(HourlyLogCount.objects.aggregate(total=Sum('count'))['total'], 3000)
+        self.assertEqual(
+            count_log_entries('Failed password', self.start, self.end),
+            LogEntry.objects.filter(action='Failed password').count(),
+        )
+
+    def test_generate_traffic_writes_ndjson_batches(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('generate_traffic', rows='1050', span='1h', hosts=50, ndjson=directory,
+                         batch_size=500, gzip=True, stdout=StringIO())
+            names = sorted(os.listdir(directory))
+            self.assertEqual(names, ['batch-000001.ndjson.gz', 'batch-000002.ndjson.gz', 'batch-000003.ndjson.gz'])
+            with gzip.open(os.path.join(directory, names[-1]), 'rt') as file:
+                records = [json.loads(line) for line in file]
+        self.assertEqual(len(records), 50)
+        self.assertEqual(set(records[0]), {'message', 'timestamp', 'host'})
+        self.assertEqual(LogEntry.objects.count(), 0)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Archiving uses COPY, which needs PostgreSQL')
+class RetentionTestCase(TestCase):
+    def setUp(self):
+        """Ten days of log entries and alerts, two a day, with retention set to five days."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.current_time = datetime(2026, 3, 20, 12, tzinfo=timezone.utc)
+        store_log_entries([
+            LogEntry(timestamp=self.current_time - timedelta(days=i // 2, hours=i % 2), source_ip=f"10.9.0.{i + 1}",
+                     action="Failed password" if i % 2 else "Accepted password", source="vector", host="web-01")
+            for i in range(20)
+        ])
+        Alert.objects.bulk_create([
+            Alert(title=f"Alert {i}", message="Line one\nline \"two\"", severity="WARNING",
+                  created_at=self.current_time - timedelta(days=i // 2))
+            for i in range(20)
+        ])
+        settings_override = override_settings(LOG_ENTRY_RETENTION_DAYS=5, ALERT_RETENTION_DAYS=5, ARCHIVE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_purge_archives_expired_days_and_keeps_counts(self):
+        failed = count_log_entries("Failed password")
+        cutoff = datetime(2026, 3, 15, tzinfo=timezone.utc)
+        expired = LogEntry.objects.filter(timestamp__lt=cutoff).count()
+        # Rows stored without the ingest path are folded into the rollups before they go.
+        LogEntry.objects.create(timestamp=cutoff - timedelta(days=2), source_ip="10.9.1.1",
+                                action="Failed password", source="vector", host="web-02")
+
+        purged = retention.purge_expired(self.directory, batch_size=1, current_time=self.current_time)
+
+        self.assertEqual(purged, {"logentry": expired + 1, "alert": 8})
+        self.assertFalse(LogEntry.objects.filter(timestamp__lt=cutoff).exists())
+        self.assertEqual(LogEntry.objects.count(), 20 - expired)
+        self.assertEqual(count_log_entries("Failed password"), failed + 1)
+        days = retention.archived_days(self.directory, retention.LOG_ENTRIES)
+        self.assertEqual([f"{day:%d}" for day in days], ["11", "12", "13", "14"])
+        parts = retention.list_parts(retention.partition_path(self.directory, retention.LOG_ENTRIES, days[0]))
+        self.assertEqual([os.path.basename(part) for part in parts], ["part-00001.csv.gz", "part-00002.csv.gz"])
+        with gzip.open(parts[0], "rt") as file:
+            self.assertEqual(file.readline().strip(), "id,timestamp,source_ip,action,source,host")
+
+        # Archived days are left alone by a rollup rebuild, and a second purge has nothing to do.
+        call_command("backfill_rollups", since="2026-03-01", stdout=StringIO())
+        self.assertEqual(count_log_entries("Failed password"), failed + 1)
+        self.assertEqual(retention.purge_expired(self.directory, 100, current_time=self.current_time),
+                         {"logentry": 0, "alert": 0})
+
+    def test_rehydrate_restores_rows_and_holds_them(self):
+        before = {entry.pk: entry.timestamp for entry in LogEntry.objects.all()}
+        alerts = list(Alert.objects.order_by("pk").values_list("pk", "message", "created_at"))
+        retention.purge_expired(self.directory, 3, current_time=self.current_time)
+        failed = count_log_entries("Failed password")
+
+        output = StringIO()
+        call_command("rehydrate_archive", since="2026-03-10", until="2026-03-14", stdout=output)
+        self.assertIn("Restored 8 logentry row(s) from 4 day(s)", output.getvalue())
+        call_command("rehydrate_archive", since="2026-03-10", until="2026-03-14", model="alert", stdout=StringIO())
+        self.assertEqual({entry.pk: entry.timestamp for entry in LogEntry.objects.all()}, before)
+        self.assertEqual(list(Alert.objects.order_by("pk").values_list("pk", "message", "created_at")), alerts)
+        self.assertEqual(count_log_entries("Failed password"), failed)
+
+        # Restoring again adds nothing, and restored days are not purged until their hold ends.
+        hold_until = now() + timedelta(days=7)
+        day = datetime(2026, 3, 12, tzinfo=timezone.utc)
+        self.assertEqual(retention.rehydrate_day(retention.LOG_ENTRIES, day, self.directory, hold_until), 0)
+        self.assertEqual(retention.purge_expired(self.directory, 3, current_time=self.current_time),
+                         {"logentry": 0, "alert": 0})
+        partition = retention.partition_path(self.directory, retention.LOG_ENTRIES, day)
+        parts = retention.list_parts(partition)
+        purged = retention.purge_expired(self.directory, 3, current_time=hold_until + timedelta(seconds=1))
+        self.assertEqual(purged, {"logentry": 20, "alert": 20})
+        self.assertEqual(count_log_entries("Failed password"), failed)
+        # The restored rows were already archived, so no duplicate parts are written for them.
+        self.assertEqual(retention.list_parts(partition), parts)
+        self.assertEqual(retention.rehydrate_day(retention.LOG_ENTRIES, day, self.directory, hold_until), 2)
+
+    def test_rebuild_keeps_rollups_of_archived_days(self):
+        retention.purge_expired(self.directory, 100, current_time=self.current_time)
+        failed = count_log_entries("Failed password")
+        self.assertEqual(rebuild_rollups(datetime(2026, 3, 1, tzinfo=timezone.utc), self.current_time), 20 - 4)
+        self.assertEqual(count_log_entries("Failed password"), failed)
+
@@ -0,0 +1,354 @@
+"""
+Synthetic SSH authentication traffic for capacity testing, used by the
+generate_traffic command.
+
+Four scenarios are mixed in configurable proportions:
+
+- ``normal``: each host's own users logging in from a few internal
+  addresses, mostly with keys, with the odd mistyped password
+- ``bruteforce``: one address sending a burst of hundreds of failed
+  passwords to one host, a few seconds apart
+- ``spray``: one address trying common user names across many hosts,
+  minutes apart, so it never reaches the brute-force threshold
+- ``botnet``: hundreds of addresses spread over many subnets, each making a
+  few attempts against random hosts over an hour or two
+
+Traffic is generated one time slice at a time and comes out in timestamp
+order. The same seed and options always give the same events. They can be
+loaded straight into LogEntry with COPY, or written as NDJSON batches in
+the format agents post to /api/logs/, so that replaying them exercises the
+parsers and detection too.
+"""
+import gzip
+import heapq
+import io
+import json
+import math
+import os
+import random
+import re
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection, transaction
+
+from .models import LogEntry
+
+SCENARIOS = ('normal', 'bruteforce', 'spray', 'botnet')
+DEFAULT_MIX = {'normal': 70, 'bruteforce': 10, 'spray': 10, 'botnet': 10}
+DISTRIBUTIONS = ('uniform', 'diurnal')
+
+SLICE_LENGTH = timedelta(hours=1)
+COPY_CHUNK_SIZE = 100_000
+
+# Message template and the action the parsers classify it as, per kind of event.
+MESSAGES = {
+    'publickey': ("Accepted publickey for {user} from {ip} port {port} ssh2", "Accepted publickey"),
+    'accepted': ("Accepted password for {user} from {ip} port {port} ssh2", "Accepted password"),
+    'failed': ("Failed password for {user} from {ip} port {port} ssh2", "Failed password"),
+    'invalid': ("Failed password for invalid user {user} from {ip} port {port} ssh2", "Failed password"),
+    'probe': ("Invalid user {user} from {ip} port {port}", "Invalid user"),
+}
+ACTIONS = {kind: action for kind, (_, action) in MESSAGES.items()}
+
+LOCAL_USERS = ('deploy', 'ubuntu', 'admin', 'backup', 'ci', 'ops', 'git', 'monitor', 'dev', 'app')
+ATTACK_USERS = (
+    'root', 'admin', 'test', 'user', 'oracle', 'postgres', 'ubuntu', 'guest', 'ftpuser', 'pi',
+    'support', 'git', 'deploy', 'nagios', 'hadoop', 'mysql', 'jenkins', 'ansible', 'test1', 'server',
+)
+# First octets of publicly routed space that attack traffic is drawn from.
+ATTACK_NETWORKS = (
+    5, 23, 31, 45, 46, 61, 77, 80, 91, 103, 109, 112, 118, 141, 159, 163, 175, 178, 185, 193, 194, 212, 218, 222,
+)
+
+SPAN_PATTERN = re.compile(r'^(\d+)([smhd])$')
+SPAN_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+def parse_span(value):
+    """Returns a timedelta for a span such as 90m, 12h or 30d."""
+    match = SPAN_PATTERN.match(str(value).strip().lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid span '{value}'.")
+    return timedelta(**{SPAN_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def parse_mix(value):
+    """
+    Parses scenario weights such as "normal=70,bruteforce=10,spray=10,botnet=10".
+
+    Scenarios left out get no traffic; the weights need not add up to 100.
+
+    :return: Dict of scenario to fraction of the total
+    """
+    weights = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}'.")
+        weights[name] = float(weight)
+    total = sum(weights.values())
+    if total <= 0 or any(weight < 0 for weight in weights.values()):
+        raise ValueError("Scenario weights must be positive.")
+    return {name: weight / total for name, weight in weights.items()}
+
+
+def format_message(kind, user, ip, port):
+    """Returns the sshd message for an event."""
+    return MESSAGES[kind][0].format(user=user, ip=ip, port=port)
+
+
+def format_timestamp(timestamp):
+    """Formats a POSIX timestamp as ISO 8601 in UTC."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class TrafficGenerator:
+    """
+    Generates a fixed number of authentication events over [start, end).
+
+    Events are (timestamp, host, kind, user, ip, port) tuples, where
+    timestamp is a POSIX timestamp and kind a key of MESSAGES.
+
+    :param total: Number of events to generate
+    :param hosts: Number of monitored hosts, named host-0000, host-0001, ...
+    :param mix: Dict of scenario to fraction of the events, from parse_mix
+    :param distribution: 'uniform', or 'diurnal' for normal logins that
+        follow the working day (peaking at 14:00 UTC); attacks are always
+        spread evenly
+    """
+
+    def __init__(self, total, start, end, hosts=1000, mix=None, distribution='uniform', seed=42):
+        if end <= start:
+            raise ValueError("The end of the span must be after its start.")
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution '{distribution}'.")
+        self.total = total
+        self.start = start.timestamp()
+        self.end = end.timestamp()
+        self.mix = mix or parse_mix(','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()))
+        self.distribution = distribution
+        self.rng = random.Random(seed)
+        self.counts = dict.fromkeys(SCENARIOS, 0)
+        self.hosts = [self._host(index) for index in range(hosts)]
+
+    def _host(self, index):
+        rng = self.rng
+        users = tuple(rng.sample(LOCAL_USERS, 2))
+        addresses = tuple(
+            f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}' for _ in range(3)
+        )
+        return f'host-{index:04d}', users, addresses
+
+    def _attacker(self):
+        rng = self.rng
+        return (
+            f'{rng.choice(ATTACK_NETWORKS)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}'
+        )
+
+    def _targets(self):
+        """Per-scenario event counts, rounded so that they add up to total."""
+        targets = {}
+        assigned = 0
+        fraction = 0.0
+        for name in SCENARIOS:
+            fraction += self.mix.get(name, 0)
+            targets[name] = round(self.total * fraction) - assigned
+            assigned += targets[name]
+        return targets
+
+    def _weights(self, name, slices):
+        """Share of a scenario's events due in each slice."""
+        weights = []
+        for first, last in slices:
+            weight = last - first
+            if name == 'normal' and self.distribution == 'diurnal':
+                middle = (first + last) / 2
+                hour = (middle % 86400) / 3600
+                weight *= 1 + 0.8 * math.cos(2 * math.pi * (hour - 14) / 24)
+            weights.append(weight)
+        total = sum(weights)
+        return [weight / total for weight in weights]
+
+    def events(self):
+        """Yields every event, oldest first."""
+        step = SLICE_LENGTH.total_seconds()
+        bounds = [self.start + index * step for index in range(math.ceil((self.end - self.start) / step))]
+        slices = list(zip(bounds, bounds[1:] + [self.end]))
+        targets = self._targets()
+        weights = {name: self._weights(name, slices) for name in SCENARIOS}
+        due = dict.fromkeys(SCENARIOS, 0.0)
+        pending = []
+
+        for index, (first, last) in enumerate(slices):
+            for name in SCENARIOS:
+                due[name] += targets[name] * weights[name][index]
+                # A campaign can run past its slice's share; later slices
+                # then start fewer, so the totals stay exact.
+                wanted = min(round(due[name]), targets[name]) - self.counts[name]
+                if index == len(slices) - 1:
+                    wanted = targets[name] - self.counts[name]
+                while wanted > 0:
+                    campaign = getattr(self, f'_{name}')(first, last, wanted, targets[name] - self.counts[name])
+                    for event in campaign:
+                        heapq.heappush(pending, event)
+                    self.counts[name] += len(campaign)
+                    wanted -= len(campaign)
+            while pending and pending[0][0] < last:
+                yield heapq.heappop(pending)
+        while pending:
+            yield heapq.heappop(pending)
+
+    def _fit(self, start, offsets):
+        """Places a campaign's offsets from start, dropping any that fall after the end of the span."""
+        return [start + offset for offset in offsets if start + offset < self.end]
+
+    def _normal(self, first, last, wanted, remaining):
+        """Individual logins spread over the slice."""
+        rng = self.rng
+        hosts = self.hosts
+        width = last - first
+        events = []
+        for _ in range(wanted):
+            host, users, addresses = hosts[rng.randrange(len(hosts))]
+            roll = rng.random()
+            kind = 'publickey' if roll < 0.75 else ('accepted' if roll < 0.95 else 'failed')
+            events.append((
+                first + rng.random() * width, host, kind,
+                users[roll < 0.6], addresses[rng.randrange(3)], rng.randrange(32768, 61000),
+            ))
+        return events
+
+    def _bruteforce(self, first, last, wanted, remaining):
+        """One burst of failed passwords from one address against one host."""
+        rng = self.rng
+        attempts = min(int(30 * rng.paretovariate(1.2)), 2000, remaining)
+        host = self.hosts[rng.randrange(len(self.hosts))][0]
+        ip = self._attacker()
+        interval = rng.uniform(0.3, 4)
+        fixed_user = rng.random() < 0.5
+        offsets = []
+        offset = 0.0
+        for _ in range(attempts):
+            offsets.append(offset)
+            offset += interval * rng.uniform(0.5, 1.5)
+        events = []
+        for index, timestamp in enumerate(self._fit(first + rng.random() * (last - first), offsets)):
+            user = 'root' if fixed_user else ATTACK_USERS[index % len(ATTACK_USERS)]
+            events.append((timestamp, host, 'failed' if user == 'root' else 'invalid', user, ip,
+                           rng.randrange(32768, 61000)))
+        return events
+
+    def _spray(self, first, last, wanted, remaining):
+        """One address trying a user name on a different host every few minutes."""
+        rng = self.rng
+        attempts = min(rng.randint(20, 200), remaining)
+        ip = self._attacker()
+        user = rng.choice(ATTACK_USERS)
+        offsets = []
+        offset = 0.0
+        for _ in range(attempts):
+            offsets.append(offset)
+            offset += rng.uniform(120, 900)
+        events = []
+        for timestamp in self._fit(first + rng.random() * (last - first), offsets):
+            host = self.hosts[rng.randrange(len(self.hosts))][0]
+            kind = 'probe' if rng.random() < 0.2 else ('failed' if user == 'root' else 'invalid')
+            events.append((timestamp, host, kind, user, ip, rng.randrange(32768, 61000)))
+        return events
+
+    def _botnet(self, first, last, wanted, remaining):
+        """Many addresses, each from its own subnet, making a few attempts against random hosts."""
+        rng = self.rng
+        duration = rng.uniform(600, 7200)
+        attempts = []
+        for _ in range(rng.randint(50, 500)):
+            ip = self._attacker()
+            for _ in range(rng.randint(1, 4)):
+                attempts.append((rng.random() * duration, ip))
+        attempts.sort()
+        attempts = attempts[:remaining]
+        start = first + rng.random() * (last - first)
+        events = []
+        for timestamp, (_, ip) in zip(self._fit(start, [offset for offset, _ in attempts]), attempts):
+            user = rng.choice(ATTACK_USERS)
+            events.append((
+                timestamp, self.hosts[rng.randrange(len(self.hosts))][0],
+                'failed' if user == 'root' else 'invalid', user, ip, rng.randrange(32768, 61000),
+            ))
+        return events
+
+
+def copy_events(events, chunk_size=COPY_CHUNK_SIZE, progress=None):
+    """
+    Loads events into LogEntry with COPY, chunk_size rows per transaction.
+
+    Rows are stored as ingest would store them, but without running
+    detection or updating the rollups.
+
+    :param progress: Called with the number of rows loaded so far after each chunk
+    :return: Number of rows loaded
+    """
+    sql = f"COPY {LogEntry._meta.db_table} (timestamp, source_ip, action, source, host) FROM STDIN"
+    loaded = 0
+
+    def flush(buffer):
+        buffer.seek(0)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+
+    buffer = io.StringIO()
+    rows = 0
+    for timestamp, host, kind, _, ip, _ in events:
+        buffer.write(f'{format_timestamp(timestamp)}\t{ip}\t{ACTIONS[kind]}\tvector\t{host}\n')
+        rows += 1
+        if rows == chunk_size:
+            flush(buffer)
+            loaded += rows
+            buffer, rows = io.StringIO(), 0
+            if progress:
+                progress(loaded)
+    if rows:
+        flush(buffer)
+        loaded += rows
+        if progress:
+            progress(loaded)
+    return loaded
+
+
+def write_ndjson_batches(events, directory, batch_size, compress=False):
+    """
+    Writes events as NDJSON request bodies for /api/logs/, batch_size records per file.
+
+    Files are named batch-000001.ndjson (.ndjson.gz when compressed) in
+    timestamp order.
+
+    :return: Number of files written
+    """
+    os.makedirs(directory, exist_ok=True)
+    extension = '.ndjson.gz' if compress else '.ndjson'
+    files = 0
+    lines = []
+
+    def flush():
+        nonlocal files
+        files += 1
+        body = ''.join(lines).encode()
+        path = os.path.join(directory, f'batch-{files:06d}{extension}')
+        with open(path, 'wb') as file:
+            file.write(gzip.compress(body) if compress else body)
+        lines.clear()
+
+    for timestamp, host, kind, user, ip, port in events:
+        lines.append(json.dumps({
+            'message': format_message(kind, user, ip, port),
+            'timestamp': format_timestamp(timestamp),
+            'host': host,
+        }) + '\n')
+        if len(lines) == batch_size:
+            flush()
+    if lines:
+        flush()
+    return files
@@ -1,4 +1,7 @@
+from django.conf import settings
 from django.urls import path
+
+from . import async_views
 from .views import (
     LogView,
     RegisterDeviceView,
@@ -12,12 +15,23 @@ from .views import (
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
-    path('logs/', LogView.as_view(), name='logs'),
     path('register/', RegisterDeviceView.as_view(), name='register'),
     path('deregister/', DeregisterDeviceView.as_view(), name='deregister'),
     path('device/token/refresh/', RefreshDeviceTokenView.as_view(), name='refresh_device_token'),
-    path('device/heartbeat/', DeviceHeartbeatView.as_view(), name='device_heartbeat'),
     path('device/status/<str:token>/', DeviceStatusView.as_view(), name='device_status'),
-    path("report_ban/", ReportBanView.as_view(), name="report_ban"),
-    path("blocklist/", GetBlocklistView.as_view(), name="get_blocklist"),
-]
\ No newline at end of file
+]
+
+if settings.ASYNC_AGENT_API:
+    urlpatterns += [
+        path('logs/', async_views.log_view, name='logs'),
+        path('device/heartbeat/', async_views.heartbeat_view, name='device_heartbeat'),
+        path("report_ban/", async_views.report_ban_view, name="report_ban"),
+        path("blocklist/", async_views.blocklist_view, name="get_blocklist"),
+    ]
+else:
+    urlpatterns += [
+        path('logs/', LogView.as_view(), name='logs'),
+        path('device/heartbeat/', DeviceHeartbeatView.as_view(), name='device_heartbeat'),
+        path("report_ban/", ReportBanView.as_view(), name="report_ban"),
+        path("blocklist/", GetBlocklistView.as_view(), name="get_blocklist"),
+    ]
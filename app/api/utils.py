@@ -1,10 +1,9 @@
 import jwt
 from django.conf import settings
 from datetime import datetime, timedelta
-from django.utils.timezone import now
-from django.db.models import Count
 
-from .models import Alert, BlockedIP, LogEntry
+from .alerts import alert_sink
+from .blocklist import ban_ip
 
 # Token lifetimes
 ACCESS_TOKEN_LIFETIME = timedelta(minutes=15)
@@ -63,35 +62,21 @@ def log_alert(title, message, severity='INFO'):
     """
     Logs an alert to the Alert model.
 
+    Alerts are buffered and written in bulk after the response is sent;
+    repeats of the same title and severity are stored as one row with a count.
+
     :param title: Short title of the alert
     :param message: Detailed alert message
     :param severity: Severity level ('INFO', 'WARNING', 'ERROR', 'CRITICAL')
     """
-    Alert.objects.create(title=title, message=message, severity=severity)
+    alert_sink.emit(title, message, severity)
+
 
-def detect_distributed_attack():
+def ban_suspicious_ip(ip):
     """
-    Detects brute-force attacks by identifying IPs with multiple failed login attempts within 1 minute.
-    Automatically re-bans IPs if needed.
+    Bans an IP flagged for a brute-force attack, re-banning it if it was previously unbanned.
     """
-    time_threshold = now() - timedelta(minutes=1)
-
-    suspicious_ips = (
-        LogEntry.objects.filter(action="Failed password", timestamp__gte=time_threshold)
-        .values("source_ip")
-        .annotate(attempt_count=Count("id"))
-        .filter(attempt_count__gte=5)
-    )
-
-    for entry in suspicious_ips:
-        ip = entry["source_ip"]
-        blocked_ip, created = BlockedIP.objects.get_or_create(
-            ip_address=ip,
-            defaults={"reason": "Distributed brute-force attack", "currently_banned": True}
-        )
+    _, _, rebanned = ban_ip(ip, "Distributed brute-force attack")
 
-        if not created and not blocked_ip.currently_banned:
-            blocked_ip.currently_banned = True
-            blocked_ip.banned_at = now()
-            blocked_ip.save()
-            log_alert("Global Ban", f"Global Re-Ban Issued: {ip}")
+    if rebanned:
+        log_alert("Global Ban", f"Global Re-Ban Issued: {ip}")
@@ -1,79 +1,63 @@
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from django.utils.timezone import now
-from django.http import JsonResponse
-import re
+from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.db.models import Max, Min
 import uuid
 
-from .models import LogEntry, ManagedDevice, InstallToken, BlockedIP
+from . import metrics
+from .models import BlockedIP, ManagedDevice, InstallToken
+from .authentication import DeviceRefreshTokenAuthentication, DeviceTokenAuthentication, device_token_cache
 from .utils import (
     generate_device_tokens,
-    verify_token,
     get_client_ip,
-    log_alert,
-    detect_distributed_attack
+    log_alert
 )
+from .blocklist import ban_ip, blocklist_snapshot, get_blocklist_changes, get_blocklist_version
+from .health import count_by_status
+from .heartbeats import heartbeat_buffer
+from .ingest import InvalidLogData, ingest_log_records
+from .spool import spool_log_records
+from .parsers import CompressedJSONParser, MessagePackParser, NDJSONParser
 
 
 class LogView(APIView):
+    authentication_classes = [DeviceTokenAuthentication]
+    parser_classes = [CompressedJSONParser, NDJSONParser, MessagePackParser]
+    permission_classes = [IsAuthenticated]
 
     def post(self, request):
         """Handles log submissions from managed devices."""
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            log_alert("Log Submission Failed", "Authorization header with Bearer token is required.", severity='ERROR')
-            return Response({"error": "Authorization header with Bearer token is required."}, status=status.HTTP_401_UNAUTHORIZED)
+        device = request.user
+
+        log_data = request.data
+        records = [log_data] if isinstance(log_data, dict) else log_data
 
-        access_token = auth_header.split(' ')[1]
         try:
-            decoded_token = verify_token(access_token, token_type='access')
-            unique_id = decoded_token.get('unique_id')
-            device = ManagedDevice.objects.get(unique_id=unique_id)
-            log_alert("Authorization Successful", f"Device {device.hostname} authorized for log submission.", severity='INFO')
-        except ManagedDevice.DoesNotExist:
-            log_alert("Authorization Failed", "Device not found.", severity='WARNING')
-            return Response({"error": "Device not found."}, status=status.HTTP_404_NOT_FOUND)
+            if settings.LOG_SPOOL_ENABLED:
+                queued = spool_log_records(records, get_client_ip(request))
+            else:
+                created, _ = ingest_log_records(records, get_client_ip(request))
+        except (InvalidLogData, ParseError) as e:
+            message = e.detail if isinstance(e, ParseError) else str(e)
+            metrics.LOG_BATCHES_REJECTED.inc('invalid')
+            log_alert("Invalid Log Data", message, severity='ERROR')
+            return Response({"error": message}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            log_alert("Authorization Error", str(e), severity='ERROR')
+            metrics.LOG_BATCHES_REJECTED.inc('error')
+            log_alert("Log Creation Failed", str(e), severity='ERROR')
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        log_data = request.data
-        logs = log_data if isinstance(log_data, list) else [log_data]
-
-        for entry in logs:
-            client_ip = request.META.get('HTTP_X_FORWARDED_FOR') or request.META.get('REMOTE_ADDR')
-            message = entry.get('message')
-            timestamp = entry.get('timestamp')
-            host = entry.get('host', client_ip)
-
-            if not message or not timestamp:
-                log_alert("Invalid Log Data", "Missing 'message' or 'timestamp' in log data.", severity='ERROR')
-                return Response({"error": "Missing 'message' or 'timestamp' in log data."}, status=status.HTTP_400_BAD_REQUEST)
-
-            ip_match = re.search(r'from (\d{1,3}(?:\.\d{1,3}){3})', message)
-            source_ip = ip_match.group(1) if ip_match else None
-
-            action = "Accepted password" if "Accepted password" in message else ("Failed password" if "Failed password" in message else "Unknown")
-
-            if not source_ip:
-                log_alert("Invalid Log Data", "Source IP not found in log message.", severity='ERROR')
-                return Response({"error": "Source IP not found in log message."}, status=status.HTTP_400_BAD_REQUEST)
+        if settings.LOG_SPOOL_ENABLED:
+            log_alert("Log Entries Queued", f"{queued} log entries queued for device {device.hostname}.", severity='INFO')
+            return Response({"status": "Log entries queued"}, status=status.HTTP_202_ACCEPTED)
 
-            try:
-                LogEntry.objects.create(
-                    timestamp=timestamp,
-                    source_ip=source_ip,
-                    action=action,
-                    source="vector",
-                    host=host
-                )
-                log_alert("Log Entry Created", f"Log entry created for source IP {source_ip}.", severity='INFO')
-            except Exception as e:
-                log_alert("Log Creation Failed", str(e), severity='ERROR')
-                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-
-        detect_distributed_attack()
+        log_alert("Log Entries Created", f"{created} log entries created for device {device.hostname}.", severity='INFO')
         return Response({"status": "Log entries created"}, status=status.HTTP_201_CREATED)
 
 
@@ -130,80 +114,48 @@ class RegisterDeviceView(APIView):
 
 
 class DeregisterDeviceView(APIView):
+    authentication_classes = [DeviceTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
     def delete(self, request):
         """Deregisters a managed device using a valid token."""
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            log_alert("Deregistration Failed", "Authorization header missing or improperly formatted.", severity='ERROR')
-            return Response({"detail": "Authorization header missing or improperly formatted."}, status=status.HTTP_401_UNAUTHORIZED)
-
-        access_token = auth_header.split(' ')[1]
+        device = request.user
+        device_id = device.pk
         try:
-            decoded_token = verify_token(access_token, token_type='access')
-            unique_id = decoded_token.get('unique_id')
-            device = ManagedDevice.objects.get(unique_id=unique_id)
             device.delete()
-            log_alert("Device Deregistered", f"Device {device.hostname} deregistered successfully.", severity='INFO')
-            return Response({"detail": "Device deregistered successfully."}, status=status.HTTP_200_OK)
-        except ManagedDevice.DoesNotExist:
-            log_alert("Deregistration Failed", "Device not found.", severity='WARNING')
-            return Response({"detail": "Device not found or already deregistered."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             log_alert("Deregistration Error", str(e), severity='ERROR')
             return Response({"detail": f"Error during deregistration: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
+        device_token_cache.invalidate_device(device_id)
+        log_alert("Device Deregistered", f"Device {device.hostname} deregistered successfully.", severity='INFO')
+        return Response({"detail": "Device deregistered successfully."}, status=status.HTTP_200_OK)
+
 
 class RefreshDeviceTokenView(APIView):
+    authentication_classes = [DeviceRefreshTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
     def post(self, request):
         """Refreshes access and refresh tokens for an authenticated device."""
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            log_alert("Token Refresh Failed", "Authorization header with Bearer token is required.", severity='ERROR')
-            return Response({"error": "Authorization header with Bearer token is required."}, status=status.HTTP_401_UNAUTHORIZED)
+        device = request.user
+        tokens = generate_device_tokens(device.unique_id)
 
-        refresh_token = auth_header.split(' ')[1]
-        try:
-            decoded_token = verify_token(refresh_token, token_type='refresh')
-            unique_id = decoded_token.get('unique_id')
-
-            device = ManagedDevice.objects.get(unique_id=unique_id)
-            tokens = generate_device_tokens(device.unique_id)
-
-            log_alert("Token Refreshed", f"Tokens refreshed for device {device.hostname}.", severity='INFO')
-            return Response({"message": "Tokens refreshed successfully.", "tokens": tokens}, status=status.HTTP_200_OK)
-        except ManagedDevice.DoesNotExist:
-            log_alert("Token Refresh Failed", "Device not found.", severity='WARNING')
-            return Response({"error": "Device not found."}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            log_alert("Token Refresh Error", str(e), severity='ERROR')
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        log_alert("Token Refreshed", f"Tokens refreshed for device {device.hostname}.", severity='INFO')
+        return Response({"message": "Tokens refreshed successfully.", "tokens": tokens}, status=status.HTTP_200_OK)
 
 
 class DeviceHeartbeatView(APIView):
+    authentication_classes = [DeviceTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
     def post(self, request):
         """Receives heartbeat from a device and updates its check-in time."""
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            log_alert("Heartbeat Failed", "Authorization token missing.", severity='ERROR')
-            return Response({"error": "Authorization token missing."}, status=status.HTTP_401_UNAUTHORIZED)
+        device = request.user
+        heartbeat_buffer.put(device.pk, now())
 
-        access_token = auth_header.split(' ')[1]
-        try:
-            decoded_token = verify_token(access_token, token_type='access')
-            unique_id = decoded_token.get('unique_id')
-
-            device = ManagedDevice.objects.get(unique_id=unique_id)
-            device.last_check_in = now()
-            device.save()
-
-            log_alert("Heartbeat Received", f"Heartbeat received from device {device.hostname}.", severity='INFO')
-            return Response({"message": "Heartbeat received."}, status=status.HTTP_200_OK)
-        except ManagedDevice.DoesNotExist:
-            log_alert("Heartbeat Failed", "Device not found.", severity='WARNING')
-            return Response({"error": "Device not found."}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            log_alert("Heartbeat Error", str(e), severity='ERROR')
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        log_alert("Heartbeat Received", f"Heartbeat received from device {device.hostname}.", severity='INFO')
+        return Response({"message": "Heartbeat received."}, status=status.HTTP_200_OK)
 
 
 class DeviceStatusView(APIView):
@@ -223,13 +175,46 @@ class DeviceStatusView(APIView):
             return Response({"error": "Device not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+def encoded_blocklist_response(request, snapshot):
+    """Returns the pre-encoded full blocklist, gzipped if the client accepts it."""
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        response = HttpResponse(snapshot.gzip_body, content_type="application/json")
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(snapshot.body, content_type="application/json")
+    response["ETag"] = snapshot.etag
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
 class GetBlocklistView(APIView):
     def get(self, request):
-        """Returns blocked and unblocked IP addresses."""
+        """
+        Returns blocked and unblocked IP addresses.
+
+        With ?since=<version>, returns only the IPs added to or removed from the
+        blocklist after that version, or 304 if nothing has changed. With
+        ?cidr=1, returns the blocked IPs as CIDR blocks instead, always in full.
+        """
+        since = request.query_params.get("since")
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return Response({"error": "since must be an integer blocklist version."}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            blocked_ips = BlockedIP.objects.filter(currently_banned=True).values_list("ip_address", flat=True)
-            unblocked_ips = BlockedIP.objects.filter(currently_banned=False).values_list("ip_address", flat=True)
-            return Response({"blocked_ips": list(blocked_ips), "unblocked_ips": list(unblocked_ips)}, status=status.HTTP_200_OK)
+            cidr = request.query_params.get("cidr") == "1"
+            snapshot = blocklist_snapshot.get_aggregated() if cidr else blocklist_snapshot.get()
+            if since == snapshot.version or request.headers.get("If-None-Match") == snapshot.etag:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": snapshot.etag})
+
+            if since is not None and 0 <= since < snapshot.version and not cidr:
+                added, removed = get_blocklist_changes(since, snapshot.version)
+                data = {"version": snapshot.version, "since": since, "added": added, "removed": removed}
+                return Response(data, status=status.HTTP_200_OK, headers={"ETag": snapshot.etag})
+
+            return encoded_blocklist_response(request, snapshot)
         except Exception as e:
             log_alert("Error getting blocklist", f"{str(e)}", severity='ERROR')
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -247,15 +232,40 @@ class ReportBanView(APIView):
                 log_alert("Error blocking IP", "IP address is required", severity='WARNING')
                 return Response({"error": "IP address is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-            blocked_ip, _ = BlockedIP.objects.get_or_create(ip_address=ip, defaults={"reason": reason})
-
-            if not blocked_ip.currently_banned:
-                blocked_ip.currently_banned = True
-                blocked_ip.banned_at = now()
-                blocked_ip.save()
+            blocked_ip, _, _ = ban_ip(ip, reason)
 
             log_alert("IP Blocked", f"{blocked_ip} has been blocked.")
             return Response({"status": "IP added to blocklist"}, status=status.HTTP_201_CREATED)
         except Exception as e:
             log_alert("Error blocking IP", f"{str(e)}", severity='ERROR')
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def metrics_view(request):
+    """
+    Serves the metrics of every worker process in the Prometheus text format,
+    followed by blocklist and device gauges read from the database.
+    """
+    current_time = now()
+    by_status = count_by_status(current_time)
+    check_ins = ManagedDevice.objects.aggregate(newest=Max('last_check_in'), oldest=Min('last_check_in'))
+    # This worker's unflushed heartbeats are newer than anything in the database.
+    pending = heartbeat_buffer.pending().values()
+    if pending and (check_ins['newest'] is None or max(pending) > check_ins['newest']):
+        check_ins['newest'] = max(pending)
+
+    gauges = [
+        ('alarm_blocklist_version', 'Current blocklist version.', [({}, get_blocklist_version())]),
+        ('alarm_blocklist_banned_ips', 'Addresses currently banned.',
+         [({}, BlockedIP.objects.filter(currently_banned=True).count())]),
+        ('alarm_devices', 'Managed devices by health status.',
+         [({'status': health}, count) for health, count in by_status.items()]),
+        ('alarm_device_heartbeat_age_seconds', 'Seconds since the most and least recent device check-in.',
+         [({'device': device}, (current_time - checked_in).total_seconds())
+          for device, checked_in in check_ins.items() if checked_in is not None]),
+    ]
+    body = metrics.render_collected(settings.METRICS_DIR) + ''.join(
+        metrics.render(name, documentation, 'gauge', [(name, labels, value) for labels, value in samples])
+        for name, documentation, samples in gauges
+    )
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
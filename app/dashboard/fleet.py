@@ -0,0 +1,104 @@
+"""
+The managed devices page and live feed: filters, sorting, per-OS summaries
+and status changes, built on the health statuses of api.health.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from api.health import STATUSES, annotate_health, device_status, health_cutoffs, health_filter
+from api.models import ManagedDevice
+from .search import search_devices
+
+SORT_FIELDS = {
+    'hostname': ('hostname', 'id'),
+    'ip': ('ip_address', 'id'),
+    'os': ('os', 'hostname', 'id'),
+    # Most recently seen first, which is also healthiest first.
+    'status': ('-last_check_in', 'id'),
+}
+
+
+def fleet_summary(current_time):
+    """
+    Counts devices per status, overall and per OS, in one grouped query.
+
+    :return: (dict of status to count, list of per-OS dicts with 'os', 'total' and a count per status)
+    """
+    rows = (
+        annotate_health(ManagedDevice.objects.all(), current_time)
+        .values('os', 'health').annotate(count=Count('id')).order_by()
+    )
+    by_status = dict.fromkeys(STATUSES, 0)
+    by_os = {}
+    for row in rows:
+        by_status[row['health']] += row['count']
+        counts = by_os.setdefault(row['os'], {'os': row['os'], 'total': 0, **dict.fromkeys(STATUSES, 0)})
+        counts[row['health']] += row['count']
+        counts['total'] += row['count']
+    return by_status, sorted(by_os.values(), key=lambda counts: (-counts['total'], counts['os']))
+
+
+def filter_devices(queryset, current_time, status=None, os=None, query=None, pending=None):
+    """
+    Applies the managed devices page filters: status, exact OS, and a hostname or IP search.
+
+    :param pending: Unflushed check-in times by device id, applied to the status filter
+    """
+    if status in STATUSES:
+        queryset = queryset.filter(health_filter(status, current_time, pending))
+    if os:
+        queryset = queryset.filter(os=os)
+    if query:
+        queryset = search_devices(queryset, query)
+    return queryset
+
+
+def status_changes(state, current_time, pending=None):
+    """
+    Finds devices whose status changed since the last call, for the live feed.
+
+    Only devices that can have changed are read: those whose check-in
+    crossed a status boundary since state['checked_at'], those that checked
+    in recently (allowing for the heartbeat buffers), and those with a
+    check-in still in this process' heartbeat buffer.
+
+    :param state: {'checked_at': datetime, 'statuses': {device id: status}}, updated in place
+    :param pending: Unflushed check-in times by device id
+    :return: List of dicts with the id, hostname, last_check_in and status of each changed device
+    """
+    pending = pending or {}
+    since = state['checked_at']
+    previous_healthy_after, previous_degraded_after = health_cutoffs(since)
+    healthy_after, degraded_after = health_cutoffs(current_time)
+    recently = since - timedelta(seconds=2 * settings.HEARTBEAT_FLUSH_INTERVAL)
+
+    candidates = ManagedDevice.objects.filter(
+        Q(last_check_in__gte=recently)
+        | Q(last_check_in__gte=previous_healthy_after, last_check_in__lt=healthy_after)
+        | Q(last_check_in__gte=previous_degraded_after, last_check_in__lt=degraded_after)
+        | Q(id__in=list(pending))
+    ).values_list('id', 'hostname', 'last_check_in')
+
+    changed = []
+    for pk, hostname, last_check_in in candidates:
+        checked_in = pending.get(pk)
+        if checked_in is not None and (last_check_in is None or checked_in > last_check_in):
+            last_check_in = checked_in
+        status = device_status(last_check_in, current_time)
+        if state['statuses'].get(pk) != status:
+            state['statuses'][pk] = status
+            changed.append({'id': pk, 'hostname': hostname, 'last_check_in': last_check_in, 'status': status})
+    state['checked_at'] = current_time
+    return changed
+
+
+def initial_statuses(current_time, pending=None):
+    """Returns the starting state for status_changes."""
+    rows = annotate_health(ManagedDevice.objects.all(), current_time).values_list('id', 'health')
+    statuses = dict(rows)
+    for pk, checked_in in (pending or {}).items():
+        if pk in statuses:
+            statuses[pk] = device_status(checked_in, current_time)
+    return {'checked_at': current_time, 'statuses': statuses}
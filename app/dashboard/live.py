@@ -0,0 +1,196 @@
+"""
+Live dashboard updates over Server-Sent Events.
+
+Every browser with a dashboard page open holds one event stream. Rather
+than each stream querying the database, one LiveFeedHub per worker process
+polls every LIVE_FEED_POLL_INTERVAL seconds while anyone is connected and
+publishes what changed to every subscriber, so the database sees the same
+handful of queries per interval however many viewers there are.
+
+Events, each with a JSON payload:
+
+- ``logs``: new log entries, newest first (at most LIVE_FEED_MAX_ROWS)
+- ``counts``: number of new log entries per action, for the dashboard counters
+- ``alerts``: new alerts, newest first (at most LIVE_FEED_MAX_ROWS)
+- ``bans``: ban and unban changes, oldest first
+- ``devices``: devices whose Healthy/Degraded/Offline status changed
+- ``install``: an install token was used by a newly registered device
+- ``reload``: this browser fell too far behind and should reload the page
+
+The feed is best effort: a row committed after a later id has already been
+published is not sent.
+"""
+import asyncio
+import json
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from api.async_views import run_in_database
+from api.heartbeats import heartbeat_buffer
+from api.models import Alert, BlocklistChange, InstallToken, LogEntry
+from .fleet import initial_statuses, status_changes
+
+logger = logging.getLogger(__name__)
+
+
+def _pending_tokens():
+    return set(
+        InstallToken.objects.filter(is_used=False, expires_at__gt=timezone.now()).values_list('token', flat=True)
+    )
+
+
+def initial_state():
+    """Returns the position the feed starts from: everything already in the database counts as seen."""
+    return {
+        'log_id': LogEntry.objects.aggregate(last=Max('id'))['last'] or 0,
+        'alert_id': Alert.objects.aggregate(last=Max('id'))['last'] or 0,
+        'blocklist_version': BlocklistChange.objects.aggregate(last=Max('id'))['last'] or 0,
+        'devices': initial_statuses(timezone.now(), heartbeat_buffer.pending()),
+        'pending_tokens': _pending_tokens(),
+    }
+
+
+def collect_changes(state):
+    """
+    Queries everything that changed since state.
+
+    :param state: Position from initial_state or a previous call
+    :return: (list of (event, data) pairs, new state)
+    """
+    events = []
+    new_state = dict(state)
+    limit = settings.LIVE_FEED_MAX_ROWS
+
+    logs = list(
+        LogEntry.objects.filter(id__gt=state['log_id']).order_by('-id')
+        .values('id', 'timestamp', 'source_ip', 'action', 'source', 'host')[:limit]
+    )
+    if logs:
+        counts = (
+            LogEntry.objects.filter(id__gt=state['log_id'], id__lte=logs[0]['id'])
+            .values('action').annotate(count=Count('id')).order_by()
+        )
+        events.append(('logs', logs))
+        events.append(('counts', {row['action']: row['count'] for row in counts}))
+        new_state['log_id'] = logs[0]['id']
+
+    alerts = list(
+        Alert.objects.filter(id__gt=state['alert_id']).order_by('-id')
+        .values('id', 'created_at', 'severity', 'title', 'message', 'count')[:limit]
+    )
+    if alerts:
+        events.append(('alerts', alerts))
+        new_state['alert_id'] = alerts[0]['id']
+
+    bans = list(
+        BlocklistChange.objects.filter(id__gt=state['blocklist_version']).order_by('id')
+        .values('id', 'ip_address', 'banned', 'changed_at')
+    )
+    if bans:
+        events.append(('bans', bans))
+        new_state['blocklist_version'] = bans[-1]['id']
+
+    changed = status_changes(state['devices'], timezone.now(), heartbeat_buffer.pending())
+    if changed:
+        events.append(('devices', changed))
+
+    if state['pending_tokens']:
+        used = InstallToken.objects.filter(token__in=state['pending_tokens'], is_used=True)
+        for token in used.values_list('token', flat=True):
+            events.append(('install', {'token': str(token), 'status': 'Healthy'}))
+    new_state['pending_tokens'] = _pending_tokens()
+
+    return events, new_state
+
+
+def encode_event(event, data):
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))}\n\n"
+
+
+class LiveFeedHub:
+    """
+    Shares one database poller between every live feed stream in the process.
+
+    The poller starts with the first subscriber and stops once the last one
+    leaves. Each subscriber has a queue of at most queue_size events; one
+    that falls behind has its queue replaced by a single ``reload`` event
+    instead of holding up the others.
+    """
+
+    def __init__(self, poll_interval, queue_size):
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._task = None
+
+    def subscribe(self):
+        """Returns a new subscriber queue, starting the poller if needed. Must be called on the event loop."""
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event, data):
+        """Queues an event for every subscriber."""
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(('reload', {}))
+
+    async def stream(self):
+        """
+        Yields Server-Sent Events for one browser.
+
+        Sends a keepalive comment when idle, and ends after LIVE_FEED_MAX_AGE
+        seconds so that a stream whose browser has gone away is not kept
+        forever; EventSource reconnects on its own.
+        """
+        queue = self.subscribe()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.LIVE_FEED_MAX_AGE
+        try:
+            yield f"retry: {settings.LIVE_FEED_RETRY_MS}\n\n"
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    event, data = await asyncio.wait_for(
+                        queue.get(), min(settings.LIVE_FEED_KEEPALIVE, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield encode_event(event, data)
+        finally:
+            self.unsubscribe(queue)
+
+    async def _poll(self):
+        state = None
+        while self._subscribers:
+            try:
+                if state is None:
+                    state = await run_in_database(initial_state)
+                else:
+                    events, state = await run_in_database(collect_changes, state)
+                    for event, data in events:
+                        self.publish(event, data)
+            except Exception:
+                # Keep the streams open; the next poll retries.
+                logger.exception("Live feed poll failed")
+            await asyncio.sleep(self.poll_interval)
+
+
+live_hub = LiveFeedHub(settings.LIVE_FEED_POLL_INTERVAL, settings.LIVE_FEED_QUEUE_SIZE)
@@ -0,0 +1,147 @@
+import base64
+import json
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, position):
+    """Packs a direction and a (value, id) position into an opaque URL-safe string."""
+    data = json.dumps([direction, position], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Unpacks a cursor from encode_cursor.
+
+    :return: (direction, (value, id) or None), or None if the cursor is missing or malformed
+    """
+    if not cursor:
+        return None
+    try:
+        direction, position = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if direction not in (NEXT, PREVIOUS):
+            return None
+        if position is not None:
+            value, pk = position
+            position = (parse_datetime(value), int(pk))
+            if position[0] is None:
+                return None
+    except (ValueError, TypeError):
+        return None
+    return direction, position
+
+
+def estimated_count(queryset):
+    """
+    Returns the planner's row estimate for a queryset instead of running COUNT(*).
+
+    Falls back to an exact count on databases other than PostgreSQL.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator, with cursors for the pages either side of it."""
+
+    def __init__(self, paginator, object_list, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        return encode_cursor(NEXT, self.paginator.position(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous:
+            return None
+        return encode_cursor(PREVIOUS, self.paginator.position(self.object_list[0]))
+
+    @property
+    def last_cursor(self):
+        return encode_cursor(PREVIOUS, None)
+
+    @cached_property
+    def estimated_count(self):
+        """Exact when everything fits on this page, otherwise the planner's estimate."""
+        if not self.has_next and not self.has_previous:
+            return len(self.object_list)
+        return max(self.paginator.estimated_count, len(self.object_list))
+
+
+class KeysetPaginator:
+    """
+    Pages through a queryset newest first by (field, id), seeking from the
+    edge of the current page rather than counting and skipping rows.
+
+    Every page costs one index range scan of per_page + 1 rows however deep
+    it is, provided an index on (field, id) (after any equality filters)
+    exists. Pages are addressed by the cursors on KeysetPage instead of
+    numbers, and the total is only estimated (see estimated_count).
+    """
+
+    def __init__(self, queryset, field, per_page):
+        self.queryset = queryset
+        self.field = field
+        self.per_page = per_page
+
+    def position(self, obj):
+        return getattr(obj, self.field).isoformat(), obj.pk
+
+    def get_page(self, cursor):
+        """Returns the page a cursor points to, or the first page for a missing or invalid cursor."""
+        decoded = decode_cursor(cursor)
+        direction, position = decoded if decoded else (NEXT, None)
+
+        if direction == NEXT:
+            queryset = self.queryset.order_by(f'-{self.field}', '-pk')
+            if position is not None:
+                queryset = queryset.filter(self._seek(position, 'lt'))
+        else:
+            queryset = self.queryset.order_by(self.field, 'pk')
+            if position is not None:
+                queryset = queryset.filter(self._seek(position, 'gt'))
+
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if direction == PREVIOUS and position is not None and not more:
+            # Paged back to the start: show a full first page rather than a short one.
+            return self.get_page(None)
+
+        if direction == NEXT:
+            return KeysetPage(self, rows, has_next=more, has_previous=position is not None)
+        rows.reverse()
+        return KeysetPage(self, rows, has_next=position is not None, has_previous=more)
+
+    @property
+    def estimated_count(self):
+        return estimated_count(self.queryset.order_by())
+
+    def _seek(self, position, lookup):
+        value, pk = position
+        # The redundant bound on the field alone gives the planner an index range to scan.
+        return Q(**{f'{self.field}__{lookup}e': value}) & (
+            Q(**{f'{self.field}__{lookup}': value}) | Q(**{self.field: value, f'pk__{lookup}': pk})
+        )
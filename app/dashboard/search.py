@@ -0,0 +1,166 @@
+"""
+Search box parsing for the dashboard lists.
+
+A query is split into terms, and each term is sent to the lookup that has
+an index behind it instead of OR-ing __icontains over every column:
+
+- an IP address, CIDR network or dotted prefix (``10.0.``, ``192.168.1``)
+  becomes a source IP range
+- a hostname (``web-01``, ``db.example.com``) becomes a host prefix match
+- anything else is matched word by word against the full-text index,
+  with the last word of a term treated as a prefix
+
+Terms can be pinned to a field with ``field:value``, e.g. ``ip:10.0.0.0/8``
+or ``host:web``, and quoted to keep spaces. All terms must match.
+"""
+import ipaddress
+import re
+import shlex
+from collections import namedtuple
+
+from django.contrib.postgres.search import SearchQuery
+from django.db.models.functions import Upper
+
+from api.models import alert_search_vector, blocked_ip_search_vector, log_search_vector
+
+SearchTerm = namedtuple('SearchTerm', ['field', 'value'])
+
+LOG_FIELDS = ('ip', 'host', 'action', 'source')
+ALERT_FIELDS = ('severity',)
+
+IP_PREFIX_REGEX = re.compile(r'^\d{1,3}(?:\.\d{1,3}){0,2}\.$|^\d{1,3}(?:\.\d{1,3}){1,2}$')
+HOSTNAME_REGEX = re.compile(r'^(?=.*[a-z])[a-z0-9](?:[a-z0-9-]*[a-z0-9])?(?:\.[a-z0-9-]+)*$', re.IGNORECASE)
+WORD_REGEX = re.compile(r"[^\s'\\:&|!()<>*]+")
+
+
+def ip_range(value):
+    """
+    Returns the (first, last) addresses matched by an IP, CIDR network or dotted IPv4 prefix.
+
+    :return: Tuple of address strings, or None if value is not an address
+    """
+    value = value.strip()
+    try:
+        if '/' in value:
+            network = ipaddress.ip_network(value, strict=False)
+            return str(network[0]), str(network[-1])
+        address = ipaddress.ip_address(value)
+        return str(address), str(address)
+    except ValueError:
+        pass
+
+    if not IP_PREFIX_REGEX.match(value):
+        return None
+    octets = [int(octet) for octet in value.rstrip('.').split('.')]
+    if any(octet > 255 for octet in octets):
+        return None
+    missing = 4 - len(octets)
+    first = '.'.join(str(octet) for octet in octets + [0] * missing)
+    last = '.'.join(str(octet) for octet in octets + [255] * missing)
+    return first, last
+
+
+def parse_search(query, fields):
+    """
+    Splits a search query into SearchTerms.
+
+    :param query: Raw search box input
+    :param fields: Field names that may be given explicitly as field:value
+    :return: List of SearchTerm, with field 'ip', 'host', 'text' or one of fields
+    """
+    try:
+        tokens = shlex.split(query)
+    except ValueError:
+        tokens = query.split()
+
+    terms = []
+    for token in tokens:
+        field, sep, value = token.partition(':')
+        if sep and value and field.lower() in fields:
+            terms.append(SearchTerm(field.lower(), value))
+        elif ip_range(token):
+            terms.append(SearchTerm('ip', token))
+        elif 'host' in fields and HOSTNAME_REGEX.match(token) and ('.' in token or '-' in token):
+            terms.append(SearchTerm('host', token))
+        elif token.strip():
+            terms.append(SearchTerm('text', token))
+    return terms
+
+
+def prefix_query(value, config):
+    """Builds a tsquery matching every word of value, the last one as a prefix."""
+    words = WORD_REGEX.findall(value.lower())
+    if not words:
+        return None
+    words = [f"'{word}'" for word in words]
+    words[-1] += ':*'
+    return SearchQuery(' & '.join(words), search_type='raw', config=config)
+
+
+def _text_filter(queryset, value, vector, config):
+    query = prefix_query(value, config)
+    if query is None:
+        return queryset
+    return queryset.filter(**{vector: query})
+
+
+def search_log_entries(queryset, query):
+    """Filters LogEntry rows by a search box query."""
+    queryset = queryset.alias(search_vector=log_search_vector(), host_upper=Upper('host'))
+    for field, value in parse_search(query, LOG_FIELDS):
+        if field == 'ip':
+            bounds = ip_range(value)
+            if bounds is None:
+                return queryset.none()
+            queryset = queryset.filter(source_ip__gte=bounds[0], source_ip__lte=bounds[1])
+        elif field == 'host':
+            queryset = queryset.filter(host_upper__startswith=value.upper())
+        elif field in ('action', 'source'):
+            # The full-text index finds the rows; the prefix keeps those where the field starts with the value.
+            queryset = _text_filter(queryset, value, 'search_vector', 'simple').filter(
+                **{f'{field}__istartswith': value}
+            )
+        else:
+            queryset = _text_filter(queryset, value, 'search_vector', 'simple')
+    return queryset
+
+
+def search_alerts(queryset, query):
+    """Filters Alert rows by a search box query."""
+    queryset = queryset.alias(search_vector=alert_search_vector())
+    for field, value in parse_search(query, ALERT_FIELDS):
+        if field == 'severity':
+            queryset = queryset.filter(severity=value.upper())
+        else:
+            queryset = _text_filter(queryset, value, 'search_vector', 'english')
+    return queryset
+
+
+def search_blocked_ips(queryset, query):
+    """
+    Filters BlockedIP rows by a search box query.
+
+    Addresses and prefixes use the ip_address index, anything else the
+    full-text index on the reason.
+    """
+    queryset = queryset.alias(search_vector=blocked_ip_search_vector())
+    for field, value in parse_search(query, ()):
+        if field == 'ip':
+            bounds = ip_range(value)
+            queryset = queryset.filter(ip_address__gte=bounds[0], ip_address__lte=bounds[1])
+        else:
+            queryset = _text_filter(queryset, value, 'search_vector', 'english')
+    return queryset
+
+
+def search_devices(queryset, query):
+    """Filters ManagedDevice rows by a search box query: addresses and prefixes by IP, anything else by hostname."""
+    for field, value in parse_search(query, ('os',)):
+        bounds = ip_range(value) if field == 'ip' else None
+        if bounds:
+            queryset = queryset.filter(ip_address__gte=bounds[0], ip_address__lte=bounds[1])
+        elif field == 'os':
+            queryset = queryset.filter(os__icontains=value)
+        else:
+            queryset = queryset.filter(hostname__icontains=value)
+    return queryset
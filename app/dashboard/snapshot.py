@@ -0,0 +1,136 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from api import metrics
+from api.models import DailyLogCount, HourlyLogCount
+from api.rollups import floor_hour
+
+FAILED = 'Failed password'
+SUCCESSFUL = 'Accepted password'
+
+SNAPSHOT_CACHE_KEY = 'dashboard:snapshot'
+REBUILD_LOCK_KEY = 'dashboard:snapshot:rebuilding'
+REBUILD_WAIT_SECONDS = 5
+
+
+def get_top_sources(action, start_time, end_time, group_by=('host', 'source_ip'), limit=5):
+    """Returns the busiest sources for an action, counted over the hourly buckets in a time range."""
+    return HourlyLogCount.objects.filter(
+        action=action, bucket__gte=floor_hour(start_time), bucket__lt=end_time
+    ).values(*group_by).annotate(count=Sum('count')).order_by('-count')[:limit]
+
+
+class DashboardSnapshot:
+    """
+    Every number, series and top-N list shown on the dashboard home page.
+
+    Windows are aligned to the hourly rollup buckets: "last 24 hours" is the
+    current hour plus the 23 before it, "yesterday" the 24 buckets before
+    that, and "last week" the last 168 buckets.
+    """
+
+    def __init__(self, generated_at, counts, failed_by_hour, successful_by_hour,
+                 top_failed, top_successful, top_failed_ip):
+        self.generated_at = generated_at
+        self.counts = counts
+        self.failed_by_hour = failed_by_hour
+        self.successful_by_hour = successful_by_hour
+        self.top_failed = top_failed
+        self.top_successful = top_successful
+        self.top_failed_ip = top_failed_ip
+
+    def is_fresh(self, ttl):
+        return timezone.now() - self.generated_at < timedelta(seconds=ttl)
+
+
+@metrics.timed(metrics.DASHBOARD_SNAPSHOT_DURATION)
+def build_dashboard_snapshot(current_time=None):
+    """
+    Computes a DashboardSnapshot from the rollup tables.
+
+    The counters and hourly series come from one pass over the last week of
+    hourly buckets, and the all-time totals from one conditional aggregate
+    over the daily rollup. The top-N lists are bounded LIMIT queries.
+    """
+    current_time = current_time or timezone.now()
+    current_hour = floor_hour(current_time)
+    last_24_hours = current_hour - timedelta(hours=23)
+    previous_24_hours = last_24_hours - timedelta(hours=24)
+    last_7_days = current_hour - timedelta(hours=167)
+
+    counts = {
+        (action, window): 0
+        for action in (FAILED, SUCCESSFUL)
+        for window in ('day', 'previous_day', 'week')
+    }
+    by_hour = {action: {hour: 0 for hour in range(24)} for action in (FAILED, SUCCESSFUL)}
+
+    weekly_buckets = (
+        HourlyLogCount.objects.filter(action__in=(FAILED, SUCCESSFUL), bucket__gte=last_7_days)
+        .values_list('bucket', 'action')
+        .annotate(total=Sum('count'))
+    )
+    for bucket, action, total in weekly_buckets:
+        counts[(action, 'week')] += total
+        if bucket >= last_24_hours:
+            counts[(action, 'day')] += total
+            by_hour[action][bucket.hour] += total
+        elif bucket >= previous_24_hours:
+            counts[(action, 'previous_day')] += total
+
+    all_time = DailyLogCount.objects.aggregate(
+        failed=Sum('count', filter=Q(action=FAILED)),
+        successful=Sum('count', filter=Q(action=SUCCESSFUL)),
+    )
+    counts[(FAILED, 'all_time')] = all_time['failed'] or 0
+    counts[(SUCCESSFUL, 'all_time')] = all_time['successful'] or 0
+
+    top_failed_ip = list(get_top_sources(FAILED, last_24_hours, current_time, group_by=('source_ip',), limit=1))
+
+    return DashboardSnapshot(
+        generated_at=current_time,
+        counts=counts,
+        failed_by_hour=by_hour[FAILED],
+        successful_by_hour=by_hour[SUCCESSFUL],
+        top_failed=list(get_top_sources(FAILED, last_7_days, current_time)),
+        top_successful=list(get_top_sources(SUCCESSFUL, last_7_days, current_time)),
+        top_failed_ip=top_failed_ip[0] if top_failed_ip else None,
+    )
+
+
+def get_dashboard_snapshot():
+    """
+    Returns the cached DashboardSnapshot, rebuilding it when it is older than DASHBOARD_SNAPSHOT_TTL.
+
+    Only the caller that wins the rebuild lock recomputes the snapshot; any
+    concurrent caller is served the previous snapshot in the meantime, or
+    waits for the first one to be built.
+    """
+    ttl = settings.DASHBOARD_SNAPSHOT_TTL
+    snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+    if snapshot is not None and snapshot.is_fresh(ttl):
+        return snapshot
+
+    if cache.add(REBUILD_LOCK_KEY, True, timeout=REBUILD_WAIT_SECONDS):
+        try:
+            snapshot = build_dashboard_snapshot()
+            cache.set(SNAPSHOT_CACHE_KEY, snapshot, timeout=None)
+        finally:
+            cache.delete(REBUILD_LOCK_KEY)
+        return snapshot
+
+    if snapshot is not None:
+        return snapshot
+
+    deadline = time.monotonic() + REBUILD_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+        if snapshot is not None:
+            return snapshot
+    return build_dashboard_snapshot()
@@ -1,3 +1,307 @@
-from django.test import TestCase
+import asyncio
+import uuid
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.test import AsyncRequestFactory, TestCase
+from django.utils.timezone import now, timedelta
+
+from api.blocklist import ban_ip
+from api.buffers import clear_buffers
+from api.heartbeats import heartbeat_buffer
+from api.ingest import store_log_entries
+from api.models import Alert, BlockedIP, InstallToken, LogEntry, ManagedDevice
+from . import views
+from .fleet import annotate_health, fleet_summary, status_changes
+from .live import LiveFeedHub, collect_changes, encode_event, initial_state
+from .pagination import KeysetPaginator
+from .search import ip_range, parse_search, search_alerts, search_blocked_ips, search_log_entries
+from .snapshot import get_dashboard_snapshot
+
+
+class DashboardViewTests(TestCase):
+    def setUp(self):
+        """Store a day of login attempts through the ingest path."""
+        cache.clear()
+        current_time = now()
+        store_log_entries([
+            LogEntry(
+                timestamp=current_time - timedelta(minutes=10 * i),
+                source_ip="203.0.113.7" if i % 2 else "198.51.100.3",
+                action="Failed password" if i % 2 else "Accepted password",
+                source="vector",
+                host="web-01"
+            )
+            for i in range(100)
+        ])
+
+    def test_dashboard_home_counts(self):
+        """Test that the home page reports counts from the rollups."""
+        response = self.client.get("/dashboard/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["all_time_failed_logins_count"], 50)
+        self.assertEqual(response.context["all_time_successful_logins_count"], 50)
+        self.assertEqual(response.context["weekly_failed_logins_count"], 50)
+        self.assertEqual(response.context["top_failed_logins"][0]["source_ip"], "203.0.113.7")
+
+    def test_dashboard_snapshot_is_cached(self):
+        """Test that the snapshot is built in a handful of queries and then served from cache."""
+        with self.assertNumQueries(5):
+            snapshot = get_dashboard_snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_snapshot().generated_at, snapshot.generated_at)
+            self.client.get("/dashboard/")
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        """Alerts with repeated timestamps, so pages have to break ties on id."""
+        current_time = now()
+        Alert.objects.bulk_create([
+            Alert(title=f"Alert {i}", message="Test", created_at=current_time - timedelta(minutes=i // 3))
+            for i in range(23)
+        ])
+        self.expected = list(Alert.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_pages_forward_and_back(self):
+        """Test that following the cursors visits every row once, in order, in both directions."""
+        paginator = KeysetPaginator(Alert.objects.all(), 'created_at', 5)
+        page = paginator.get_page(None)
+        self.assertFalse(page.has_previous)
+        pages = [page]
+        while page.has_next:
+            page = paginator.get_page(page.next_cursor)
+            pages.append(page)
+        self.assertEqual([alert.id for page in pages for alert in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+
+        while page.has_previous:
+            page = paginator.get_page(page.previous_cursor)
+            self.assertEqual([alert.id for alert in page], [alert.id for alert in pages[len(pages) - 2]])
+            pages.pop()
+        self.assertEqual(len(pages), 1)
+
+    def test_last_page_and_invalid_cursor(self):
+        """Test the last-page cursor, and that a tampered cursor falls back to the first page."""
+        paginator = KeysetPaginator(Alert.objects.all(), 'created_at', 5)
+        last = paginator.get_page(paginator.get_page(None).last_cursor)
+        self.assertEqual([alert.id for alert in last], self.expected[-5:])
+        self.assertFalse(last.has_next)
+        self.assertEqual([alert.id for alert in paginator.get_page("not-a-cursor")], self.expected[:5])
+
+    def test_alert_list_uses_cursor(self):
+        """Test that the alerts page follows a cursor without counting every row."""
+        page = KeysetPaginator(Alert.objects.all(), 'created_at', 15).get_page(None)
+        response = self.client.get("/dashboard/alerts/", {"cursor": page.next_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([alert.id for alert in response.context["page_obj"]], self.expected[15:])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        current_time = now()
+        LogEntry.objects.bulk_create([
+            LogEntry(timestamp=current_time, source_ip="10.1.2.3", action="Failed password", source="vector", host="web-01"),
+            LogEntry(timestamp=current_time, source_ip="10.1.9.9", action="Accepted password", source="vector", host="db.example.com"),
+            LogEntry(timestamp=current_time, source_ip="192.168.1.20", action="Failed password", source="fail2ban", host="web-02"),
+        ])
+        Alert.objects.bulk_create([
+            Alert(title="Global Ban", message="IP 203.0.113.9 has been banned on all devices.", severity="CRITICAL"),
+            Alert(title="Heartbeat Received", message="Heartbeat received from device web-01.", severity="INFO"),
+        ])
+
+    def search_hosts(self, query):
+        return sorted(search_log_entries(LogEntry.objects.all(), query).values_list('host', flat=True))
+
+    def test_parse_search(self):
+        """Test that terms are routed by shape, and field:value pins a term to a field."""
+        self.assertEqual(parse_search('10.1. web-01 "failed password" source:vector', ('ip', 'host', 'source')), [
+            ('ip', '10.1.'), ('host', 'web-01'), ('text', 'failed password'), ('source', 'vector'),
+        ])
+        self.assertEqual(ip_range('10.1'), ('10.1.0.0', '10.1.255.255'))
+        self.assertEqual(ip_range('192.168.0.0/16'), ('192.168.0.0', '192.168.255.255'))
+        self.assertIsNone(ip_range('300.1.'))
+        self.assertIsNone(ip_range('22'))
+
+    def test_search_log_entries(self):
+        """Test IP prefix, hostname prefix and word searches on login attempts."""
+        self.assertEqual(self.search_hosts('10.1.'), ['db.example.com', 'web-01'])
+        self.assertEqual(self.search_hosts('10.1.2.3'), ['web-01'])
+        self.assertEqual(self.search_hosts('web-0'), ['web-01', 'web-02'])
+        self.assertEqual(self.search_hosts('fail'), ['web-01', 'web-02'])
+        self.assertEqual(self.search_hosts('failed 192.168.0.0/16'), ['web-02'])
+        self.assertEqual(self.search_hosts('source:fail2ban'), ['web-02'])
+        self.assertEqual(self.search_hosts('action:failed'), ['web-01', 'web-02'])
+        self.assertEqual(self.search_hosts('action:password'), [])
+
+    def test_search_alerts(self):
+        """Test full-text alert search with stemming and a prefix on the last word."""
+        self.assertEqual(list(search_alerts(Alert.objects.all(), 'banned').values_list('title', flat=True)), ['Global Ban'])
+        self.assertEqual(list(search_alerts(Alert.objects.all(), 'heartb').values_list('title', flat=True)), ['Heartbeat Received'])
+        self.assertFalse(search_alerts(Alert.objects.all(), 'severity:info banned').exists())
+
+    def test_search_blocked_ips(self):
+        """Test that blocked IPs are searched by address range or by words of the reason."""
+        BlockedIP.objects.bulk_create([
+            BlockedIP(ip_address="10.1.2.3", reason="Brute-force attack detected"),
+            BlockedIP(ip_address="192.168.1.20", reason="Reported by web-02"),
+        ])
+
+        def search(query):
+            return sorted(search_blocked_ips(BlockedIP.objects.all(), query).values_list('ip_address', flat=True))
+
+        self.assertEqual(search('10.1.'), ['10.1.2.3'])
+        self.assertEqual(search('attacks'), ['10.1.2.3'])
+        self.assertEqual(search('report'), ['192.168.1.20'])
+        self.assertEqual(search('10.1. reported'), [])
+
+    def test_login_attempt_list_search(self):
+        """Test that the login attempt list applies the search query."""
+        response = self.client.get("/dashboard/login-attempts/", {"q": "192.168.1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry.host for entry in response.context["page_obj"]], ["web-02"])
+
+
+class FleetTests(TestCase):
+    def setUp(self):
+        current_time = now()
+        ManagedDevice.objects.bulk_create([
+            ManagedDevice(
+                unique_id=str(uuid.uuid4()), hostname=f"host-{i:02d}", ip_address=f"10.0.0.{i}",
+                os="Ubuntu 22.04" if i % 2 else "Debian 12", last_check_in=current_time - timedelta(minutes=minutes)
+            )
+            for i, minutes in enumerate([1, 2, 3, 10, 20, 90, 600, 1, 2, 3, 4, 30])
+        ])
+
+    def test_fleet_summary(self):
+        """Test that statuses are counted in the database, overall and per OS."""
+        with self.assertNumQueries(1):
+            status_counts, os_counts = fleet_summary(now())
+        self.assertEqual(status_counts, {"Healthy": 7, "Degraded": 3, "Offline": 2})
+        self.assertEqual([(row["os"], row["total"], row["Offline"]) for row in os_counts], [
+            ("Debian 12", 6, 1), ("Ubuntu 22.04", 6, 1),
+        ])
+
+    def test_annotate_health(self):
+        """Test that each device is annotated with its status and check-in age."""
+        device = annotate_health(ManagedDevice.objects.filter(hostname="host-05"), now()).get()
+        self.assertEqual(device.health, "Offline")
+        self.assertGreaterEqual(device.check_in_age, timedelta(minutes=90))
+
+    def test_managed_devices_filters_sorts_and_pages(self):
+        """Test the status filter, sorting and pagination of the managed devices page."""
+        response = self.client.get("/dashboard/managed-devices/", {"status": "Degraded", "sort": "status"})
+        self.assertEqual([device.hostname for device in response.context["page_obj"]], ["host-03", "host-04", "host-11"])
+        self.assertEqual(response.context["status_counts"]["Healthy"], 7)
+
+        response = self.client.get("/dashboard/managed-devices/", {"os": "Debian 12", "q": "10.0.0.0/30"})
+        self.assertEqual([device.hostname for device in response.context["page_obj"]], ["host-00", "host-02"])
+
+        with self.assertNumQueries(3):
+            response = self.client.get("/dashboard/managed-devices/", {"page": 2})
+        self.assertEqual([device.hostname for device in response.context["page_obj"]], ["host-10", "host-11"])
+
+    def test_status_filter_applies_buffered_check_ins(self):
+        """Test that a device whose check-in is still buffered is filtered by its buffered status."""
+        offline = ManagedDevice.objects.get(hostname="host-06")
+        degraded = ManagedDevice.objects.get(hostname="host-04")
+        heartbeat_buffer.put(offline.pk, now())
+        heartbeat_buffer.put(degraded.pk, now() - timedelta(hours=1))
+        self.addCleanup(clear_buffers)
+
+        response = self.client.get("/dashboard/managed-devices/", {"status": "Offline", "sort": "status"})
+        self.assertEqual([device.hostname for device in response.context["page_obj"]], ["host-05"])
+        response = self.client.get("/dashboard/managed-devices/", {"status": "Healthy", "sort": "status"})
+        self.assertIn("host-06", [device.hostname for device in response.context["page_obj"]])
+        # An older buffered check-in leaves the stored one in charge.
+        response = self.client.get("/dashboard/managed-devices/", {"status": "Degraded", "sort": "status"})
+        self.assertEqual([device.hostname for device in response.context["page_obj"]], ["host-03", "host-04", "host-11"])
+
+    def test_status_changes(self):
+        """Test that only devices crossing a status boundary or checking in are reported."""
+        current_time = now()
+        state = {"checked_at": current_time, "statuses": dict(
+            annotate_health(ManagedDevice.objects.all(), current_time).values_list("id", "health")
+        )}
+        self.assertEqual(status_changes(state, current_time + timedelta(seconds=2)), [])
+
+        later = current_time + timedelta(minutes=3, seconds=30)
+        changed = status_changes(state, later, pending={
+            ManagedDevice.objects.get(hostname="host-06").pk: later,
+        })
+        self.assertEqual(sorted((device["hostname"], device["status"]) for device in changed), [
+            ("host-01", "Degraded"), ("host-02", "Degraded"), ("host-06", "Healthy"),
+            ("host-08", "Degraded"), ("host-09", "Degraded"), ("host-10", "Degraded"),
+        ])
+
+
+class LiveFeedTests(TestCase):
+    def setUp(self):
+        self.device = ManagedDevice.objects.create(
+            unique_id=str(uuid.uuid4()), hostname="live-device", ip_address="192.168.1.160", os="Linux",
+            last_check_in=now() - timedelta(minutes=30)
+        )
+        self.token = InstallToken.objects.create(expires_at=now() + timedelta(hours=1))
+
+    def test_collect_changes(self):
+        """Test that one poll reports new rows, counter deltas, bans, installs and status transitions."""
+        state = initial_state()
+        self.assertEqual(state["devices"]["statuses"], {self.device.pk: "Degraded"})
+        self.assertEqual(collect_changes(state)[0], [])
+
+        store_log_entries([
+            LogEntry(timestamp=now(), source_ip="203.0.113.7", action=action, source="vector", host="web-01")
+            for action in ("Failed password", "Failed password", "Accepted password")
+        ])
+        Alert.objects.create(title="Global Ban", message="IP 203.0.113.7 has been banned.", severity="CRITICAL")
+        ban_ip("203.0.113.7", "Test")
+        InstallToken.objects.filter(pk=self.token.pk).update(is_used=True)
+        ManagedDevice.objects.filter(pk=self.device.pk).update(last_check_in=now())
+
+        events, state = collect_changes(state)
+        events = dict(events)
+        self.assertEqual(len(events["logs"]), 3)
+        self.assertEqual(events["counts"], {"Failed password": 2, "Accepted password": 1})
+        self.assertEqual(events["alerts"][0]["title"], "Global Ban")
+        self.assertEqual([(ban["ip_address"], ban["banned"]) for ban in events["bans"]], [("203.0.113.7", True)])
+        self.assertEqual(events["install"], {"token": str(self.token.token), "status": "Healthy"})
+        self.assertEqual([device["status"] for device in events["devices"]], ["Healthy"])
+        self.assertEqual(collect_changes(state)[0], [])
+
+    async def test_hub_polls_once_for_all_subscribers(self):
+        """Test that every subscriber receives the events found by the shared poller."""
+        hub = LiveFeedHub(poll_interval=0.01, queue_size=10)
+        first, second = hub.subscribe(), hub.subscribe()
+        await asyncio.sleep(0.05)
+        await sync_to_async(LogEntry.objects.create)(
+            timestamp=now(), source_ip="203.0.113.8", action="Failed password", host="web-01"
+        )
+        for queue in (first, second):
+            event, data = await asyncio.wait_for(queue.get(), 5)
+            self.assertEqual((event, data[0]["source_ip"]), ("logs", "203.0.113.8"))
+
+        hub.unsubscribe(first)
+        hub.unsubscribe(second)
+        await asyncio.wait_for(hub._task, 5)
+
+    async def test_slow_subscriber_is_told_to_reload(self):
+        """Test that a full queue is replaced by a single reload event."""
+        hub = LiveFeedHub(poll_interval=60, queue_size=2)
+        stream = hub.stream()
+        self.assertTrue((await stream.__anext__()).startswith("retry:"))
+        for i in range(3):
+            hub.publish("alerts", [{"id": i}])
+        self.assertEqual(await stream.__anext__(), encode_event("reload", {}))
+        await stream.aclose()
+        self.assertFalse(hub._subscribers)
+        hub._task.cancel()
+
+    async def test_live_feed_view(self):
+        """Test that the feed streams under ASGI and is refused under WSGI."""
+        response = await views.live_feed(AsyncRequestFactory().get("/dashboard/live/"))
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        response = await sync_to_async(self.client.get)("/dashboard/live/")
+        self.assertEqual(response.status_code, 501)
@@ -9,5 +9,6 @@ urlpatterns = [
     path('alerts/', views.alerts_view, name='alerts'),
     path('settings/', views.system_settings, name='system-settings'),
     path('managed-devices/', views.managed_devices, name='managed-devices'),
+    path('live/', views.live_feed, name='live-feed'),
     path('generate-install-command/', views.generate_install_command, name='generate-install-command'),
 ]
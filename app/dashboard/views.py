@@ -5,80 +5,23 @@ import re
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, F
-from django.http import JsonResponse, HttpResponse, HttpResponseForbidden
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.contrib import messages
 
 from api.models import LogEntry, ManagedDevice, InstallToken, Alert, SystemScript, BlockedIP
+from api.blocklist import ban_ip, set_ban_state
+from api.heartbeats import heartbeat_buffer
 from api.utils import log_alert
+from .fleet import SORT_FIELDS, STATUSES, annotate_health, device_status, filter_devices, fleet_summary
+from .live import live_hub
+from .pagination import KeysetPaginator
+from .search import search_alerts, search_blocked_ips, search_log_entries
+from .snapshot import FAILED, SUCCESSFUL, get_dashboard_snapshot
 
 IP_REGEX = r"^(?:[0-9]{1,3}\.){3}[0-9]{1,3}$"
 
 
-def get_failed_logins_count(start_time=None, end_time=None):
-    """Returns count of failed logins within an optional time range."""
-    query = LogEntry.objects.filter(action='Failed password')
-    if start_time:
-        query = query.filter(timestamp__gte=start_time)
-    if end_time:
-        query = query.filter(timestamp__lt=end_time)
-    return query.count()
-
-
-def get_failed_logins_by_hour(last_24_hours):
-    """Returns hourly distribution of failed logins in the past 24 hours."""
-    failed_logins_data = (
-        LogEntry.objects.filter(action='Failed password', timestamp__gte=last_24_hours)
-        .annotate(hour=F('timestamp__hour'))
-        .values('hour')
-        .annotate(count=Count('id'))
-        .order_by('hour')
-    )
-    all_hours = {hour: 0 for hour in range(24)}
-    for entry in failed_logins_data:
-        all_hours[entry['hour']] = entry['count']
-    return all_hours
-
-
-def get_successful_logins_count(start_time=None, end_time=None):
-    """Returns count of successful logins within an optional time range."""
-    query = LogEntry.objects.filter(action='Accepted password')
-    if start_time:
-        query = query.filter(timestamp__gte=start_time)
-    if end_time:
-        query = query.filter(timestamp__lt=end_time)
-    return query.count()
-
-
-def get_successful_logins_by_hour(last_24_hours):
-    """Returns hourly distribution of successful logins in the past 24 hours."""
-    successful_logins_data = (
-        LogEntry.objects.filter(action='Accepted password', timestamp__gte=last_24_hours)
-        .annotate(hour=F('timestamp__hour'))
-        .values('hour')
-        .annotate(count=Count('id'))
-        .order_by('hour')
-    )
-    all_hours = {hour: 0 for hour in range(24)}
-    for entry in successful_logins_data:
-        all_hours[entry['hour']] = entry['count']
-    return all_hours
-
-
-def get_top_failed_logins(start_time, end_time, limit=5):
-    """Returns top sources of failed logins in a given time range."""
-    return LogEntry.objects.filter(
-        action='Failed password', timestamp__gte=start_time, timestamp__lt=end_time
-    ).values('host', 'source_ip').annotate(count=Count('id')).order_by('-count')[:limit]
-
-
-def get_top_successful_logins(start_time, end_time, limit=5):
-    """Returns top sources of successful logins in a given time range."""
-    return LogEntry.objects.filter(
-        action='Accepted password', timestamp__gte=start_time, timestamp__lt=end_time
-    ).values('host', 'source_ip').annotate(count=Count('id')).order_by('-count')[:limit]
-
-
 def prepare_combined_chart_data(failed_data, successful_data):
     """Returns labels and values for login trend chart."""
     labels = [f"{hour:02d}:00" for hour in sorted(failed_data.keys())]
@@ -87,22 +30,17 @@ def prepare_combined_chart_data(failed_data, successful_data):
     return labels, failed, successful
 
 
-def generate_insights(failed_logins_data, last_24_hours):
-    """Generates insights based on failed login data."""
+def generate_insights(snapshot):
+    """Generates insights based on the failed login data in a dashboard snapshot."""
     insights = []
+    failed_logins_data = snapshot.failed_by_hour
     most_active_hour = max(failed_logins_data, key=failed_logins_data.get)
     most_active_count = failed_logins_data[most_active_hour]
 
     if most_active_count > 10:
         insights.append(f"Unusual activity detected: {most_active_count} failed logins at {most_active_hour:02d}:00.")
 
-    top_ip = (
-        LogEntry.objects.filter(action='Failed password', timestamp__gte=last_24_hours)
-        .values('source_ip')
-        .annotate(count=Count('id'))
-        .order_by('-count')
-        .first()
-    )
+    top_ip = snapshot.top_failed_ip
     if top_ip and top_ip['count'] > 1:
         insights.append(f"Suspicious activity: IP {top_ip['source_ip']} attempted {top_ip['count']} failed logins.")
 
@@ -119,31 +57,16 @@ def generate_insights(failed_logins_data, last_24_hours):
 
 def dashboard_home(request):
     """Renders the main dashboard view with login stats and trends."""
-    current_time = timezone.now()
-    last_24_hours = current_time - timedelta(hours=24)
-    yesterday_24_hours = current_time - timedelta(hours=48)
-    last_7_days = current_time - timedelta(days=7)
-
-    failed_logins_count = get_failed_logins_count(last_24_hours)
-    yesterday_failed = get_failed_logins_count(yesterday_24_hours, last_24_hours)
-    weekly_failed = get_failed_logins_count(last_7_days)
-    all_time_failed = get_failed_logins_count()
-    failed_diff = failed_logins_count - yesterday_failed
-
-    successful_logins_count = get_successful_logins_count(last_24_hours)
-    yesterday_successful = get_successful_logins_count(yesterday_24_hours, last_24_hours)
-    weekly_successful = get_successful_logins_count(last_7_days)
-    all_time_successful = get_successful_logins_count()
-    successful_diff = successful_logins_count - yesterday_successful
+    snapshot = get_dashboard_snapshot()
+    counts = snapshot.counts
 
-    failed_hourly_data = get_failed_logins_by_hour(last_24_hours)
-    successful_hourly_data = get_successful_logins_by_hour(last_24_hours)
+    failed_logins_count = counts[(FAILED, 'day')]
+    failed_diff = failed_logins_count - counts[(FAILED, 'previous_day')]
+    successful_logins_count = counts[(SUCCESSFUL, 'day')]
+    successful_diff = successful_logins_count - counts[(SUCCESSFUL, 'previous_day')]
 
-    top_failed = get_top_failed_logins(last_7_days, current_time)
-    top_successful = get_top_successful_logins(last_7_days, current_time)
-
-    labels, failed_data, successful_data = prepare_combined_chart_data(failed_hourly_data, successful_hourly_data)
-    insights = generate_insights(failed_hourly_data, last_24_hours)
+    labels, failed_data, successful_data = prepare_combined_chart_data(snapshot.failed_by_hour, snapshot.successful_by_hour)
+    insights = generate_insights(snapshot)
 
     context = {
         'labels': labels,
@@ -152,15 +75,15 @@ def dashboard_home(request):
         'failed_logins_count': failed_logins_count,
         'failed_difference': failed_diff,
         'failed_abs_difference': abs(failed_diff),
-        'weekly_failed_logins_count': weekly_failed,
-        'all_time_failed_logins_count': all_time_failed,
+        'weekly_failed_logins_count': counts[(FAILED, 'week')],
+        'all_time_failed_logins_count': counts[(FAILED, 'all_time')],
         'successful_logins_count': successful_logins_count,
         'successful_difference': successful_diff,
         'successful_abs_difference': abs(successful_diff),
-        'weekly_successful_logins_count': weekly_successful,
-        'all_time_successful_logins_count': all_time_successful,
-        'top_failed_logins': top_failed,
-        'top_successful_logins': top_successful,
+        'weekly_successful_logins_count': counts[(SUCCESSFUL, 'week')],
+        'all_time_successful_logins_count': counts[(SUCCESSFUL, 'all_time')],
+        'top_failed_logins': snapshot.top_failed,
+        'top_successful_logins': snapshot.top_successful,
         'insights': insights,
     }
     return render(request, 'dashboard/dashboard_home.html', context)
@@ -176,12 +99,7 @@ def login_attempt_list(request):
     log_entries = LogEntry.objects.all()
 
     if query:
-        log_entries = log_entries.filter(
-            Q(source_ip__icontains=query) |
-            Q(action__icontains=query) |
-            Q(host__icontains=query) |
-            Q(source__icontains=query)
-        )
+        log_entries = search_log_entries(log_entries, query)
 
     if action_filter and action_filter != 'ALL':
         log_entries = log_entries.filter(action=action_filter)
@@ -194,8 +112,8 @@ def login_attempt_list(request):
         dt = timezone.make_aware(datetime.strptime(end_datetime, '%Y-%m-%dT%H:%M'))
         log_entries = log_entries.filter(timestamp__lte=dt)
 
-    paginator = Paginator(log_entries.order_by('-timestamp'), 15)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    paginator = KeysetPaginator(log_entries, 'timestamp', 15)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     return render(request, 'dashboard/login_attempt_list.html', {
         'page_obj': page_obj,
@@ -215,7 +133,7 @@ def blocked_ips(request):
     blocked_ips = BlockedIP.objects.all()
 
     if query:
-        blocked_ips = blocked_ips.filter(Q(ip_address__icontains=query) | Q(reason__icontains=query))
+        blocked_ips = search_blocked_ips(blocked_ips, query)
 
     if start_datetime:
         dt = timezone.make_aware(datetime.strptime(start_datetime, '%Y-%m-%dT%H:%M'))
@@ -225,8 +143,8 @@ def blocked_ips(request):
         dt = timezone.make_aware(datetime.strptime(end_datetime, '%Y-%m-%dT%H:%M'))
         blocked_ips = blocked_ips.filter(banned_at__lte=dt)
 
-    paginator = Paginator(blocked_ips, 10)
-    page_obj = paginator.get_page(request.GET.get("page"))
+    paginator = KeysetPaginator(blocked_ips, 'banned_at', 10)
+    page_obj = paginator.get_page(request.GET.get("cursor"))
 
     if request.method == "POST":
         ip_address = request.POST.get("ip_address")
@@ -241,7 +159,7 @@ def blocked_ips(request):
                 "error": "Invalid IP address format!"
             })
 
-        BlockedIP.objects.get_or_create(ip_address=ip_address, defaults={"reason": reason})
+        ban_ip(ip_address, reason)
         return redirect("blocked-ips")
 
     return render(request, "dashboard/blocked_ips.html", {
@@ -256,8 +174,7 @@ def toggle_ban_ip(request, ip_address):
     """Toggles ban status of a given IP address."""
     if request.method == "POST":
         blocked_ip = get_object_or_404(BlockedIP, ip_address=ip_address)
-        blocked_ip.currently_banned = not blocked_ip.currently_banned
-        blocked_ip.save()
+        set_ban_state(blocked_ip, not blocked_ip.currently_banned)
         return redirect("blocked-ips")
     return HttpResponseForbidden("Invalid request")
 
@@ -272,7 +189,7 @@ def alerts_view(request):
     alerts = Alert.objects.all()
 
     if query:
-        alerts = alerts.filter(Q(title__icontains=query) | Q(message__icontains=query))
+        alerts = search_alerts(alerts, query)
     if start_datetime:
         dt = timezone.make_aware(datetime.strptime(start_datetime, '%Y-%m-%dT%H:%M'))
         alerts = alerts.filter(created_at__gte=dt)
@@ -282,8 +199,8 @@ def alerts_view(request):
     if severity_filter and severity_filter != 'ALL':
         alerts = alerts.filter(severity=severity_filter)
 
-    paginator = Paginator(alerts.order_by('-created_at'), 15)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    paginator = KeysetPaginator(alerts, 'created_at', 15)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     return render(request, 'dashboard/alerts.html', {
         'page_obj': page_obj,
@@ -315,19 +232,42 @@ def system_settings(request):
 
 
 def managed_devices(request):
-    """Displays all managed devices with last check-in times."""
-    devices = ManagedDevice.objects.all().order_by('hostname')
-    for device in devices:
-        if device.last_check_in:
-            device.time_diff_seconds = (timezone.now() - device.last_check_in).total_seconds()
-        else:
-            device.time_diff_seconds = float('inf')
+    """Displays managed devices with their health, filtered, sorted and paginated in the database."""
+    current_time = timezone.now()
+    query = request.GET.get('q', '')
+    status_filter = request.GET.get('status', '')
+    os_filter = request.GET.get('os', '')
+    sort = request.GET.get('sort', 'hostname')
+    if sort not in SORT_FIELDS:
+        sort = 'hostname'
+
+    # Check-ins still in this worker's buffer are newer than the database.
+    pending = heartbeat_buffer.pending()
+    devices = filter_devices(
+        ManagedDevice.objects.all(), current_time, status=status_filter, os=os_filter, query=query, pending=pending
+    )
+    devices = annotate_health(devices, current_time).order_by(*SORT_FIELDS[sort])
 
     paginator = Paginator(devices, 10)
     page_obj = paginator.get_page(request.GET.get('page'))
 
+    page_obj.object_list = list(page_obj.object_list)
+    heartbeat_buffer.merge_into(page_obj.object_list)
+    for device in page_obj.object_list:
+        device.health = device_status(device.last_check_in, current_time)
+
+    status_counts, os_counts = fleet_summary(current_time)
+
     return render(request, 'dashboard/managed_devices.html', {
         'page_obj': page_obj,
+        'query': query,
+        'status_filter': status_filter,
+        'os_filter': os_filter,
+        'sort': sort,
+        'statuses': STATUSES,
+        'status_counts': status_counts,
+        'os_counts': os_counts,
+        'total_devices': sum(status_counts.values()),
     })
 
 
@@ -348,3 +288,14 @@ def generate_install_command(request):
     )
     command = f"curl -sSL https://alarm.sgt.me.uk/install.sh | sudo bash -s -- {token}"
     return JsonResponse({"command": command, "token": str(token)})
+
+
+async def live_feed(request):
+    """Streams live dashboard updates as Server-Sent Events."""
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be tied up for as long as the page stays open.
+        return HttpResponse("The live feed is only served by the ASGI application.", status=501)
+    response = StreamingHttpResponse(live_hub.stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
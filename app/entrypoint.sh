@@ -7,13 +7,26 @@ python manage.py migrate --noinput
 # Run Django tests
 python manage.py test
 
-# Start the Gunicorn server
-exec gunicorn --bind 0.0.0.0:5000 alarm.wsgi:application &
+# Start the Gunicorn server, with async agent endpoints under ASGI if enabled
+if [ "$ALARM_ASYNC_AGENT_API" = "1" ]; then
+    exec gunicorn --bind 0.0.0.0:5000 -k uvicorn.workers.UvicornWorker alarm.asgi:application &
+else
+    exec gunicorn --bind 0.0.0.0:5000 alarm.wsgi:application &
+fi
+
+# Store spooled log batches in the database
+if [ "$ALARM_LOG_SPOOL" = "1" ]; then
+    python manage.py drain_log_spool &
+fi
+
+# Archive and delete log entries and alerts past their retention period
+if [ "$ALARM_RETENTION" = "1" ]; then
+    python manage.py purge_expired &
+fi
 
 # Start MkDocs server
 cd alarm-docs
 exec mkdocs serve --dev-addr 0.0.0.0:8000 &
 
-# Start Locust load testing
-cd ..
-exec locust -f locusttest.py --host=https://alarm.sgt.me.uk
\ No newline at end of file
+# Keep the container running while the servers do
+wait
\ No newline at end of file
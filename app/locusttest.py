@@ -1,69 +1,298 @@
-from locust import HttpUser, task, between
+"""
+Locust load test modelling a fleet of ALARM agents and the operators watching them.
+
+AgentUser behaves like one managed device: every --agent-interval seconds
+it sends a heartbeat and syncs its blocklist, it posts --log-batches
+batches of --log-batch-size log lines spread over that interval, sometimes
+reports a ban, and refreshes its access token before it expires.
+OperatorUser loads dashboard pages with a few seconds' think time. Agents
+outnumber operators 50 to 1.
+
+Agents need registered devices. Before the test starts, their tokens are
+read from --agent-tokens, or else obtained by running --provision-command,
+which must print the JSON written by the provision_load_test command.
+
+When the test ends, the p50/p95/p99 latency, throughput and failure ratio
+of every endpoint are checked against the SLOs in DEFAULT_SLOS, overridden
+by --slo-file, and Locust exits with status 1 if any is missed.
+
+    locust -f locusttest.py --headless -u 1020 -r 50 -t 10m --host http://localhost:5000
+
+Generated log lines and ban reports use 198.18.0.0/15, which
+``python manage.py provision_load_test --cleanup`` removes afterwards.
+"""
+import itertools
 import json
-import datetime
+import os
+import random
+import shlex
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from locust import HttpUser, between, events, task
+from locust.runners import MasterRunner, WorkerRunner
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Latency thresholds in milliseconds and the largest acceptable failure
+# ratio per endpoint; "*" applies to endpoints without an entry of their own.
+DEFAULT_SLOS = {
+    "*": {"p95": 1000, "p99": 2000, "max_failure_ratio": 0.01},
+    "/api/device/heartbeat/": {"p50": 50, "p95": 200, "p99": 500},
+    "/api/blocklist/": {"p50": 50, "p95": 200, "p99": 500},
+    "/api/logs/": {"p50": 100, "p95": 500, "p99": 1000},
+    "/api/report_ban/": {"p95": 300, "p99": 800},
+    "/api/device/token/refresh/": {"p95": 300, "p99": 800},
+}
+
+ATTACK_USERS = ("root", "admin", "test", "oracle", "postgres", "ubuntu", "guest", "pi")
+LOCAL_USERS = ("deploy", "ubuntu", "admin", "backup")
+
+agent_pool = []
+agent_index = itertools.count()
+
+
+@events.init_command_line_parser.add_listener
+def add_arguments(parser):
+    group = parser.add_argument_group("ALARM")
+    group.add_argument("--agent-tokens", default="", help="JSON file of agent tokens from provision_load_test.")
+    group.add_argument(
+        "--provision-command", default="python manage.py provision_load_test --devices {devices}",
+        help="Command printing agent tokens, run when --agent-tokens is not given. {devices} is replaced.",
+    )
+    group.add_argument("--devices", type=int, default=100, help="Number of devices to provision.")
+    group.add_argument("--agent-interval", type=float, default=60, help="Seconds between heartbeat and blocklist syncs.")
+    group.add_argument("--log-batches", type=int, default=4, help="Log batches each agent posts per interval.")
+    group.add_argument("--log-batch-size", type=int, default=50, help="Log lines per batch.")
+    group.add_argument("--ban-report-chance", type=float, default=0.05, help="Chance of a ban report per interval.")
+    group.add_argument(
+        "--token-refresh-after", type=float, default=840,
+        help="Seconds after which an agent refreshes its access token.",
+    )
+    group.add_argument("--slo-file", default="", help="JSON file of SLOs per endpoint, merged over the defaults.")
+    group.add_argument("--slo-report", default="", help="Write the SLO report to this JSON file.")
 
-class AlarmAPITest(HttpUser):
+
+def load_agents(options):
+    """Returns the agents' hostnames and tokens, from --agent-tokens or --provision-command."""
+    if options.agent_tokens:
+        with open(options.agent_tokens) as handle:
+            return json.load(handle)["agents"]
+    command = shlex.split(options.provision_command.format(devices=options.devices))
+    output = subprocess.run(command, cwd=BASE_DIR, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)["agents"]
+
+
+@events.test_start.add_listener
+def provision(environment, **kwargs):
+    if isinstance(environment.runner, MasterRunner) or agent_pool:
+        return
+    agent_pool.extend(load_agents(environment.parsed_options))
+
+
+def load_slos(path):
+    slos = {name: dict(thresholds) for name, thresholds in DEFAULT_SLOS.items()}
+    if path:
+        with open(path) as handle:
+            for name, thresholds in json.load(handle).items():
+                slos.setdefault(name, {}).update(thresholds)
+    return slos
+
+
+def check_slos(rows, slos):
     """
-    Locust load test user that simulates registering a device and submitting logs to the ALARM API.
+    Compares each endpoint's results with its SLO.
+
+    :param rows: Dicts with name, p50, p95, p99 (ms), rps and failure_ratio
+    :param slos: Dict of endpoint name to thresholds, with a "*" default
+    :return: The rows, each with a list of missed thresholds under "violations"
     """
-    wait_time = between(1, 3)
+    for row in rows:
+        thresholds = {**slos.get("*", {}), **slos.get(row["name"], {})}
+        violations = []
+        for percentile in ("p50", "p95", "p99"):
+            if percentile in thresholds and row[percentile] > thresholds[percentile]:
+                violations.append(f"{percentile} {row[percentile]:.0f}ms > {thresholds[percentile]}ms")
+        if "max_failure_ratio" in thresholds and row["failure_ratio"] > thresholds["max_failure_ratio"]:
+            violations.append(f"failures {row['failure_ratio']:.2%} > {thresholds['max_failure_ratio']:.2%}")
+        if "min_rps" in thresholds and row["rps"] < thresholds["min_rps"]:
+            violations.append(f"throughput {row['rps']:.1f}/s < {thresholds['min_rps']}/s")
+        row["violations"] = violations
+    return rows
 
-    def on_start(self):
-        """Runs once per Locust user when they start."""
-        if not hasattr(self.environment, "access_token"):
-            self.environment.access_token = self.get_token()
-
-    def get_token(self):
-        """Register a device and retrieve a valid access token."""
-        install_token = "9ac719da-57fb-4cdc-b839-a623cffc226b"
-
-        register_payload = {
-            "hostname": "locust-test-device",
-            "os": "Ubuntu",
-            "install_token": install_token
+
+@events.quitting.add_listener
+def report_slos(environment, **kwargs):
+    if isinstance(environment.runner, WorkerRunner):
+        return
+    options = environment.parsed_options
+    rows = [
+        {
+            "name": entry.name,
+            "method": entry.method,
+            "requests": entry.num_requests,
+            "failure_ratio": entry.fail_ratio,
+            "rps": entry.total_rps,
+            "p50": entry.get_response_time_percentile(0.5),
+            "p95": entry.get_response_time_percentile(0.95),
+            "p99": entry.get_response_time_percentile(0.99),
         }
+        for entry in sorted(environment.stats.entries.values(), key=lambda entry: entry.name)
+        if entry.num_requests
+    ]
+    rows = check_slos(rows, load_slos(options.slo_file))
 
-        response = self.client.post(
-            "https://alarm.sgt.me.uk/api/register/",
-            json=register_payload
+    print(f"\n{'endpoint':<36} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'fail':>7}  SLO")
+    for row in rows:
+        print(
+            f"{row['method'] + ' ' + row['name']:<36} {row['requests']:>9,} {row['rps']:>8.1f} {row['p50']:>8.0f} "
+            f"{row['p95']:>8.0f} {row['p99']:>8.0f} {row['failure_ratio']:>7.2%}  "
+            f"{'; '.join(row['violations']) or 'ok'}"
         )
+    missed = sum(1 for row in rows if row["violations"])
+    print(f"{missed} endpoint(s) missed their SLO." if missed else "All endpoints met their SLO.")
+
+    if options.slo_report:
+        with open(options.slo_report, "w") as handle:
+            json.dump({"endpoints": rows, "passed": not missed}, handle, indent=2)
+    if missed:
+        environment.process_exit_code = 1
 
-        if response.status_code == 201:
-            tokens = response.json().get("tokens")
-            return tokens.get("access")
-        else:
-            print(f"Failed to get access token! Response: {response.text}")
-            return None
+
+class AgentUser(HttpUser):
+    """One managed device running the agent's sync job and shipping its logs."""
+
+    weight = 50
+    host = "http://localhost:5000"
+
+    def on_start(self):
+        options = self.environment.parsed_options
+        if not agent_pool:
+            raise RuntimeError("No agent tokens were provisioned; see --agent-tokens and --provision-command.")
+        agent = agent_pool[next(agent_index) % len(agent_pool)]
+        self.hostname = agent["hostname"]
+        self.access = agent["access"]
+        self.refresh = agent["refresh"]
+        self.rng = random.Random(self.hostname)
+        self.interval = options.agent_interval
+        self.log_interval = options.agent_interval / max(options.log_batches, 1)
+        self.version = None
+        # Agents start at random points of their cycle, as cron jobs on real hosts do.
+        now = time.monotonic()
+        self.token_refreshed = now - self.rng.uniform(0, options.token_refresh_after)
+        self.next_sync = now + self.rng.uniform(0, self.interval)
+        self.next_logs = now + self.rng.uniform(0, self.log_interval)
+
+    def wait_time(self):
+        return max(0.0, min(self.next_sync, self.next_logs) - time.monotonic())
 
     @task
-    def submit_log(self):
-        """Simulate a log submission to the LogView endpoint."""
-        if not hasattr(self.environment, "access_token"):
-            print("Skipping log submission: No valid token")
-            return
-
-        headers = {
-            "Authorization": f"Bearer {self.environment.access_token}"
-        }
+    def run_due_jobs(self):
+        options = self.environment.parsed_options
+        now = time.monotonic()
+        if now - self.token_refreshed >= options.token_refresh_after:
+            self.refresh_token()
+        if now >= self.next_sync:
+            self.next_sync += self.interval
+            self.heartbeat()
+            self.sync_blocklist()
+            if self.rng.random() < options.ban_report_chance:
+                self.report_ban()
+        if now >= self.next_logs and options.log_batches:
+            self.next_logs += self.log_interval
+            self.send_logs(options.log_batch_size)
+
+    def headers(self):
+        return {"Authorization": f"Bearer {self.access}"}
+
+    def check_token(self, response):
+        """Refreshes the access token if the API rejected it."""
+        if response.status_code in (400, 401) and "token" in response.text.lower():
+            self.refresh_token()
+
+    def refresh_token(self):
+        with self.client.post(
+            "/api/device/token/refresh/", headers={"Authorization": f"Bearer {self.refresh}"},
+            name="/api/device/token/refresh/", catch_response=True,
+        ) as response:
+            if response.status_code != 200:
+                response.failure(f"Token refresh failed with {response.status_code}")
+                return
+            tokens = response.json()["tokens"]
+            self.access, self.refresh = tokens["access"], tokens["refresh"]
+        self.token_refreshed = time.monotonic()
+
+    def heartbeat(self):
+        response = self.client.post("/api/device/heartbeat/", headers=self.headers(), name="/api/device/heartbeat/")
+        self.check_token(response)
+
+    def sync_blocklist(self):
+        path = "/api/blocklist/" if self.version is None else f"/api/blocklist/?since={self.version}"
+        with self.client.get(
+            path, headers={"Accept-Encoding": "gzip"}, name="/api/blocklist/", catch_response=True,
+        ) as response:
+            if response.status_code == 200:
+                self.version = response.json().get("version", self.version)
 
-        log_data = [
-            {
-                "message": "Failed password for invalid user admin from 192.168.1.200",
-                "timestamp": datetime.datetime.utcnow().isoformat(),
-                "host": "simulated-device"
-            }
-        ]
-
-        response = self.client.post(
-            "https://alarm.sgt.me.uk/api/logs/",
-            json=log_data,
-            headers=headers
+    def report_ban(self):
+        self.client.post(
+            "/api/report_ban/", json={"ip": self.address(), "reason": "Load test"}, name="/api/report_ban/",
         )
 
-        if response.status_code == 400:
-            print("Token expired, fetching new one...")
-            self.environment.access_token = self.get_token()
-        elif response.status_code == 201:
-            print("Log submitted successfully.")
-        else:
-            print(f"Log submission failed: {response.status_code}, Response: {response.text}")
\ No newline at end of file
+    def address(self):
+        return f"198.{self.rng.choice((18, 19))}.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}"
+
+    def send_logs(self, batch_size):
+        timestamp = datetime.now(timezone.utc).isoformat()
+        # Mostly routine logins, plus a few addresses guessing passwords hard
+        # enough to trip brute-force detection now and then.
+        attacker = self.address()
+        logs = []
+        for _ in range(batch_size):
+            roll = self.rng.random()
+            if roll < 0.6:
+                message = f"Accepted publickey for {self.rng.choice(LOCAL_USERS)} from {self.address()} port 22 ssh2"
+            elif roll < 0.9:
+                message = f"Failed password for invalid user {self.rng.choice(ATTACK_USERS)} from {self.address()} port 22 ssh2"
+            else:
+                message = f"Failed password for root from {attacker} port 22 ssh2"
+            logs.append({"message": message, "timestamp": timestamp, "host": self.hostname})
+        response = self.client.post("/api/logs/", json=logs, headers=self.headers(), name="/api/logs/")
+        self.check_token(response)
+
+
+class OperatorUser(HttpUser):
+    """Someone watching the dashboard."""
+
+    weight = 1
+    host = "http://localhost:5000"
+    wait_time = between(5, 15)
+
+    @task(4)
+    def dashboard(self):
+        self.client.get("/dashboard/", name="/dashboard/")
+
+    @task(3)
+    def login_attempts(self):
+        self.client.get("/dashboard/login-attempts/", name="/dashboard/login-attempts/")
+
+    @task(1)
+    def search_login_attempts(self):
+        self.client.get("/dashboard/login-attempts/?q=198.18.", name="/dashboard/login-attempts/?q=")
+
+    @task(1)
+    def failed_logins(self):
+        self.client.get("/dashboard/login-attempts/?action=Failed+password", name="/dashboard/login-attempts/?action=")
+
+    @task(2)
+    def alerts(self):
+        self.client.get("/dashboard/alerts/", name="/dashboard/alerts/")
+
+    @task(1)
+    def blocked_ips(self):
+        self.client.get("/dashboard/blocked-ips/", name="/dashboard/blocked-ips/")
+
+    @task(2)
+    def managed_devices(self):
+        self.client.get("/dashboard/managed-devices/", name="/dashboard/managed-devices/")
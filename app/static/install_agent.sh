@@ -146,6 +146,12 @@ sinks:
     uri: "${API_URL}/logs/"
     encoding:
       codec: json
+    framing:
+      method: newline_delimited
+    compression: gzip
+    request:
+      headers:
+        Content-Type: application/x-ndjson
     auth:
       strategy: bearer
       token: "\${VECTOR_ACCESS_TOKEN}"
@@ -214,18 +220,26 @@ BLOCKLIST_API="https://alarm.sgt.me.uk/api/blocklist/"
 REPORT_BAN_API="https://alarm.sgt.me.uk/api/report_ban/"
 JAIL_NAME="sshd"
 ALREADY_REPORTED_FILE="/etc/alarm/already_reported_bans.txt"
+BLOCKLIST_VERSION_FILE="/etc/alarm/blocklist_version"
 
 # Ensure the reported bans file exists
 touch "\$ALREADY_REPORTED_FILE"
 
-# Fetch the latest blocklist from Django API
-RESPONSE=\$(curl -s "\$BLOCKLIST_API")
-
-BLOCKLIST=\$(echo "\$RESPONSE" | jq -r '.blocked_ips[]')
-UNBLOCKLIST=\$(echo "\$RESPONSE" | jq -r '.unblocked_ips[]')
-
-if [[ -z "\$BLOCKLIST" ]]; then
-    echo "No blocked IPs received from API."
+# Fetch the blocklist changes since the last synced version from Django API
+SINCE=\$(cat "\$BLOCKLIST_VERSION_FILE" 2>/dev/null || echo 0)
+RESPONSE=\$(curl -s -w "\\n%{http_code}" "\$BLOCKLIST_API?since=\$SINCE")
+HTTP_CODE=\$(echo "\$RESPONSE" | tail -n 1)
+RESPONSE=\$(echo "\$RESPONSE" | sed '\$d')
+
+BLOCKLIST=""
+UNBLOCKLIST=""
+if [[ "\$HTTP_CODE" == "200" ]]; then
+    BLOCKLIST=\$(echo "\$RESPONSE" | jq -r '(.added // .blocked_ips)[]')
+    UNBLOCKLIST=\$(echo "\$RESPONSE" | jq -r '(.removed // .unblocked_ips)[]')
+elif [[ "\$HTTP_CODE" == "304" ]]; then
+    echo "Blocklist unchanged since version \$SINCE."
+else
+    echo "Failed to fetch blocklist. HTTP \$HTTP_CODE"
 fi
 
 # Sync Fail2Ban with the blocklist
@@ -243,6 +257,11 @@ for IP in \$UNBLOCKLIST; do
     fi
 done
 
+# Remember the synced version so the next run only fetches newer changes
+if [[ "\$HTTP_CODE" == "200" ]]; then
+    echo "\$RESPONSE" | jq -r '.version' > "\$BLOCKLIST_VERSION_FILE"
+fi
+
 # Get currently banned IPs from Fail2Ban
 CURRENT_BANS=\$(sudo fail2ban-client status "\$JAIL_NAME" | grep "Banned IP list" | cut -d ":" -f2 | tr -s " ")
 